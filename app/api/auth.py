@@ -2,10 +2,10 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from app.core.config import settings
-from app.core.security import verify_password, get_password_hash, create_access_token
+from app.core.security import verify_password_async, get_password_hash_async, create_access_token
 from app.models.models import Users, User_Pydantic
 from app.schemas.auth import Token, UserCreate
-from app.api.deps import get_current_admin_user, get_current_active_user
+from app.api.deps import get_current_admin_user, get_current_active_user, user_cache
 from typing import List
 
 router = APIRouter()
@@ -14,7 +14,7 @@ router = APIRouter()
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """用户登录"""
     user = await Users.get_or_none(username=form_data.username)
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
@@ -52,7 +52,7 @@ async def create_user(user_in: UserCreate, current_user: Users = Depends(get_cur
         )
     user = await Users.create(
         username=user_in.username,
-        password_hash=get_password_hash(user_in.password),
+        password_hash=await get_password_hash_async(user_in.password),
         full_name=user_in.full_name,
         is_admin=user_in.is_admin
     )
@@ -75,12 +75,17 @@ async def update_user(
         if existing_user:
             raise HTTPException(status_code=400, detail="用户名已存在")
     
+    old_username = user.username
     user.username = user_in.username
     user.full_name = user_in.full_name
     user.is_admin = user_in.is_admin
     if user_in.password:
-        user.password_hash = get_password_hash(user_in.password)
+        user.password_hash = await get_password_hash_async(user_in.password)
     await user.save()
+    
+    # 清除缓存（用户名可能已变更）
+    user_cache.invalidate(old_username)
+    user_cache.invalidate(user.username)
     return user
 
 @router.delete("/users/{user_id}")
@@ -96,6 +101,7 @@ async def delete_user(user_id: int, current_user: Users = Depends(get_current_ad
     
     user.is_active = False
     await user.save()
+    user_cache.invalidate(user.username)
     return {"message": "用户已删除"}
 
 @router.put("/users/{user_id}/password")
@@ -114,11 +120,12 @@ async def change_password(
         raise HTTPException(status_code=404, detail="用户不存在")
     
     # 验证原密码
-    if not verify_password(password_data["old_password"], user.password_hash):
+    if not await verify_password_async(password_data["old_password"], user.password_hash):
         raise HTTPException(status_code=400, detail="原密码错误")
     
     # 更新密码
-    user.password_hash = get_password_hash(password_data["new_password"])
+    user.password_hash = await get_password_hash_async(password_data["new_password"])
     await user.save()
+    user_cache.invalidate(user.username)
     
     return {"message": "密码修改成功"} 
\ No newline at end of file
@@ -1,11 +1,35 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from app.core.cache import PeriodicValue, TTLCache
 from app.core.config import settings
+from app.core.database import get_read_db
 from app.models.models import Users
 from app.schemas.auth import TokenData
+from app.services.sync import USERS, get_change_marker
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
+
+# 按用户名缓存已启用用户的字段值，每次请求由此构造新的 Users 对象，并发请求之间不共享实例。
+# 缓存项记录加载时用户表的变更计数，任一 worker 修改或删除用户后计数变化，所有进程的缓存随之失效；
+# 计数每 USER_CACHE_CHECK_INTERVAL 秒读取一次，命中缓存的请求不查询数据库。
+# 本进程修改用户后调用 user_cache.invalidate 立即释放
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+users_marker = PeriodicValue(lambda: get_change_marker(get_read_db(), USERS), settings.USER_CACHE_CHECK_INTERVAL)
+
+async def get_user_by_username(username: str) -> Optional[Users]:
+    """优先从缓存获取用户，未命中或用户表已变化时查询数据库"""
+    # 在查询用户之前读取计数，期间的修改会使计数刷新后重新加载
+    marker = await users_marker.get()
+    values = user_cache.get(username, marker)
+    if values is not None:
+        return Users._init_from_db(**values)
+    user = await Users.get_or_none(username=username)
+    if user is not None and user.is_active:
+        user_cache.set(username, {field: user.__dict__[field] for field in Users._meta.fields_db_projection}, marker)
+    return user
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Users:
     credentials_exception = HTTPException(
@@ -22,7 +46,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Users:
     except JWTError:
         raise credentials_exception
     
-    user = await Users.get_or_none(username=token_data.username)
+    user = await get_user_by_username(token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -35,4 +59,12 @@ async def get_current_active_user(current_user: Users = Depends(get_current_user
 async def get_current_admin_user(current_user: Users = Depends(get_current_active_user)) -> Users:
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="权限不足")
-    return current_user 
\ No newline at end of file
+    return current_user
+
+async def get_event_stream_user(
+    token: Optional[str] = Query(None),
+    header_token: Optional[str] = Depends(optional_oauth2_scheme)
+) -> Users:
+    """事件流认证：浏览器 EventSource 无法设置请求头，允许通过 token 查询参数传递 JWT"""
+    current_user = await get_current_user(token or header_token or "")
+    return await get_current_active_user(current_user)
@@ -0,0 +1,15 @@
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
+from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE
+from app.services.metrics import metrics_publisher
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus 格式的运行指标，多 worker 时为各进程合计"""
+    if settings.METRICS_TOKEN and authorization != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="无效的指标访问令牌")
+    return Response(await metrics_publisher.render(), media_type=CONTENT_TYPE)
@@ -1,11 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.api.deps import get_current_active_user
-from app.models.models import Users, SystemSettings, ProblemType, SolutionType, WorkOrders
-from app.schemas.settings import SystemSettingsUpdate
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse, Response
+from app.api.deps import get_current_active_user, user_cache
+from app.core.cache import REVALIDATE_CACHE_CONTROL, etag_matches
+from app.core.config import settings as app_settings
+from app.core.profiling import slow_queries, slow_requests
+from tortoise.functions import Count
+from app.models.models import Users, SystemSettings, ProblemType, SolutionType, WorkOrders, DispatchAgent
+from app.schemas.settings import DispatchAgentUpdate, SystemSettingsUpdate
+from app.services.dispatch import dispatch_leader, dispatcher
+from app.services.reference_data import NameListCache, problem_type_cache, solution_type_cache
+from typing import List, Optional
 
 router = APIRouter()
 
+async def name_list_response(cache: NameListCache, if_none_match: Optional[str]) -> Response:
+    """返回名称列表，内容未变化时返回 304"""
+    snapshot = await cache.get()
+    headers = {"ETag": snapshot.etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if etag_matches(if_none_match, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse([{"name": name} for name in snapshot.names], headers=headers)
+
 @router.get("/system")
 async def get_system_settings(
     current_user: Users = Depends(get_current_active_user)
@@ -29,13 +44,104 @@ async def update_system_settings(
     await SystemSettings.update_settings(settings.archive_hours)
     return {"message": "更新成功"}
 
+@router.get("/cache-stats")
+async def get_cache_stats(
+    current_user: Users = Depends(get_current_active_user)
+):
+    """获取缓存命中统计"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    
+    return {
+        "users": user_cache.stats(),
+        "problem_types": problem_type_cache.stats(),
+        "solution_types": solution_type_cache.stats()
+    }
+
+@router.get("/profiling")
+async def get_profiling(
+    limit: int = 50,
+    current_user: Users = Depends(get_current_active_user)
+):
+    """获取本进程最近的慢查询和慢请求（需开启 PROFILING_ENABLED），按时间倒序"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    
+    return {
+        "enabled": app_settings.PROFILING_ENABLED,
+        "slow_query_ms": app_settings.SLOW_QUERY_MS,
+        "slow_request_ms": app_settings.SLOW_REQUEST_MS,
+        "slow_queries": list(slow_queries)[::-1][:limit],
+        "slow_requests": list(slow_requests)[::-1][:limit]
+    }
+
+@router.get("/dispatch")
+async def get_dispatch_settings(
+    current_user: Users = Depends(get_current_active_user)
+):
+    """获取自动派单的配置、正在派单的 worker、待分配工单数和各坐席处理中的工单数"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    
+    agents = await DispatchAgent.all().prefetch_related("user").order_by("user_id")
+    loads = dict(
+        await WorkOrders.filter(status=1, assigned_to_id__in=[agent.user_id for agent in agents])
+        .annotate(count=Count("id")).group_by("assigned_to_id").values_list("assigned_to_id", "count")
+    )
+    return {
+        "enabled": app_settings.AUTO_DISPATCH_ENABLED,
+        # 持有派单租约的 worker，为空表示当前没有进程在派单
+        "leader": await dispatch_leader.current_holder(),
+        "policy": app_settings.AUTO_DISPATCH_POLICY,
+        "max_load": app_settings.AUTO_DISPATCH_MAX_LOAD,
+        "pending": await WorkOrders.filter(status=0, assigned_to_id__isnull=True).count(),
+        "agents": [
+            {
+                "user_id": agent.user_id,
+                "username": agent.user.username,
+                "full_name": agent.user.full_name,
+                "is_active": agent.user.is_active,
+                "enabled": agent.enabled,
+                "max_load": agent.max_load,
+                "skills": agent.skills,
+                "load": loads.get(agent.user_id, 0)
+            }
+            for agent in agents
+        ]
+    }
+
+@router.put("/dispatch/agents/{user_id}")
+async def update_dispatch_agent(
+    user_id: int,
+    agent_data: DispatchAgentUpdate,
+    current_user: Users = Depends(get_current_active_user)
+):
+    """设置用户是否参与自动派单、工单上限和擅长的问题类型"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    
+    if not await Users.exists(id=user_id):
+        raise HTTPException(status_code=404, detail="用户不存在")
+    for name in agent_data.skills:
+        if not await problem_type_cache.contains(name):
+            raise HTTPException(status_code=400, detail=f"问题类型不存在：{name}")
+    
+    agent = await DispatchAgent.get_or_none(user_id=user_id) or DispatchAgent(user_id=user_id)
+    agent.enabled = agent_data.enabled
+    agent.max_load = agent_data.max_load
+    agent.skills = agent_data.skills
+    await agent.save()
+    # 本进程是派单主节点时立即生效，否则由主节点在下次重建状态时读取
+    dispatcher.invalidate()
+    return {"message": "更新成功"}
+
 @router.get("/problem-types")
 async def get_problem_types(
+    if_none_match: Optional[str] = Header(None),
     current_user: Users = Depends(get_current_active_user)
 ):
     """获取所有问题类型"""
-    types = await ProblemType.all()
-    return [{"name": t.name} for t in types]
+    return await name_list_response(problem_type_cache, if_none_match)
 
 @router.post("/problem-types")
 async def create_problem_type(
@@ -57,6 +163,7 @@ async def create_problem_type(
     
     # 创建新类型
     await ProblemType.create(name=name)
+    problem_type_cache.bump()
     return {"message": "创建成功"}
 
 @router.delete("/problem-types/{name}")
@@ -75,15 +182,16 @@ async def delete_problem_type(
     
     # 删除类型
     await problem_type.delete()
+    problem_type_cache.bump()
     return {"message": "删除成功"}
 
 @router.get("/solution-types")
 async def get_solution_types(
+    if_none_match: Optional[str] = Header(None),
     current_user: Users = Depends(get_current_active_user)
 ):
     """获取所有解决方案类型"""
-    types = await SolutionType.all()
-    return [{"name": t.name} for t in types]
+    return await name_list_response(solution_type_cache, if_none_match)
 
 @router.post("/solution-types")
 async def create_solution_type(
@@ -105,6 +213,7 @@ async def create_solution_type(
     
     # 创建新类型
     await SolutionType.create(name=name)
+    solution_type_cache.bump()
     return {"message": "创建成功"}
 
 @router.delete("/solution-types/{name}")
@@ -123,4 +232,5 @@ async def delete_solution_type(
     
     # 删除类型
     await solution_type.delete()
+    solution_type_cache.bump()
     return {"message": "删除成功"} 
\ No newline at end of file
@@ -1,19 +1,49 @@
-from typing import List, Optional, Union, Any
-from fastapi import APIRouter, Depends, HTTPException, Header
-from app.api.deps import get_current_active_user
-from app.models.models import Users, WorkOrders, SystemSettings, ProblemType, SolutionType
+import base64
+from collections import Counter
+from urllib.parse import quote
+from typing import List, Optional, Union, Any, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from app.api.deps import get_current_active_user, get_event_stream_user, get_user_by_username
+from app.models.models import (
+    Users, UserChange, WorkOrders, WorkOrdersArchive, WorkOrderLogs, WorkOrderDailyStats, ProblemType, OrderSequence,
+    build_model, storage_datetime
+)
 from app.schemas.work_order import (
     WorkOrderCreate,
     WorkOrderUpdate,
     WorkOrderAssign,
-    WorkOrderInDB
+    WorkOrderInDB,
+    WorkOrderPage,
+    WorkOrderDelta,
+    WorkOrderBatchCreate,
+    WorkOrderBatchItemResult,
+    WorkOrderBatchResult,
+    WorkOrderLogPage
 )
 from app.services.work_order import WorkOrderService
-from datetime import datetime, timedelta
+from app.services.export import stream_csv, stream_xlsx
+from app.services.dispatch import dispatcher
+from app.services.events import event_broker, order_payload
+from app.services.search import count_work_order_matches, index_work_orders, search_work_order_ids
+from app.services.statistics import count_buckets
+from app.services.analytics import resolution_analytics
+from app.services.serialization import FastJSONResponse, order_encoder, work_order_encoder, work_order_page_response
+from app.services.archive_store import get_order, order_querysets, restore_archived_order
+from app.services.reference_data import problem_type_cache, solution_type_cache
+from app.services.metrics import WORK_ORDERS_CREATED
+from app.services.sync import SYNC_MAX_CHANGES, get_change_marker, list_etag, next_sync_time, parse_since
+from app.tasks.archive import archive_completed_orders
+from datetime import datetime
 from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
 from tortoise.transactions import in_transaction
 from jose import jwt, JWTError
+from app.core.cache import REVALIDATE_CACHE_CONTROL, etag_matches
 from app.core.config import settings
+from app.core.database import get_read_db
 
 router = APIRouter()
 
@@ -88,7 +118,7 @@ async def get_current_user_or_token(
                 headers={"WWW-Authenticate": "Bearer"},
             )
             
-        user = await Users.get_or_none(username=username)
+        user = await get_user_by_username(username)
         if user is None:
             raise HTTPException(status_code=401, detail="用户不存在")
         if not user.is_active:
@@ -103,23 +133,59 @@ async def get_current_user_or_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def order_no_prefix() -> str:
+    """当天的工单编号前缀"""
+    return f"SZIT-{datetime.now().strftime('%Y%m%d')}-"
+
+def format_order_no(prefix: str, number: int) -> str:
+    return f"{prefix}{str(number).zfill(3)}"
+
 async def generate_order_no():
-    today = datetime.now()
-    date_str = today.strftime("%Y%m%d")
-    base_no = f"SZIT-{date_str}-"
+    base_no = order_no_prefix()
     
-    # 获取今天的最后一个工单编号
-    last_order = await WorkOrders.filter(
-        order_no__startswith=f"SZIT-{date_str}"
-    ).order_by("-order_no").first()
-    
-    if last_order:
-        last_number = int(last_order.order_no.split("-")[-1])
-        new_number = str(last_number + 1).zfill(3)
-    else:
-        new_number = "001"
+    # 从当天的编号序列中原子地取下一个序号（超过999时自动扩展位数）
+    numbers = await OrderSequence.allocate(base_no)
     
-    return f"{base_no}{new_number}"
+    return format_order_no(base_no, numbers[0])
+
+def encode_cursor(order: Union[WorkOrders, WorkOrdersArchive, WorkOrderLogs]) -> str:
+    """把 (created_at, id) 编码为不透明的分页游标"""
+    return encode_cursor_values(order.created_at, order.id)
+
+def encode_cursor_values(created_at: datetime, order_id: int) -> str:
+    # 数据库中保存的是不带时区的本地时间，游标需与之保持一致才能正确比较
+    raw = f"{storage_datetime(created_at).isoformat()}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析分页游标"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, order_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="分页游标无效")
+
+def encode_search_cursor(offset: int) -> str:
+    """全文检索结果按相关度排序，游标记录偏移量"""
+    return base64.urlsafe_b64encode(f"search|{offset}".encode()).decode()
+
+def decode_search_cursor(cursor: str) -> int:
+    """解析全文检索的分页游标"""
+    try:
+        kind, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        if kind != "search":
+            raise ValueError(kind)
+        return max(int(offset), 0)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="分页游标无效")
+
+def after_cursor(query: QuerySet, created_at: datetime, order_id: int) -> QuerySet:
+    """只保留按 (created_at, id) 倒序排在游标之后的工单"""
+    return query.filter(
+        Q(created_at__lt=created_at) |
+        Q(created_at=created_at, id__lt=order_id)
+    )
 
 @router.post("", response_model=WorkOrderInDB)
 @router.post("/", response_model=WorkOrderInDB)
@@ -128,26 +194,32 @@ async def create_work_order(
     token: str = Depends(verify_token)
 ):
     """创建工单 - 仅支持API Token认证"""
+    if work_order.problem_type and not await problem_type_cache.contains(work_order.problem_type):
+        raise HTTPException(status_code=400, detail="选择的问题类型不存在")
+
     # 生成工单编号
     order_no = await generate_order_no()
     
     try:
-        new_order = await WorkOrders.create(
-            order_no=order_no,
-            reporter_name=work_order.reporter_name,
-            contact_phone=work_order.contact_phone,
-            location=work_order.location,
-            problem_desc=work_order.problem_desc,
-            status=0,  # 新建状态
-            assigned_to=None,  # 明确设置为None
-            problem_type=None,
-            processing_desc=None,
-            solution_type=None
-        )
-        
-        # 重新获取工单以包含所有关联数据
-        created_order = await WorkOrders.get(id=new_order.id).prefetch_related("assigned_to")
-        return created_order
+        # 工单与创建日志在同一事务内写入
+        async with in_transaction("default") as connection:
+            new_order = await WorkOrders.create(
+                using_db=connection,
+                order_no=order_no,
+                reporter_name=work_order.reporter_name,
+                contact_phone=work_order.contact_phone,
+                location=work_order.location,
+                problem_desc=work_order.problem_desc,
+                status=0,  # 新建状态
+                assigned_to=None,  # 明确设置为None
+                problem_type=work_order.problem_type,
+                processing_desc=None,
+                solution_type=None
+            )
+        WORK_ORDERS_CREATED.inc("api")
+        event_broker.publish("created", {"order": order_payload(new_order, full=True)})
+        dispatcher.notify()
+        return new_order
         
     except Exception as e:
         raise HTTPException(
@@ -155,6 +227,120 @@ async def create_work_order(
             detail=f"创建工单失败: {str(e)}"
         )
 
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+@router.post("/batch", response_model=WorkOrderBatchResult)
+async def create_work_orders_batch(
+    batch: WorkOrderBatchCreate,
+    token: str = Depends(verify_token)
+):
+    """
+    批量创建工单 - 仅支持API Token认证
+
+    一次分配全部工单编号并在一个事务内批量插入；
+    单条数据校验失败只影响该条，结果按请求顺序逐条返回
+    """
+    if len(batch.items) > settings.WORK_ORDER_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多提交 {settings.WORK_ORDER_BATCH_SIZE} 个工单"
+        )
+
+    results: List[Optional[WorkOrderBatchItemResult]] = [None] * len(batch.items)
+    valid_items = []
+    for index, item in enumerate(batch.items):
+        try:
+            work_order = WorkOrderCreate.model_validate(item)
+        except ValidationError as e:
+            results[index] = WorkOrderBatchItemResult(
+                index=index,
+                success=False,
+                error=format_validation_error(e)
+            )
+            continue
+        if work_order.problem_type and not await problem_type_cache.contains(work_order.problem_type):
+            results[index] = WorkOrderBatchItemResult(
+                index=index,
+                success=False,
+                error="problem_type: 问题类型不存在"
+            )
+            continue
+        valid_items.append((index, work_order))
+
+    orders = []
+    if valid_items:
+        prefix = order_no_prefix()
+        try:
+            async with in_transaction("default") as connection:
+                # 编号分配与插入在同一事务内，插入失败时编号一并回滚
+                numbers = await OrderSequence.allocate(prefix, len(valid_items))
+                current_time = datetime.now()
+                orders = []
+                for number, (_, work_order) in zip(numbers, valid_items):
+                    # 批量插入不经过 save()，需显式设置时间
+                    orders.append(build_model(
+                        WorkOrders,
+                        order_no=format_order_no(prefix, number),
+                        **work_order.model_dump(),
+                        status=0,  # 新建状态
+                        assigned_to=None,
+                        processing_desc=None,
+                        solution_type=None,
+                        created_at=current_time,
+                        modified_at=current_time
+                    ))
+                await WorkOrders.bulk_create(orders, using_db=connection)
+
+                # SQLite 批量插入不回填主键，按工单编号取回
+                ids = dict(await WorkOrders.filter(
+                    order_no__in=[order.order_no for order in orders]
+                ).using_db(connection).values_list("order_no", "id"))
+                for order in orders:
+                    order.id = ids[order.order_no]
+
+                await index_work_orders(orders, connection)
+                await WorkOrderLogs.bulk_create([
+                    WorkOrderLogs.build(
+                        current_time,
+                        work_order_id=order.id,
+                        action="created",
+                        status_to=0
+                    )
+                    for order in orders
+                ], using_db=connection)
+                await WorkOrderDailyStats.adjust(
+                    Counter(WorkOrderDailyStats.key(order.__dict__) for order in orders),
+                    connection
+                )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"批量创建工单失败: {str(e)}"
+            )
+
+        WORK_ORDERS_CREATED.inc("batch", amount=len(orders))
+        # 批量事件只携带 ID，避免一次性压满客户端的事件队列
+        event_broker.publish("created_batch", {"ids": [order.id for order in orders]})
+        dispatcher.notify()
+
+    for (index, _), order in zip(valid_items, orders):
+        results[index] = WorkOrderBatchItemResult(
+            index=index,
+            success=True,
+            id=order.id,
+            order_no=order.order_no
+        )
+
+    return WorkOrderBatchResult(
+        created=len(orders),
+        failed=len(batch.items) - len(orders),
+        results=results
+    )
+
 @router.put("/{work_order_id}/assign", response_model=WorkOrderInDB)
 async def assign_work_order(
     work_order_id: int,
@@ -162,7 +348,7 @@ async def assign_work_order(
 ):
     """分配工单"""
     try:
-        async with in_transaction() as connection:
+        async with in_transaction("default") as connection:
             # 使用 SELECT FOR UPDATE 锁定工单记录
             order = await WorkOrders.filter(id=work_order_id).select_for_update().first()
             if not order:
@@ -178,11 +364,13 @@ async def assign_work_order(
             order.assigned_to = current_user
             order.assigned_time = datetime.now()  # 使用系统本地时间
             order.status = 1  # 处理中
-            await order.save()
-            
-            # 重新获取更新后的工单，包括所有关联数据
-            updated_order = await WorkOrders.get(id=work_order_id).prefetch_related("assigned_to")
-            return updated_order
+            await order.save(operator=current_user)
+        
+        # 事务提交后再推送，避免客户端读到未提交的状态
+        event_broker.publish("updated", {"order": order_payload(order)})
+        
+        # assigned_to 已是当前用户，无需重新查询
+        return order
             
     except Exception as e:
         raise HTTPException(
@@ -199,6 +387,12 @@ async def update_work_order(
     """更新工单"""
     try:
         order = await WorkOrders.get_or_none(id=work_order_id).prefetch_related("assigned_to")
+        if not order and await WorkOrdersArchive.exists(id=work_order_id):
+            if not current_user.is_admin:
+                raise HTTPException(status_code=403, detail="归档工单仅管理员可操作")
+            # 已移到归档表的工单先移回在用表，修改后由归档任务再次移出
+            await restore_archived_order(work_order_id)
+            order = await WorkOrders.get_or_none(id=work_order_id).prefetch_related("assigned_to")
         if not order:
             raise HTTPException(status_code=404, detail="工单不存在")
         
@@ -215,14 +409,12 @@ async def update_work_order(
         
         # 如果更新了问题类型，检查问题类型是否存在
         if "problem_type" in update_data:
-            problem_type = await ProblemType.get_or_none(name=update_data["problem_type"])
-            if not problem_type:
+            if not await problem_type_cache.contains(update_data["problem_type"]):
                 raise HTTPException(status_code=400, detail="选择的问题类型不存在")
         
         # 如果更新了解决方案类型，检查解决方案类型是否存在
         if "solution_type" in update_data:
-            solution_type = await SolutionType.get_or_none(name=update_data["solution_type"])
-            if not solution_type:
+            if not await solution_type_cache.contains(update_data["solution_type"]):
                 raise HTTPException(status_code=400, detail="选择的解决方案类型不存在")
         
         # 如果设置了状态为已完成(2)，检查必填字段
@@ -243,11 +435,13 @@ async def update_work_order(
             for field, value in update_data.items():
                 setattr(order, field, value)
         
-        await order.save()
+        # 工单与变更日志在同一事务内写入
+        async with in_transaction("default"):
+            await order.save(operator=current_user)
+        event_broker.publish("updated", {"order": order_payload(order)})
         
-        # 重新获取工单以包含最新的关联数据
-        updated_order = await WorkOrders.get(id=work_order_id).prefetch_related("assigned_to")
-        return updated_order
+        # 关联数据已在查询时预取，直接返回
+        return order
         
     except Exception as e:
         raise HTTPException(
@@ -264,16 +458,17 @@ async def delete_work_order(
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="仅管理员可以删除工单")
     
-    order = await WorkOrders.get_or_none(id=work_order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="工单不存在")
-    
-    await order.delete()
+    async with in_transaction("default") as connection:
+        # 已归档的工单先移回在用表，沿用在用表的统计、索引和日志处理
+        await restore_archived_order(work_order_id, connection)
+        order = await WorkOrders.get_or_none(id=work_order_id)
+        if not order:
+            raise HTTPException(status_code=404, detail="工单不存在")
+        await order.delete(using_db=connection, operator=current_user)
+    event_broker.publish("deleted", {"id": work_order_id})
     return {"message": "工单已删除"}
 
-@router.get("/", response_model=List[WorkOrderInDB])
-@router.get("", response_model=List[WorkOrderInDB])
-async def get_work_orders(
+async def work_order_list_queries(
     status: Optional[int] = None,
     assigned_to: Optional[int] = None,
     problem_type: Optional[str] = None,
@@ -282,55 +477,247 @@ async def get_work_orders(
     contact_phone: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    status_lt: Optional[int] = None,
-    current_user: Users = Depends(get_current_active_user)
-):
-    """获取工单列表"""
-    query = WorkOrders.all()
+    status_lt: Optional[int] = None
+) -> List[QuerySet]:
+    """
+    按工单列表的查询条件构造查询（列表与导出共用）
+
+    筛选条件可能包含已归档工单时同时返回在用表和归档表的查询，待处理的列表（status_lt=3）只查询在用表
+    """
+    filters = []
     
     # 状态过滤
     if status is not None:
-        query = query.filter(status=status)
+        filters.append(Q(status=status))
     elif status_lt is not None:
-        query = query.filter(status__lt=status_lt)
+        filters.append(Q(status__lt=status_lt))
     
     # 签收人过滤
     if assigned_to is not None:
-        query = query.filter(assigned_to_id=assigned_to)
+        filters.append(Q(assigned_to_id=assigned_to))
     
     # 问题类型过滤
     if problem_type:
-        query = query.filter(problem_type=problem_type)
+        filters.append(Q(problem_type=problem_type))
     
     # 工单编号模糊查询
     if order_no:
-        query = query.filter(order_no__icontains=order_no)
+        filters.append(Q(order_no__icontains=order_no))
 
     # 报障人模糊查询
     if reporter_name:
-        query = query.filter(reporter_name__icontains=reporter_name)
+        filters.append(Q(reporter_name__icontains=reporter_name))
 
     # 联系电话模糊查询
     if contact_phone:
-        query = query.filter(contact_phone__icontains=contact_phone)
+        filters.append(Q(contact_phone__icontains=contact_phone))
     
     # 创建时间范围查询
     try:
         if start_date:
             start_datetime = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
-            query = query.filter(created_at__gte=start_datetime)
+            filters.append(Q(created_at__gte=start_datetime))
         if end_date:
             end_datetime = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
-            query = query.filter(created_at__lte=end_datetime)
+            filters.append(Q(created_at__lte=end_datetime))
     except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=f"日期格式错误: {str(e)}"
         )
     
-    # 获取工单列表
-    work_orders = await query.order_by("-created_at").prefetch_related("assigned_to")
-    return work_orders
+    # 列表查询走只读连接，不阻塞写入
+    return order_querysets(filters, get_read_db(), status, status_lt)
+
+def search_candidates(queries: List[QuerySet]) -> List[str]:
+    """各表满足过滤条件的工单 id 子查询，用于全文检索"""
+    return [query.values_list("id", flat=True).sql() for query in queries]
+
+async def search_work_orders_page(
+    queries: List[QuerySet],
+    q: str,
+    limit: int,
+    cursor: Optional[str],
+    with_total: bool
+) -> dict:
+    """全文检索模式：在其他查询条件的基础上按相关度排序分页"""
+    db = get_read_db()
+    # 其他过滤条件作为子查询与全文检索在同一条 SQL 中取交集，按相关度只取一页（多取一条判断是否还有下一页）
+    candidates = search_candidates(queries)
+    offset = decode_search_cursor(cursor) if cursor else 0
+    page_ids = await search_work_order_ids(q, db, candidates, limit=limit + 1, offset=offset)
+    next_cursor = encode_search_cursor(offset + limit) if len(page_ids) > limit else None
+    page_ids = page_ids[:limit]
+    rank = {order_id: index for index, order_id in enumerate(page_ids)}
+    total = await count_work_order_matches(q, db, candidates) if with_total else None
+
+    if settings.FAST_JSON_RESPONSES:
+        rows = []
+        for query in queries:
+            rows.extend(await order_encoder(query).fetch(query.filter(id__in=page_ids)))
+        rows.sort(key=lambda row: rank[row["id"]])
+        return work_order_page_response(rows, next_cursor, total)
+
+    work_orders = []
+    for query in queries:
+        work_orders.extend(await query.filter(id__in=page_ids).prefetch_related("assigned_to"))
+    work_orders.sort(key=lambda order: rank[order.id])
+
+    return {
+        "items": work_orders,
+        "next_cursor": next_cursor,
+        "total": total
+    }
+
+async def work_order_delta(queries: List[QuerySet], q: Optional[str], since: datetime, started: datetime) -> Response:
+    """增量同步模式：返回自 since 以来新建、修改和删除的工单"""
+    db = get_read_db()
+    # 变化的工单不论是否满足筛选条件都需要返回，客户端据此移除不再满足条件的行（如刚归档移到归档表的工单）
+    changed_ids = set()
+    for model in (WorkOrders, WorkOrdersArchive):
+        changed_ids.update(
+            await model.filter(modified_at__gte=since).using_db(db)
+            .order_by("modified_at").limit(SYNC_MAX_CHANGES + 1).values_list("id", flat=True)
+        )
+    # 签收人改名不修改工单的修改时间，补充其签收的工单；签收人被删除时其工单可能随之删除且没有删除记录，需重新加载
+    changed_users = await UserChange.filter(changed_at__gte=since).using_db(db).values_list("user_id", flat=True)
+    users_deleted = bool(changed_users) and await Users.filter(id__in=changed_users).using_db(db).count() < len(changed_users)
+    if changed_users and not users_deleted:
+        for model in (WorkOrders, WorkOrdersArchive):
+            changed_ids.update(
+                await model.filter(assigned_to_id__in=changed_users).using_db(db)
+                .limit(SYNC_MAX_CHANGES + 1).values_list("id", flat=True)
+            )
+    deleted_ids = await WorkOrderLogs.filter(action="deleted", created_at__gte=since).using_db(db) \
+        .limit(SYNC_MAX_CHANGES + 1).values_list("work_order_id", flat=True)
+    sync_time = next_sync_time(started)
+    if users_deleted or len(changed_ids) + len(deleted_ids) > SYNC_MAX_CHANGES:
+        return FastJSONResponse({"items": [], "removed": [], "deleted": [], "sync_time": sync_time, "reset": True})
+
+    queries = [query.filter(id__in=changed_ids) for query in queries]
+    if q:
+        # 只在变化的工单中检索
+        search_ids = await search_work_order_ids(q, db, search_candidates(queries))
+        queries = [query.filter(id__in=search_ids) for query in queries]
+    deleted = sorted(set(deleted_ids))
+
+    if settings.FAST_JSON_RESPONSES:
+        rows = []
+        for query in queries:
+            rows.extend(await order_encoder(query).fetch(query))
+        rows.sort(key=lambda row: row["id"])
+        matched = {row["id"] for row in rows}
+        return FastJSONResponse({
+            "items": work_order_encoder.to_dicts(rows),
+            "removed": sorted(changed_ids - matched),
+            "deleted": deleted,
+            "sync_time": sync_time,
+            "reset": False,
+        })
+
+    work_orders = []
+    for query in queries:
+        work_orders.extend(await query.prefetch_related("assigned_to"))
+    work_orders.sort(key=lambda order: order.id)
+    matched = {order.id for order in work_orders}
+    delta = WorkOrderDelta(
+        items=[WorkOrderInDB.model_validate(order) for order in work_orders],
+        removed=sorted(changed_ids - matched),
+        deleted=deleted,
+        sync_time=sync_time
+    )
+    return JSONResponse(jsonable_encoder(delta))
+
+async def work_order_page(
+    queries: List[QuerySet],
+    q: Optional[str],
+    limit: int,
+    cursor: Optional[str],
+    with_total: bool
+) -> Union[dict, Response]:
+    """按 created_at, id 倒序的游标分页；传入 q 时按相关度排序"""
+    if q:
+        return await search_work_orders_page(queries, q, limit, cursor, with_total)
+
+    # 总数单独统计，且只在需要时计算
+    total = sum([await query.count() for query in queries]) if with_total else None
+
+    # 游标分页：从上一页最后一条之后继续读取，深分页与首页代价相同
+    if cursor:
+        queries = [after_cursor(query, *decode_cursor(cursor)) for query in queries]
+
+    # 包含归档表时从每张表各取一页，合并后再截取
+    queries = [query.order_by("-created_at", "-id").limit(limit + 1) for query in queries]
+
+    if settings.FAST_JSON_RESPONSES:
+        # 快速路径：一条 LEFT JOIN 查询投影出所需的列，直接编码为与 WorkOrderPage 相同的 JSON
+        rows = []
+        for query in queries:
+            rows.extend(await order_encoder(query).fetch(query))
+        if len(queries) > 1:
+            rows.sort(key=lambda row: (work_order_encoder.raw_datetime(row, "created_at"), row["id"]), reverse=True)
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor_values(work_order_encoder.raw_datetime(last, "created_at"), last["id"])
+        return work_order_page_response(rows[:limit], next_cursor, total)
+
+    # 多取一条用于判断是否还有下一页
+    work_orders = []
+    for query in queries:
+        work_orders.extend(await query.prefetch_related("assigned_to"))
+    if len(queries) > 1:
+        work_orders.sort(key=lambda order: (order.created_at, order.id), reverse=True)
+    next_cursor = encode_cursor(work_orders[limit - 1]) if len(work_orders) > limit else None
+
+    return {
+        "items": work_orders[:limit],
+        "next_cursor": next_cursor,
+        "total": total
+    }
+
+@router.get("/", response_model=WorkOrderPage)
+@router.get("", response_model=WorkOrderPage)
+async def get_work_orders(
+    request: Request,
+    response: Response,
+    queries: List[QuerySet] = Depends(work_order_list_queries),
+    q: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    modified_since: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Users = Depends(get_current_active_user)
+):
+    """
+    获取工单列表（按 created_at, id 倒序的游标分页；传入 q 时按相关度排序）
+
+    传入 modified_since 时改为增量同步，返回 WorkOrderDelta。
+    响应带有由工单变更计数和查询参数生成的 ETag，工单没有任何变化时对匹配的 If-None-Match 返回 304
+    """
+    started = datetime.now()
+    since = None
+    if modified_since:
+        try:
+            since = parse_since(modified_since)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"日期格式错误: {str(e)}")
+
+    # 先读取变更计数再查询：查询期间发生的变化会使下次请求的 ETag 不同
+    headers = {"Cache-Control": REVALIDATE_CACHE_CONTROL}
+    marker = await get_change_marker(get_read_db())
+    if marker is not None:
+        headers["ETag"] = list_etag(marker, request.url.query)
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    if since is not None:
+        result = await work_order_delta(queries, q, since, started)
+    else:
+        result = await work_order_page(queries, q, limit, cursor, with_total)
+    (result if isinstance(result, Response) else response).headers.update(headers)
+    return result
 
 @router.get("/statistics")
 async def get_work_orders_statistics(
@@ -342,56 +729,48 @@ async def get_work_orders_statistics(
     assigned_to: Optional[int] = None,
     current_user: Users = Depends(get_current_active_user)
 ):
-    """获取工单统计信息"""
-    query = WorkOrders.all()
-    
-    # 应用过滤条件
-    if status is not None:
-        query = query.filter(status=status)
-    if problem_type:
-        query = query.filter(problem_type=problem_type)
-    if order_no:
-        query = query.filter(order_no__icontains=order_no)
-    if assigned_to is not None:
-        query = query.filter(assigned_to_id=assigned_to)
+    """获取工单统计信息（整天部分读取每日统计表，耗时与工单总量无关）"""
+    # 统计查询走只读连接，不阻塞写入
+    db = get_read_db()
     
     # 创建时间范围查询
     try:
-        if start_date:
-            start_datetime = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
-            query = query.filter(created_at__gte=start_datetime)
-        if end_date:
-            end_datetime = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
-            query = query.filter(created_at__lte=end_datetime)
+        start_datetime = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S") if start_date else None
+        end_datetime = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S") if end_date else None
     except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=f"日期格式错误: {str(e)}"
         )
     
-    # 获取总数
-    total = await query.count()
-    
-    # 获取各状态数量
-    status_counts = {
-        0: await query.filter(status=0).count(),
-        1: await query.filter(status=1).count(),
-        2: await query.filter(status=2).count(),
-        3: await query.filter(status=3).count()
-    }
+    # 状态 × 问题类型 的全部计数
+    buckets = await count_buckets(
+        db,
+        start=start_datetime,
+        end=end_datetime,
+        status=status,
+        problem_type=problem_type,
+        assigned_to=assigned_to,
+        order_no=order_no
+    )
     
     # 获取所有已定义的问题类型
-    problem_types = await ProblemType.all()
+    problem_types = await ProblemType.all().using_db(db).values_list("name", flat=True)
     
-    # 获取各类型数量
-    by_type = {}
-    # 先统计已定义类型的工单数量
-    for type_obj in problem_types:
-        count = await query.filter(problem_type=type_obj.name).count()
-        by_type[type_obj.name] = count
+    total = 0
+    status_counts = {0: 0, 1: 0, 2: 0, 3: 0}
+    by_type = {name: 0 for name in problem_types}
+    unclassified_count = 0
+    for (bucket_status, bucket_type), count in buckets.items():
+        total += count
+        if bucket_status in status_counts:
+            status_counts[bucket_status] += count
+        if not bucket_type:
+            unclassified_count += count
+        elif bucket_type in by_type:
+            by_type[bucket_type] += count
     
     # 统计未分类的工单数量
-    unclassified_count = await query.filter(Q(problem_type__isnull=True) | Q(problem_type="")).count()
     if unclassified_count > 0:
         by_type["未分类"] = unclassified_count
     
@@ -401,19 +780,114 @@ async def get_work_orders_statistics(
         "by_type": by_type
     }
 
-# 工单归档任务
-async def archive_old_orders():
-    # 获取系统设置中的归档时间
-    settings = await SystemSettings.get_settings()
-    archive_time = datetime.now() - timedelta(hours=settings.archive_hours)
+@router.get("/analytics")
+async def get_work_orders_analytics(
+    group_by: str = Query("none", pattern="^(none|problem_type|assignee|day)$"),
+    sla_assign_minutes: int = Query(settings.SLA_ASSIGN_MINUTES, ge=1),
+    sla_complete_hours: int = Query(settings.SLA_COMPLETE_HOURS, ge=1),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[int] = None,
+    problem_type: Optional[str] = None,
+    order_no: Optional[str] = None,
+    assigned_to: Optional[int] = None,
+    current_user: Users = Depends(get_current_active_user)
+):
+    """
+    处理时效分析：签收耗时（assigned_time - created_at）和完成耗时（completed_at - created_at）
+
+    过滤条件与统计接口相同，返回各分组的 p50/p90/p99、直方图和超时数量，时间单位为秒
+    """
+    try:
+        start_datetime = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S") if start_date else None
+        end_datetime = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S") if end_date else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"日期格式错误: {str(e)}"
+        )
+
+    # 分析查询走只读连接，不阻塞写入
+    db = get_read_db()
+    groups = await resolution_analytics(
+        db,
+        group_by=group_by,
+        sla_assign_seconds=sla_assign_minutes * 60,
+        sla_complete_seconds=sla_complete_hours * 3600,
+        start=start_datetime,
+        end=end_datetime,
+        status=status,
+        problem_type=problem_type,
+        assigned_to=assigned_to,
+        order_no=order_no
+    )
+
+    # 签收人分组附带姓名
+    if group_by == "assignee":
+        names = dict(await Users.filter(
+            id__in=[group["key"] for group in groups if group["key"]]
+        ).using_db(db).values_list("id", "full_name"))
+        for group in groups:
+            group["label"] = names.get(group["key"], "未签收")
+    else:
+        for group in groups:
+            group["label"] = group["key"] or ("全部" if group_by == "none" else "未分类")
+
+    return {
+        "group_by": group_by,
+        "sla": {
+            "assign": sla_assign_minutes * 60,
+            "complete": sla_complete_hours * 3600
+        },
+        "groups": groups
+    }
+
+@router.get("/export")
+async def export_work_orders(
+    queries: List[QuerySet] = Depends(work_order_list_queries),
+    q: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    current_user: Users = Depends(get_current_active_user)
+):
+    """导出工单（查询条件与工单列表相同），按批流式输出 CSV 或 XLSX"""
+    if q:
+        # 全部匹配的工单，不限数量
+        search_ids = await search_work_order_ids(q, get_read_db(), search_candidates(queries))
+        queries = [query.filter(id__in=search_ids) for query in queries]
+
+    file_name = quote(f"工单列表_{datetime.now().strftime('%Y%m%d%H%M%S')}.{format}")
+    if format == "xlsx":
+        content = stream_xlsx(queries)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        content = stream_csv(queries)
+        media_type = "text/csv"
     
-    await WorkOrders.filter(
-        status=2,  # 已完成状态
-        created_at__lt=archive_time,
-        archived_at__isnull=True
-    ).update(
-        status=3,  # 归档状态
-        archived_at=datetime.now()
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{file_name}"}
+    )
+
+@router.get("/events")
+async def work_order_events(
+    last_event_id: Optional[str] = Header(None),
+    current_user: Users = Depends(get_event_stream_user)
+):
+    """
+    工单变更事件流（Server-Sent Events）
+
+    事件类型：created（完整工单）、created_batch（批量创建的工单 ID 列表）、updated（变更字段）、
+    deleted、archived（工单 ID 列表）、reset（无法续传，客户端需重新加载列表）；断线重连时浏览器自动携带 Last-Event-ID 续传
+    """
+    return StreamingResponse(
+        event_broker.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭 nginx 代理缓冲，事件才能即时送达
+            "X-Accel-Buffering": "no"
+        }
     )
 
 @router.get("/{work_order_id}", response_model=WorkOrderInDB)
@@ -421,9 +895,9 @@ async def get_work_order(
     work_order_id: int,
     auth_user: Union[Users, str] = Depends(get_current_user_or_token)
 ):
-    """获取工单详情"""
+    """获取工单详情（已归档的工单从归档表读取）"""
     try:
-        order = await WorkOrders.get_or_none(id=work_order_id).prefetch_related("assigned_to")
+        order = await get_order(work_order_id)
         if not order:
             raise HTTPException(status_code=404, detail="工单不存在")
         return order
@@ -433,14 +907,28 @@ async def get_work_order(
             detail=f"获取工单详情失败: {str(e)}"
         )
 
-@router.get("/{work_order_id}/logs")
+@router.get("/{work_order_id}/logs", response_model=WorkOrderLogPage)
 async def get_work_order_logs(
     work_order_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user: Users = Depends(get_current_active_user)
 ):
-    """获取工单日志"""
-    # 由于目前没有日志表，先返回空列表
-    return []
+    """获取工单日志（按 created_at, id 正序的时间线，游标分页）"""
+    query = WorkOrderLogs.filter(work_order_id=work_order_id).using_db(get_read_db())
+    if cursor:
+        created_at, log_id = decode_cursor(cursor)
+        query = query.filter(
+            Q(created_at__gt=created_at) |
+            Q(created_at=created_at, id__gt=log_id)
+        )
+
+    # 多取一条用于判断是否还有下一页
+    logs = await query.order_by("created_at", "id").limit(limit + 1).prefetch_related("operator")
+    return {
+        "items": logs[:limit],
+        "next_cursor": encode_cursor(logs[limit - 1]) if len(logs) > limit else None
+    }
 
 @router.post("/archive")
 async def trigger_archive(
@@ -450,26 +938,8 @@ async def trigger_archive(
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="需要管理员权限")
     
-    # 获取系统设置中的归档时间
-    settings = await SystemSettings.get_settings()
-    archive_hours = settings.archive_hours
-    
-    # 计算需要归档的时间点
-    archive_time = datetime.now() - timedelta(hours=archive_hours)
-    
-    # 查找需要归档的工单（已完成且超过归档时间的工单）
-    orders = await WorkOrders.filter(
-        status=2,  # 已完成状态
-        modified_at__lt=archive_time,  # 最后修改时间早于归档时间
-        archived_at__isnull=True  # 尚未归档
-    )
-    
-    # 批量更新状态为已归档
-    archived_count = 0
-    for order in orders:
-        order.status = 3
-        order.archived_at = datetime.now()
-        await order.save()
-        archived_count += 1
-    
-    return {"message": f"成功归档 {archived_count} 个工单"} 
\ No newline at end of file
+    result = await archive_completed_orders()
+    return {
+        "message": f"成功归档 {result['archived']} 个工单",
+        **result
+    }
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+# 浏览器可以缓存，但每次使用前需用 If-None-Match 确认是否变化
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+class TTLCache:
+    """
+    带过期时间和容量上限的进程内缓存，超出容量时淘汰最久未使用的条目
+
+    写入时可附带数据版本（如数据库中的变更计数），读取时版本不同的条目视为已失效
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, version: Any = None) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at, item_version = item
+            if expires_at > time.monotonic() and item_version == version:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, version: Any = None) -> None:
+        self._data[key] = (value, time.monotonic() + self.ttl, version)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+class PeriodicValue:
+    """定期读取的值（如数据库中的变更计数），间隔内重复使用上次读取的结果，不必每次请求都查询"""
+
+    def __init__(self, load: Callable[[], Awaitable[Any]], interval: float):
+        self.load = load
+        self.interval = interval
+        self._value: Any = None
+        self._loaded_at: Optional[float] = None
+
+    async def get(self) -> Any:
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.interval:
+            self._value = await self.load()
+            self._loaded_at = now
+        return self._value
+
+    def clear(self) -> None:
+        self._loaded_at = None
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含 etag（按弱比较，忽略 W/ 前缀）"""
+    if not if_none_match:
+        return False
+    def strip_weak(value: str) -> str:
+        return value[2:] if value.startswith("W/") else value
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or strip_weak(candidate) == strip_weak(etag):
+            return True
+    return False
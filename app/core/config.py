@@ -12,13 +12,83 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
     
+    # 密码哈希配置
+    BCRYPT_ROUNDS: int = 12  # bcrypt 成本因子
+    PASSWORD_HASH_WORKERS: int = 2  # 同时进行的哈希计算上限
+    
+    # 已认证用户缓存
+    USER_CACHE_TTL: int = 60  # 秒
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_CHECK_INTERVAL: float = 1.0  # 秒，其他 worker 修改或禁用用户后本进程的缓存最迟在该时间后失效
+    
+    # 问题类型、解决方案类型缓存，其他 worker 的修改最迟在该时间后生效
+    REFERENCE_CACHE_TTL: int = 30  # 秒
+    
+    # 批量创建工单
+    WORK_ORDER_BATCH_SIZE: int = 500  # 单次请求最多包含的工单数
+    
+    # 工单日志
+    LOG_COMPACT_DAYS: int = 30  # 工单归档超过该天数后合并其编辑日志
+    
+    # 每日统计
+    STATS_RECONCILE_DAYS: int = 7  # 定时对账最近多少天的统计
+    
+    # 定时任务：多个 worker 通过数据库租约选出一个运行
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_LEASE_SECONDS: int = 30  # 主节点异常退出后最多经过该时间由其他 worker 接管
+    
+    # 自动派单：在定时任务主节点中把新建工单按策略分配给参与派单的坐席（见 app/services/dispatch.py）
+    AUTO_DISPATCH_ENABLED: bool = False
+    AUTO_DISPATCH_POLICY: str = "least_loaded"  # least_loaded: 负载最低, round_robin: 轮流, skill: 按问题类型匹配
+    AUTO_DISPATCH_MAX_LOAD: int = 10  # 每个坐席同时处理中的工单上限（可按坐席单独设置），0 表示不限
+    AUTO_DISPATCH_INTERVAL: float = 1  # 秒，检查其他 worker 新建工单的间隔
+    AUTO_DISPATCH_BATCH_SIZE: int = 500  # 每个事务分配的工单数
+    AUTO_DISPATCH_RESYNC_SECONDS: int = 10  # 从数据库重建队列和坐席负载的间隔，完成的工单在此之后释放负载
+
+    # 处理时效（SLA）
+    SLA_ASSIGN_MINUTES: int = 30  # 创建后多少分钟内应被签收
+    SLA_COMPLETE_HOURS: int = 24  # 创建后多少小时内应处理完成
+    
+    # 工单列表快速序列化：用 values() 投影并直接编码 JSON，跳过 Pydantic 校验（输出格式不变）
+    FAST_JSON_RESPONSES: bool = False
+    
+    # 工单事件推送（SSE）
+    EVENT_BUFFER_SIZE: int = 1000  # 保留用于断线续传的最近事件数
+    EVENT_QUEUE_SIZE: int = 100  # 单个连接允许积压的事件数，超过后断开该连接
+    EVENT_HEARTBEAT_INTERVAL: int = 15  # 秒
+    EVENT_RETRY_MS: int = 3000  # 客户端断线重连间隔
+    EVENT_POLL_INTERVAL: float = 0.5  # 秒，多 worker 时其他进程发布的事件最多延迟该时间送达
+    
+    # 运行指标（Prometheus 格式的 /metrics）
+    METRICS_ENABLED: bool = True
+    METRICS_FLUSH_INTERVAL: int = 5  # 秒，多 worker 时其他进程的指标最多延迟该时间
+    METRICS_TOKEN: str = ""  # 非空时 /metrics 需携带 Authorization: Bearer <token>
+    
+    # 性能剖析：按请求记录查询次数和各部分耗时（Server-Timing 响应头），以及慢查询、慢请求
+    PROFILING_ENABLED: bool = False
+    SLOW_QUERY_MS: int = 100  # 超过该耗时的查询记录 SQL 和参数形状
+    SLOW_REQUEST_MS: int = 500  # 超过该耗时的请求记录耗时构成
+    # 调用栈采样（需同时开启 PROFILING_ENABLED），超过阈值的请求输出折叠格式的调用栈用于生成火焰图
+    PROFILE_SAMPLING_ENABLED: bool = False
+    PROFILE_SAMPLE_INTERVAL_MS: int = 5
+    PROFILE_THRESHOLD_MS: int = 1000
+    PROFILE_DIR: str = "./data/profiles"
+    
     # CORS配置
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
     
     # 数据库配置
 
     DATABASE_URL: str = "sqlite://./data/db.sqlite3"
-
+    
+    # SQLite 调优配置（连接建立时以 PRAGMA 方式应用）
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT: int = 5000  # 毫秒
+    SQLITE_CACHE_SIZE: int = -65536  # 负数表示 KiB，即 64MB
+    SQLITE_MMAP_SIZE: int = 268435456  # 256MB
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    SQLITE_READ_POOL_SIZE: int = 2  # 只读连接数，0 表示读写共用一个连接
     
     class Config:
         case_sensitive = True
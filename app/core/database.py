@@ -0,0 +1,66 @@
+from itertools import count
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.backends.base.config_generator import expand_db_url
+from app.core.config import settings
+
+READ_CONNECTION_PREFIX = "read_"
+
+_read_counter = count()
+
+def sqlite_pragmas() -> dict:
+    """根据配置生成 SQLite 连接参数，busy_timeout 需最先设置"""
+    return {
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+
+def build_connections(db_url: str = None) -> dict:
+    """
+    生成 Tortoise 连接配置
+
+    SQLite 下 default 为唯一的写连接，另外创建 SQLITE_READ_POOL_SIZE 个只读连接，
+    WAL 模式下读连接可以与写连接并发执行
+    """
+    default = expand_db_url(db_url or settings.DATABASE_URL)
+    connections_config = {"default": default}
+    if default["engine"] != "tortoise.backends.sqlite":
+        return connections_config
+
+    default["credentials"].update(sqlite_pragmas())
+    if default["credentials"]["file_path"] == ":memory:":
+        return connections_config
+
+    for index in range(settings.SQLITE_READ_POOL_SIZE):
+        connections_config[f"{READ_CONNECTION_PREFIX}{index}"] = {
+            "engine": default["engine"],
+            "credentials": {**default["credentials"], "query_only": "ON"},
+        }
+    return connections_config
+
+def _read_aliases() -> list:
+    return [
+        alias for alias in connections.db_config
+        if alias.startswith(READ_CONNECTION_PREFIX)
+    ]
+
+async def open_read_connections() -> None:
+    """
+    启动时打开全部只读连接
+
+    Tortoise 在首次查询时才建立连接，多个请求同时首次使用同一个连接时，
+    后到的请求会在连接建立完成前使用它而报错（no active connection）
+    """
+    for alias in _read_aliases():
+        await connections.get(alias).create_connection(with_db=True)
+
+def get_read_db() -> BaseDBAsyncClient:
+    """轮询返回一个只读连接，未配置只读连接时返回默认连接"""
+    aliases = _read_aliases()
+    if not aliases:
+        return connections.get("default")
+    return connections.get(aliases[next(_read_counter) % len(aliases)])
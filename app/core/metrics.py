@@ -0,0 +1,291 @@
+"""
+Prometheus 文本格式的运行指标
+
+指标值保存在本进程内存中，只在事件循环线程中修改，不需要加锁；每次记录只是字典查找和加法，
+对工单接口的开销可以忽略。多 worker 时各进程定期把快照写入数据库，由 /metrics 汇总（见 app/services/metrics.py）
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+
+class Counter:
+    """只增不减的计数"""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional["Registry"] = None
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        (REGISTRY if registry is None else registry).register(self)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, value: float, *labels: str) -> None:
+        """由采集函数写入进程内已有的累计值（如缓存命中数）"""
+        self._values[labels] = value
+
+    @staticmethod
+    def add(a, b):
+        return a + b
+
+    @staticmethod
+    def subtract(a, b):
+        return a - b
+
+    def samples(self, values: Dict[Labels, float]) -> Iterable[Tuple[str, Labels, Tuple[str, ...], float]]:
+        if not values and not self.labelnames:
+            # 没有标签的指标在尚未记录时输出 0
+            values = {(): 0}
+        for labels, value in sorted(values.items()):
+            yield self.name, self.labelnames, labels, value
+
+class Gauge(Counter):
+    """当前值，汇总时只计入仍在运行的 worker"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+class Histogram(Counter):
+    """按区间计数的耗时分布，值为各区间的计数（非累计）加上总和"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = (),
+        registry: Optional["Registry"] = None
+    ):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, *labels: str) -> None:
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        item[bisect_left(self.buckets, value)] += 1
+        item[-1] += value
+
+    @staticmethod
+    def add(a, b):
+        return [x + y for x, y in zip(a, b)] if len(a) == len(b) else a
+
+    @staticmethod
+    def subtract(a, b):
+        return [x - y for x, y in zip(a, b)] if len(a) == len(b) else a
+
+    def samples(self, values: Dict[Labels, list]):
+        bucket_names = self.labelnames + ("le",)
+        for labels, value in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), value[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_names, labels + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labelnames, labels, value[-1]
+            yield f"{self.name}_count", self.labelnames, labels, cumulative
+
+Snapshot = Dict[str, Dict[Labels, object]]
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Counter] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Counter) -> None:
+        self.metrics[metric.name] = metric
+
+    def add_collector(self, func: Callable[[], None]) -> None:
+        """注册在生成快照前调用的函数，用于写入队列长度、缓存命中数等由其他模块维护的值"""
+        self.collectors.append(func)
+
+    def snapshot(self) -> Snapshot:
+        for collect in self.collectors:
+            collect()
+        return {
+            name: {labels: (list(value) if isinstance(value, list) else value) for labels, value in metric._values.items()}
+            for name, metric in self.metrics.items()
+        }
+
+    def merge(self, snapshots: Iterable[Tuple[Snapshot, bool]]) -> Snapshot:
+        """合并多个快照：计数和分布求和，当前值只合并 live 为真的快照"""
+        merged: Snapshot = {name: {} for name in self.metrics}
+        for snapshot, live in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not live):
+                    continue
+                target = merged[name]
+                for labels, value in values.items():
+                    target[labels] = metric.add(target[labels], value) if labels in target else value
+        return merged
+
+    def subtract(self, snapshot: Snapshot, base: Snapshot) -> Snapshot:
+        """计数和分布减去 base 中的值，当前值不变"""
+        result = {}
+        for name, values in snapshot.items():
+            metric = self.metrics[name]
+            offsets = base.get(name, {}) if metric.kind != "gauge" else {}
+            result[name] = {
+                labels: metric.subtract(value, offsets[labels]) if labels in offsets else value
+                for labels, value in values.items()
+            }
+        return result
+
+    def render(self, snapshot: Snapshot) -> str:
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample_name, labelnames, labels, value in metric.samples(snapshot.get(name, {})):
+                lines.append(f"{sample_name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def encode_snapshot(snapshot: Snapshot) -> dict:
+    """转换为可 JSON 序列化的格式"""
+    return {name: [[list(labels), value] for labels, value in values.items()] for name, values in snapshot.items()}
+
+def decode_snapshot(data: dict) -> Snapshot:
+    return {name: {tuple(labels): value for labels, value in values} for name, values in data.items()}
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for value in values
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+REGISTRY = Registry()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+HTTP_REQUESTS = Counter(
+    "helpdesk_http_requests_total", "按路由模板统计的请求数", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "helpdesk_http_request_duration_seconds", "按路由模板统计的请求耗时（不含事件流）",
+    ("method", "route"), LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("helpdesk_http_requests_in_flight", "正在处理的请求数")
+DB_CONNECTION_WAIT = Histogram(
+    "helpdesk_db_connection_wait_seconds",
+    "等待数据库连接的时间：单条查询等待连接锁，事务还包括等待写锁和开始事务",
+    ("connection", "kind"), WAIT_BUCKETS
+)
+DB_BUSY_ERRORS = Counter(
+    "helpdesk_db_busy_errors_total", "超过 busy_timeout 仍未拿到 SQLite 锁而失败的语句数", ("connection",)
+)
+
+class MetricsMiddleware:
+    """记录请求数、耗时和正在处理的请求数，路由按模板（如 /api/v1/work-orders/{work_order_id}）区分"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        streaming = False
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", ())
+                )
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # FastAPI 路由匹配后会把路由对象写入 scope
+            route = scope.get("route")
+            template = getattr(route, "path_format", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, template, str(status_code))
+            if not streaming:
+                HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method, template)
+
+def _is_busy_error(error: Optional[BaseException]) -> bool:
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+# 已替换的 (类, 方法名, 原函数)
+_patches: List[Tuple[type, str, Callable]] = []
+
+def install_db_hooks() -> None:
+    """
+    为 Tortoise 的连接锁计时并统计 SQLite busy 错误，重复调用无影响
+
+    单条查询通过 ConnectionWrapper 获取连接，事务通过 TransactionContext 获取写锁，
+    语句失败的异常会经过 ConnectionWrapper.__aexit__
+    """
+    if _patches:
+        return
+    from tortoise.backends.base.client import ConnectionWrapper, TransactionContext
+
+    def timed_enter(kind: str, func: Callable, client: Callable) -> Callable:
+        async def __aenter__(self):
+            start = time.perf_counter()
+            result = await func(self)
+            DB_CONNECTION_WAIT.observe(time.perf_counter() - start, client(self).connection_name, kind)
+            return result
+        return __aenter__
+
+    original_exit = ConnectionWrapper.__aexit__
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_val is not None and _is_busy_error(exc_val):
+            DB_BUSY_ERRORS.inc(self.client.connection_name)
+        return await original_exit(self, exc_type, exc_val, exc_tb)
+
+    for cls, name, wrapper in (
+        (ConnectionWrapper, "__aenter__", timed_enter("query", ConnectionWrapper.__aenter__, lambda wrapper: wrapper.client)),
+        (TransactionContext, "__aenter__", timed_enter("transaction", TransactionContext.__aenter__, lambda context: context.connection)),
+        (ConnectionWrapper, "__aexit__", __aexit__),
+    ):
+        _patches.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, wrapper)
+
+def uninstall_db_hooks() -> None:
+    while _patches:
+        cls, name, original = _patches.pop()
+        setattr(cls, name, original)
@@ -0,0 +1,385 @@
+"""
+请求级性能剖析
+
+开启 PROFILING_ENABLED 后：
+- 为 Tortoise 数据库客户端的 execute_* 方法、FastAPI 的响应序列化和密码哈希挂上计时，
+  按请求累计查询次数、数据库耗时、序列化耗时和哈希耗时，通过 Server-Timing 响应头返回
+- 超过 SLOW_QUERY_MS 的查询记录 SQL 和参数、字面量的类型/长度（不记录取值），超过 SLOW_REQUEST_MS 的请求记录耗时构成
+- 再开启 PROFILE_SAMPLING_ENABLED 时，后台线程定时采集各线程的调用栈，超过 PROFILE_THRESHOLD_MS
+  的请求把期间的采样按 flamegraph.pl / speedscope 可读的折叠格式（folded stacks）写入 PROFILE_DIR
+
+关闭时 main.py 不安装任何钩子和中间件，没有额外开销。记录只保存在本进程内存中，多 worker 时各自独立
+"""
+import functools
+import importlib
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SLOW_LOG_SIZE = 200  # 慢查询、慢请求各保留的最近条数
+SAMPLE_BUFFER_SECONDS = 120  # 调用栈采样保留的时长，更长的请求只输出最后这段时间的采样
+SQL_MAX_LENGTH = 2000
+
+class RequestProfile:
+    """单个请求的耗时构成，单位为秒"""
+
+    __slots__ = ("db_count", "db_time", "serialize_time", "hash_time")
+
+    def __init__(self):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.hash_time = 0.0
+
+    def server_timing(self, total: float) -> str:
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_count} queries"',
+            f"serialize;dur={self.serialize_time * 1000:.1f}",
+            f"hash;dur={self.hash_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+current_path: ContextVar[Optional[str]] = ContextVar("current_path", default=None)
+
+slow_queries: Deque[dict] = deque(maxlen=SLOW_LOG_SIZE)
+slow_requests: Deque[dict] = deque(maxlen=SLOW_LOG_SIZE)
+
+def _value_shape(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+def parameter_shapes(values: Any) -> List[str]:
+    """参数的类型和长度，如 ["int", "str(11)", "null"]，不包含参数值"""
+    return [_value_shape(value) for value in values or []]
+
+# SQL 中的字符串和数字字面量
+_LITERAL = re.compile(r"'(?:[^']|'')*'|(?<![\w.\"])\d+(?:\.\d+)?(?![\w\"])")
+
+def normalize_sql(query: str) -> Tuple[str, List[str]]:
+    """
+    Tortoise 的查询多数把条件值直接拼入 SQL，把字面量替换为 ?，返回替换后的 SQL 和各字面量的形状，
+    慢查询中不保存用户名、电话等数据，同一语句的不同取值也能归为一类
+    """
+    shapes = []
+
+    def replace(match) -> str:
+        text = match.group()
+        if text.startswith("'"):
+            length = len(text[1:-1].replace("''", "'"))
+            shapes.append(f"str({length})")
+        else:
+            shapes.append("float" if "." in text else "int")
+        return "?"
+    return _LITERAL.sub(replace, query), shapes
+
+def _record_slow_query(method: str, query: str, values: Any, elapsed: float) -> None:
+    sql, literals = normalize_sql(query[:SQL_MAX_LENGTH])
+    entry = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "duration_ms": round(elapsed * 1000, 1),
+        "method": method,
+        "sql": sql,
+        "literals": literals,
+        "path": current_path.get(),
+    }
+    if method == "execute_many":
+        # 批量执行只记录行数和第一行的参数形状
+        entry["rows"] = len(values or [])
+        entry["params"] = parameter_shapes(values[0]) if values else []
+    else:
+        entry["params"] = parameter_shapes(values)
+    slow_queries.append(entry)
+    logger.warning(
+        f"慢查询 {entry['duration_ms']} ms（{entry['path'] or '非请求'}）：{entry['sql']} 参数 {entry['params']} 字面量 {entry['literals']}"
+    )
+
+def _wrap_db_method(method: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(self, query, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            profile = current_profile.get()
+            if profile is not None:
+                profile.db_count += 1
+                profile.db_time += elapsed
+            if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+                values = args[0] if args else kwargs.get("values")
+                _record_slow_query(method, query, values, elapsed)
+    return wrapper
+
+def _wrap_async(field: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            profile = current_profile.get()
+            if profile is not None:
+                setattr(profile, field, getattr(profile, field) + time.perf_counter() - start)
+    return wrapper
+
+def _wrap_sync(field: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile = current_profile.get()
+            if profile is not None:
+                setattr(profile, field, getattr(profile, field) + time.perf_counter() - start)
+    return wrapper
+
+DB_METHODS = ("execute_insert", "execute_many", "execute_query", "execute_query_dict", "execute_script")
+
+# 已替换的 (对象, 属性名, 原函数)
+_patches: List[Tuple[Any, str, Any]] = []
+
+def _patch(owner: Any, name: str, wrapper: Callable) -> None:
+    _patches.append((owner, name, getattr(owner, name)))
+    setattr(owner, name, wrapper)
+
+def _client_classes() -> List[type]:
+    from tortoise.backends.base.client import BaseDBAsyncClient
+    from tortoise.backends.base.config_generator import expand_db_url
+    # 数据库后端在 Tortoise 初始化时才导入，先导入当前配置的后端
+    importlib.import_module(expand_db_url(settings.DATABASE_URL)["engine"])
+    classes, pending = [], [BaseDBAsyncClient]
+    while pending:
+        cls = pending.pop()
+        for subclass in cls.__subclasses__():
+            if subclass not in classes:
+                classes.append(subclass)
+                pending.append(subclass)
+    return classes
+
+def install_hooks() -> None:
+    """安装计时钩子，重复调用无影响"""
+    if _patches:
+        return
+    import fastapi.routing
+    from starlette.responses import JSONResponse
+    from app.core import security
+    from app.services.serialization import FastJSONResponse, RowEncoder
+
+    # 只替换各客户端类自己定义的方法，继承来的方法已在父类上替换，避免重复计时
+    for cls in _client_classes():
+        for method in DB_METHODS:
+            if method in cls.__dict__:
+                _patch(cls, method, _wrap_db_method(method, cls.__dict__[method]))
+
+    # fastapi.routing 在请求处理时按模块全局名调用 serialize_response（response_model 校验和 jsonable_encoder）
+    _patch(fastapi.routing, "serialize_response", _wrap_async("serialize_time", fastapi.routing.serialize_response))
+    _patch(JSONResponse, "render", _wrap_sync("serialize_time", JSONResponse.render))
+    _patch(FastJSONResponse, "render", _wrap_sync("serialize_time", FastJSONResponse.render))
+    _patch(RowEncoder, "to_dicts", _wrap_sync("serialize_time", RowEncoder.to_dicts))
+    # 包括在哈希线程池中排队的时间
+    _patch(security, "_run_hash_job", _wrap_async("hash_time", security._run_hash_job))
+
+def uninstall_hooks() -> None:
+    while _patches:
+        owner, name, original = _patches.pop()
+        setattr(owner, name, original)
+
+class StackSampler:
+    """
+    有请求在处理时，后台线程每隔 interval 秒采集一次各线程的调用栈
+
+    事件循环是单线程的，请求期间的采样也包括同时处理的其他请求；aiosqlite 和密码哈希在独立线程中执行，
+    以线程名作为栈底区分，空闲等待的工作线程不计入。事件循环线程停在 select 上表示在等待数据库或网络
+    """
+
+    def __init__(self, interval: float, buffer_seconds: float = SAMPLE_BUFFER_SECONDS):
+        self.interval = interval
+        self._samples: Deque[Tuple[float, List[str]]] = deque(maxlen=max(1, int(buffer_seconds / interval)))
+        self._condition = threading.Condition()
+        self._active = 0
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Tuple[str, str, int], str] = {}
+
+    def begin(self) -> None:
+        with self._condition:
+            self._loop_thread = threading.get_ident()
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def end(self, start: float, end: float) -> Counter:
+        """结束一个请求，返回 [start, end] 期间各折叠栈的采样次数"""
+        with self._condition:
+            self._active -= 1
+            samples = list(self._samples)
+        stacks: Counter = Counter()
+        for timestamp, folded in samples:
+            if start <= timestamp <= end:
+                stacks.update(folded)
+        return stacks
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self._condition:
+                while self._active == 0:
+                    self._condition.wait()
+            timestamp = time.perf_counter()
+            folded = self._sample(own)
+            with self._condition:
+                self._samples.append((timestamp, folded))
+            time.sleep(self.interval)
+
+    def _sample(self, own: int) -> List[str]:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        folded = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if ident != self._loop_thread and self._is_idle(frame):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)).replace(";", ":"))
+            folded.append(";".join(reversed(stack)))
+        return folded
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        filename = os.path.basename(frame.f_code.co_filename)
+        return filename in ("threading.py", "queue.py") or (filename == "thread.py" and frame.f_code.co_name == "_worker")
+
+    def _label(self, code) -> str:
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        label = self._labels.get(key)
+        if label is None:
+            filename = code.co_filename
+            if "site-packages" in filename:
+                filename = filename.split("site-packages", 1)[1].lstrip(os.sep)
+            elif filename.startswith(os.getcwd()):
+                filename = os.path.relpath(filename)
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[key] = label
+        return label
+
+_dump_counter = itertools.count(1)
+
+def write_folded_stacks(directory: str, method: str, path: str, duration: float, stacks: Counter) -> str:
+    """按折叠格式（每行 "线程;函数;函数 次数"，以最后一个空格分隔次数）写入文件，返回文件路径"""
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")[:60] or "root"
+    filename = f"{datetime.now():%Y%m%d-%H%M%S}-{next(_dump_counter)}-{method}-{slug}-{int(duration * 1000)}ms.folded"
+    file_path = os.path.join(directory, filename)
+    with open(file_path, "w", encoding="utf-8") as file:
+        for stack, count in stacks.most_common():
+            file.write(f"{stack} {count}\n")
+    return file_path
+
+class ProfilingMiddleware:
+    """记录每个请求的耗时构成，写入 Server-Timing 响应头并记录慢请求"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        slow_request_ms: Optional[float] = None,
+        sampler: Optional[StackSampler] = None,
+        profile_threshold_ms: Optional[float] = None,
+        profile_dir: Optional[str] = None
+    ):
+        self.app = app
+        self.slow_request_ms = settings.SLOW_REQUEST_MS if slow_request_ms is None else slow_request_ms
+        self.sampler = sampler
+        self.profile_threshold_ms = settings.PROFILE_THRESHOLD_MS if profile_threshold_ms is None else profile_threshold_ms
+        self.profile_dir = profile_dir or settings.PROFILE_DIR
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        profile_token = current_profile.set(profile)
+        path_token = current_path.set(scope["path"])
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        if self.sampler is not None:
+            self.sampler.begin()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end = time.perf_counter()
+            current_profile.reset(profile_token)
+            current_path.reset(path_token)
+            self._finish(scope, status_code, profile, start, end)
+
+    def _finish(self, scope: Scope, status_code: int, profile: RequestProfile, start: float, end: float) -> None:
+        duration = end - start
+        stacks_file = None
+        if self.sampler is not None:
+            stacks = self.sampler.end(start, end)
+            if duration * 1000 >= self.profile_threshold_ms and stacks:
+                try:
+                    stacks_file = write_folded_stacks(self.profile_dir, scope["method"], scope["path"], duration, stacks)
+                except OSError as e:
+                    logger.warning(f"写入调用栈采样失败：{str(e)}")
+
+        if duration * 1000 < self.slow_request_ms and stacks_file is None:
+            return
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status_code": status_code,
+            "duration_ms": round(duration * 1000, 1),
+            "db_count": profile.db_count,
+            "db_ms": round(profile.db_time * 1000, 1),
+            "serialize_ms": round(profile.serialize_time * 1000, 1),
+            "hash_ms": round(profile.hash_time * 1000, 1),
+            "stacks_file": stacks_file,
+        }
+        slow_requests.append(entry)
+        logger.warning(
+            f"慢请求 {entry['method']} {entry['path']} {entry['duration_ms']} ms："
+            f"{entry['db_count']} 次查询 {entry['db_ms']} ms，序列化 {entry['serialize_ms']} ms，"
+            f"密码哈希 {entry['hash_ms']} ms" + (f"，调用栈采样 {stacks_file}" if stacks_file else "")
+        )
+
+def setup_profiling(app) -> None:
+    """按配置安装钩子和中间件，需在应用启动前调用"""
+    install_hooks()
+    sampler = None
+    if settings.PROFILE_SAMPLING_ENABLED:
+        sampler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    app.add_middleware(ProfilingMiddleware, sampler=sampler)
@@ -1,10 +1,21 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from tortoise import Tortoise
 from tortoise.contrib.fastapi import register_tortoise
 from app.core.config import settings
-from app.api import auth, work_orders, settings as settings_api
-from app.tasks.archive import setup_archive_scheduler
+from app.core.database import build_connections, open_read_connections
+from app.core.metrics import MetricsMiddleware, install_db_hooks
+from app.core.profiling import setup_profiling
+from app.api import auth, work_orders, settings as settings_api, metrics as metrics_api
+from app.tasks.archive import setup_archive_scheduler, shutdown_archive_scheduler
+from app.services.search import ensure_search_index
+from app.services.statistics import ensure_daily_stats
+from app.services.analytics import ensure_completed_at, ensure_duration_stats
+from app.services.dispatch import dispatch_leader, dispatcher
+from app.services.events import event_broker
+from app.services.metrics import metrics_publisher
+from app.services.sync import ensure_change_tracking
 
 app = FastAPI(
     title="客服派单平台",
@@ -22,14 +33,25 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# 运行指标
+if settings.METRICS_ENABLED:
+    install_db_hooks()
+    app.add_middleware(MetricsMiddleware)
+
+# 性能剖析（默认关闭，关闭时不安装任何钩子）
+if settings.PROFILING_ENABLED:
+    setup_profiling(app)
+
 # 注册路由
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["认证"])
 app.include_router(work_orders.router, prefix=f"{settings.API_V1_STR}/work-orders", tags=["工单"])
 app.include_router(settings_api.router, prefix=f"{settings.API_V1_STR}/settings", tags=["系统设置"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_api.router, tags=["运行指标"])
 
 # 数据库配置
 TORTOISE_ORM = {
-    "connections": {"default": settings.DATABASE_URL},
+    "connections": build_connections(),
     "apps": {
         "models": {
             "models": ["app.models.models"],
@@ -38,6 +60,16 @@ TORTOISE_ORM = {
     },
 }
 
+# 停止自动派单和定时任务并释放租约、写入本进程尚未写入的工单事件、归并本进程的运行指标，
+# 需在 register_tortoise 关闭数据库连接之前注册
+@app.on_event("shutdown")
+async def shutdown_event():
+    await dispatcher.stop()
+    await dispatch_leader.stop()
+    await shutdown_archive_scheduler()
+    await event_broker.stop()
+    await metrics_publisher.stop()
+
 # 注册数据库
 register_tortoise(
     app,
@@ -49,7 +81,21 @@ register_tortoise(
 # 启动定时任务
 @app.on_event("startup")
 async def startup_event():
-    setup_archive_scheduler()
+    await open_read_connections()
+    await ensure_completed_at(Tortoise.get_connection("default"))
+    await ensure_search_index()
+    await ensure_change_tracking()
+    # 各 worker 经数据库互相转发工单事件，事件流连接可以连到任意 worker
+    await event_broker.start()
+    await ensure_daily_stats()
+    await ensure_duration_stats()
+    await setup_archive_scheduler()
+    if settings.AUTO_DISPATCH_ENABLED:
+        # 使用单独的主节点租约，多个 worker 中只有一个派单，不受 SCHEDULER_ENABLED 影响
+        await dispatch_leader.start()
+        dispatcher.start(lambda: dispatch_leader.is_leader)
+    if settings.METRICS_ENABLED:
+        metrics_publisher.start()
 
 @app.get("/")
 async def root():
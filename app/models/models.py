@@ -1,6 +1,35 @@
 from tortoise import fields, models
 from tortoise.contrib.pydantic import pydantic_model_creator
+from bisect import bisect_left
+from collections import Counter
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Type, TypeVar
+from app.services.search import SEARCH_FIELDS, index_work_order, remove_work_order
+
+MODEL = TypeVar("MODEL", bound=models.Model)
+
+def storage_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    转换为数据库中的存储格式：不带时区的本地时间
+
+    Tortoise 为读出的时间和通过构造参数传入的时间附加时区（时刻不变），
+    与数据库中的值比较、编码分页游标或再次写入前需先去掉
+    """
+    if value is None:
+        return None
+    return value.replace(tzinfo=None)
+
+def build_model(model: Type[MODEL], **values) -> MODEL:
+    """构造用于批量写入（不经过 save()）的模型对象，时间字段在构造后按存储格式赋值"""
+    fields_map = model._meta.fields_map
+    times = {
+        name: values.pop(name) for name in list(values)
+        if isinstance(fields_map.get(name), fields.DatetimeField)
+    }
+    instance = model(**values)
+    for name, value in times.items():
+        setattr(instance, name, storage_datetime(value))
+    return instance
 
 class Users(models.Model):
     id = fields.IntField(pk=True)
@@ -64,8 +93,269 @@ class SolutionType(models.Model):
     class Meta:
         table = "solution_types"
 
-class WorkOrders(models.Model):
+class DispatchAgent(models.Model):
+    """自动派单的坐席设置，只有启用的在职用户参与自动派单"""
     id = fields.IntField(pk=True)
+    user = fields.OneToOneField('models.Users', related_name='dispatch_agent')
+    enabled = fields.BooleanField(default=True)
+    max_load = fields.IntField(null=True)  # 同时处理中的工单上限，为空时使用 AUTO_DISPATCH_MAX_LOAD
+    skills = fields.JSONField(default=list)  # 擅长的问题类型名称，为空表示不限
+    modified_at = fields.DatetimeField()
+
+    async def save(self, *args, **kwargs):
+        self.modified_at = datetime.now()
+        await super().save(*args, **kwargs)
+
+    class Meta:
+        table = "dispatch_agents"
+
+class SchedulerLease(models.Model):
+    """定时任务主节点租约：多个 worker 中只有持有未过期租约的一个执行定时任务"""
+    name = fields.CharField(max_length=50, pk=True)
+    holder = fields.CharField(max_length=100)  # 主机名:进程号:随机串
+    expires_at = fields.DatetimeField()
+
+    class Meta:
+        table = "scheduler_leases"
+
+class ScheduledJobState(models.Model):
+    """定时任务的运行状态，主节点切换后据此安排下一次运行"""
+    name = fields.CharField(max_length=50, pk=True)
+    holder = fields.CharField(max_length=100, null=True)  # 最近一次运行该任务的 worker
+    last_started_at = fields.DatetimeField(null=True)
+    last_finished_at = fields.DatetimeField(null=True)
+    last_status = fields.CharField(max_length=10, null=True)  # running/success/failed
+    last_error = fields.TextField(null=True)
+    last_duration = fields.FloatField(null=True)  # 秒
+
+    class Meta:
+        table = "scheduled_jobs"
+
+class MetricsSnapshot(models.Model):
+    """各 worker 最近一次上报的运行指标快照，retired 行为已退出 worker 的累计计数"""
+    worker = fields.CharField(max_length=100, pk=True)  # 主机名:进程号:随机串
+    updated_at = fields.DatetimeField()
+    data = fields.TextField()  # JSON
+
+    class Meta:
+        table = "metrics_snapshots"
+
+class ChangeVersion(models.Model):
+    """数据变更计数，由数据库触发器递增，用于工单列表的 ETag 和已认证用户缓存的失效（见 app/services/sync.py）"""
+    name = fields.CharField(max_length=50, pk=True)
+    epoch = fields.CharField(max_length=16)  # 首次创建时随机生成
+    version = fields.BigIntField(default=0)
+
+    class Meta:
+        table = "change_versions"
+
+class UserChange(models.Model):
+    """用户改名或删除的时间，由数据库触发器写入；签收人变化不修改工单的修改时间，增量同步据此补充（见 app/services/sync.py）"""
+    user_id = fields.IntField(pk=True)
+    changed_at = fields.DatetimeField()
+
+    class Meta:
+        table = "user_changes"
+
+class WorkOrderEvent(models.Model):
+    """工单事件，各 worker 发布时写入，再由每个 worker 读取后推送给本进程的事件流连接（见 app/services/events.py）"""
+    id = fields.IntField(pk=True)  # 即事件序号
+    data = fields.TextField()  # JSON，含事件类型
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "work_order_events"
+
+# 本进程内已完成初始化的编号前缀
+_seeded_prefixes = set()
+
+class OrderSequence(models.Model):
+    """工单编号序列（每个编号前缀一行，即每天一行）"""
+    prefix = fields.CharField(max_length=20, pk=True)  # 如 SZIT-20250224-
+    last_no = fields.IntField(default=0)
+
+    @classmethod
+    async def _seed(cls, db, prefix: str):
+        """从已有工单中接续该前缀的最大序号（兼容升级前的数据）"""
+        await db.execute_query(
+            'INSERT OR IGNORE INTO "order_sequences" ("prefix", "last_no") '
+            'SELECT ?, COALESCE(MAX(CAST(substr("order_no", ?) AS INTEGER)), 0) '
+            'FROM "work_orders" WHERE "order_no" LIKE ?',
+            [prefix, len(prefix) + 1, f"{prefix}%"]
+        )
+        _seeded_prefixes.add(prefix)
+
+    @classmethod
+    async def allocate(cls, prefix: str, count: int = 1) -> range:
+        """原子地分配 count 个连续序号，返回分配到的序号范围"""
+        db = cls._meta.db
+        if prefix not in _seeded_prefixes:
+            await cls._seed(db, prefix)
+
+        # 单条语句完成自增并返回结果，并发请求之间不会拿到相同序号
+        query = (
+            'UPDATE "order_sequences" SET "last_no" = "last_no" + ? '
+            'WHERE "prefix" = ? RETURNING "last_no"'
+        )
+        _, rows = await db.execute_query(query, [count, prefix])
+        if not rows:
+            # 序列行不存在（如序列表被清空），重新接续后再分配
+            await cls._seed(db, prefix)
+            _, rows = await db.execute_query(query, [count, prefix])
+        last_no = rows[0]["last_no"]
+        return range(last_no - count + 1, last_no + 1)
+
+    class Meta:
+        table = "order_sequences"
+
+class WorkOrderDailyStats(models.Model):
+    """
+    工单每日统计：按创建日期汇总工单当前的状态、类型和签收人
+
+    工单每次变化时在同一连接上增量更新，定时任务负责对账修正
+    """
+    id = fields.IntField(pk=True)
+    date = fields.DateField()  # 工单创建日期
+    status = fields.IntField()
+    problem_type = fields.CharField(max_length=255, default="")  # 空字符串表示未分类
+    solution_type = fields.CharField(max_length=255, default="")
+    assigned_to_id = fields.IntField(default=0)  # 0 表示未签收
+    count = fields.IntField(default=0)
+
+    @staticmethod
+    def key(values: dict) -> Tuple:
+        """工单字段值对应的统计行主键"""
+        return (
+            values["created_at"].date().isoformat(),
+            values["status"],
+            values.get("problem_type") or "",
+            values.get("solution_type") or "",
+            values.get("assigned_to_id") or 0,
+        )
+
+    @classmethod
+    async def adjust(cls, deltas: Dict[Tuple, int], db) -> None:
+        """按 {统计行主键: 增量} 更新计数，不存在的行自动创建"""
+        rows = [[*key, delta] for key, delta in deltas.items() if delta]
+        if not rows:
+            return
+        await db.execute_many(
+            'INSERT INTO "work_order_daily_stats" '
+            '("date", "status", "problem_type", "solution_type", "assigned_to_id", "count") '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT ("date", "status", "problem_type", "solution_type", "assigned_to_id") '
+            'DO UPDATE SET "count" = "count" + excluded."count"',
+            rows
+        )
+
+    @classmethod
+    async def record_transition(cls, old: Optional[dict], new: Optional[dict], db) -> None:
+        """一个工单从 old 变为 new（新建时 old 为空，删除时 new 为空）"""
+        deltas = Counter()
+        if old:
+            deltas[cls.key(old)] -= 1
+        if new:
+            deltas[cls.key(new)] += 1
+        await cls.adjust(deltas, db)
+
+    class Meta:
+        table = "work_order_daily_stats"
+        unique_together = (("date", "status", "problem_type", "solution_type", "assigned_to_id"),)
+
+class WorkOrderDurationStats(models.Model):
+    """
+    工单处理时效统计：按创建日期、状态、类型和签收人汇总签收耗时和完成耗时的分布
+
+    耗时按 BUCKETS 分桶，与每日统计一样在工单变化时增量维护、由定时任务对账
+    """
+    id = fields.IntField(pk=True)
+    date = fields.DateField()  # 工单创建日期
+    metric = fields.CharField(max_length=10)  # assign: 签收耗时, complete: 完成耗时
+    status = fields.IntField()
+    problem_type = fields.CharField(max_length=255, default="")  # 空字符串表示未分类
+    assigned_to_id = fields.IntField(default=0)  # 0 表示未签收
+    bucket = fields.IntField()  # 耗时所在分桶的下标，等于 len(BUCKETS) 表示超过最后一个上界
+    count = fields.IntField(default=0)
+    seconds = fields.BigIntField(default=0)  # 耗时合计，用于计算平均值
+
+    # 分桶上界（秒），桶 i 包含 (BUCKETS[i-1], BUCKETS[i]] 的耗时
+    BUCKETS = [
+        30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 5400, 7200, 10800, 14400,
+        21600, 28800, 43200, 57600, 86400, 129600, 172800, 259200, 345600, 432000,
+        604800, 864000, 1209600, 1814400, 2592000,
+    ]
+
+    # 时效指标对应的结束时间字段，耗时从创建时间算起
+    METRICS = {
+        "assign": "assigned_time",
+        "complete": "completed_at",
+    }
+
+    @staticmethod
+    def duration(start: datetime, end: datetime) -> int:
+        """两个时间之间的整秒数，与 SQL 中 strftime('%s') 相减的结果一致"""
+        start = storage_datetime(start).replace(microsecond=0)
+        end = storage_datetime(end).replace(microsecond=0)
+        return int((end - start).total_seconds())
+
+    @classmethod
+    def entries(cls, values: dict) -> List[Tuple[Tuple, int]]:
+        """工单字段值对应的 [(统计行主键, 耗时)]，尚未签收或完成的指标不计入"""
+        result = []
+        for metric, field in cls.METRICS.items():
+            if values.get(field) is None:
+                continue
+            seconds = cls.duration(values["created_at"], values[field])
+            key = (
+                values["created_at"].date().isoformat(),
+                metric,
+                values["status"],
+                values.get("problem_type") or "",
+                values.get("assigned_to_id") or 0,
+                bisect_left(cls.BUCKETS, seconds),
+            )
+            result.append((key, seconds))
+        return result
+
+    @classmethod
+    async def adjust(cls, deltas: Dict[Tuple, List[int]], db) -> None:
+        """按 {统计行主键: [数量增量, 耗时增量]} 更新，不存在的行自动创建"""
+        rows = [[*key, count, seconds] for key, (count, seconds) in deltas.items() if count or seconds]
+        if not rows:
+            return
+        await db.execute_many(
+            'INSERT INTO "work_order_duration_stats" '
+            '("date", "metric", "status", "problem_type", "assigned_to_id", "bucket", "count", "seconds") '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT ("date", "metric", "status", "problem_type", "assigned_to_id", "bucket") '
+            'DO UPDATE SET "count" = "count" + excluded."count", "seconds" = "seconds" + excluded."seconds"',
+            rows
+        )
+
+    @classmethod
+    def add_transition(cls, deltas: Dict[Tuple, List[int]], old: Optional[dict], new: Optional[dict]) -> None:
+        """把一个工单从 old 变为 new 的增量累加到 deltas"""
+        for values, sign in ((old, -1), (new, 1)):
+            if not values:
+                continue
+            for key, seconds in cls.entries(values):
+                delta = deltas.setdefault(key, [0, 0])
+                delta[0] += sign
+                delta[1] += sign * seconds
+
+    @classmethod
+    async def record_transition(cls, old: Optional[dict], new: Optional[dict], db) -> None:
+        """一个工单从 old 变为 new（新建时 old 为空，删除时 new 为空）"""
+        deltas = {}
+        cls.add_transition(deltas, old, new)
+        await cls.adjust(deltas, db)
+
+    class Meta:
+        table = "work_order_duration_stats"
+        unique_together = (("date", "metric", "status", "problem_type", "assigned_to_id", "bucket"),)
+
+class WorkOrderFields(models.Model):
+    """在用工单表与归档表共有的字段，两张表的列相同，工单在两表之间移动时整行复制"""
     order_no = fields.CharField(max_length=20, unique=True)  # SZIT-20250224-001 格式
     reporter_name = fields.CharField(max_length=255)
     contact_phone = fields.CharField(max_length=255)
@@ -73,15 +363,38 @@ class WorkOrders(models.Model):
     problem_desc = fields.TextField()
     problem_type = fields.CharField(max_length=255, null=True)  # 修改为直接存储类型名称
     status = fields.IntField(default=0)  # 0:新建, 1:处理中, 2:已完成, 3:已归档
-    assigned_to = fields.ForeignKeyField('models.Users', related_name='assigned_orders', null=True)
     assigned_time = fields.DatetimeField(null=True)  # 签收时间
     processing_desc = fields.TextField(null=True)  # 处理说明
     solution_type = fields.CharField(max_length=255, null=True)  # 解决方案类型
     created_at = fields.DatetimeField()
     modified_at = fields.DatetimeField()
     archived_at = fields.DatetimeField(null=True)  # 归档时间
+    completed_at = fields.DatetimeField(null=True)  # 完成时间，用于处理时效分析
 
-    async def save(self, *args, **kwargs):
+    class Meta:
+        abstract = True
+
+class WorkOrders(WorkOrderFields):
+    """在用工单（新建、处理中、已完成），已归档的工单由归档任务移到 work_orders_archive"""
+    id = fields.IntField(pk=True)
+    assigned_to = fields.ForeignKeyField('models.Users', related_name='assigned_orders', null=True)
+
+    @classmethod
+    def _init_from_db(cls, **kwargs):
+        instance = super()._init_from_db(**kwargs)
+        instance._take_snapshot()
+        return instance
+
+    def _take_snapshot(self):
+        """记录数据库中的字段值，用于判断状态变化和只更新变化的列"""
+        self._original = {
+            field: self.__dict__[field]
+            for field in self._meta.fields_db_projection
+            if field in self.__dict__
+        }
+
+    async def save(self, *args, operator: Optional[Users] = None, **kwargs):
+        """保存工单，operator 为操作人（API Token 创建时为空），用于记录工单日志"""
         # 获取当前时间
         current_time = datetime.now()
         
@@ -92,28 +405,168 @@ class WorkOrders(models.Model):
         # 每次保存都更新修改时间
         self.modified_at = current_time
         
-        # 获取当前对象的原始状态（如果存在）
-        if self.id:
-            old_order = await WorkOrders.get(id=self.id)
-            old_status = old_order.status
-            old_assigned_to = old_order.assigned_to_id
-        else:
-            old_status = None
-            old_assigned_to = None
+        # 从加载时的快照获取原始状态（新记录没有快照），无需再查询数据库
+        original = getattr(self, "_original", {})
+        old_status = original.get("status")
+        old_assigned_to = original.get("assigned_to_id")
 
         # 如果是签收操作（状态从0变为1，或assigned_to从None变为有值）
         if ((old_status == 0 and self.status == 1) or 
             (old_assigned_to is None and self.assigned_to_id is not None)):
             self.assigned_time = current_time
 
+        # 如果状态变更为已完成
+        if self.status == 2 and old_status != 2:
+            self.completed_at = current_time
+
         # 如果状态变更为已归档
         if self.status == 3 and (old_status != 3 or not self.archived_at):
             self.archived_at = current_time
+
+        # 已存在的记录只更新发生变化的列
+        if original and self._saved_in_db and not args and "update_fields" not in kwargs:
+            kwargs["update_fields"] = [
+                field for field, value in original.items()
+                if self.__dict__.get(field) != value
+            ]
+
+        # 新记录或检索字段有变化时需要同步全文索引
+        created = not self._saved_in_db
+        text_changed = created or any(
+            self.__dict__.get(field) != original.get(field) for field in SEARCH_FIELDS
+        )
             
         await super().save(*args, **kwargs)
 
+        # 日志、每日统计与全文索引使用同一个连接，调用方在事务中保存时一并提交
+        db = kwargs.get("using_db") or self._choose_db(True)
+        await WorkOrderLogs.record_change(self, original, operator, db)
+        await WorkOrderDailyStats.record_transition(original, self.__dict__, db)
+        await WorkOrderDurationStats.record_transition(original, self.__dict__, db)
+        self._take_snapshot()
+
+        if text_changed:
+            await index_work_order(self, db, created)
+
+    async def delete(self, using_db=None, operator: Optional[Users] = None):
+        db = using_db or self._choose_db(True)
+        await super().delete(db)
+        await remove_work_order(self.id, db)
+        original = getattr(self, "_original", None) or self.__dict__
+        await WorkOrderDailyStats.record_transition(original, None, db)
+        await WorkOrderDurationStats.record_transition(original, None, db)
+        await WorkOrderLogs.create(
+            work_order_id=self.id,
+            action="deleted",
+            status_from=self.status,
+            operator=operator,
+            using_db=db
+        )
+
     class Meta:
         table = "work_orders"
+        indexes = (
+            ("created_at",),  # 列表游标分页 (created_at, id)
+            ("status", "created_at"),  # 按状态筛选的列表
+            ("status", "problem_type"),  # 统计分组
+            ("status", "modified_at"),  # 自动归档
+            ("assigned_to_id", "status", "created_at"),  # 工作台"我的工单"
+            ("problem_type", "created_at"),  # 按问题类型筛选的列表
+            ("modified_at",),  # 列表增量同步
+        )
+
+class WorkOrdersArchive(WorkOrderFields):
+    """已归档工单的冷存储（见 app/services/archive_store.py），ID 沿用在用表中的 ID"""
+    id = fields.IntField(pk=True, generated=False)
+    assigned_to = fields.ForeignKeyField('models.Users', related_name='archived_orders', null=True)
+
+    class Meta:
+        table = "work_orders_archive"
+        indexes = (
+            ("created_at",),  # 包含已归档工单的列表和导出
+            ("modified_at",),  # 列表增量同步
+            ("archived_at",),  # 日志压缩
+            ("assigned_to_id", "created_at"),  # 按签收人筛选
+        )
+
+class WorkOrderLogs(models.Model):
+    """工单日志（只追加），记录创建、签收、状态变化、编辑、归档和删除"""
+    id = fields.IntField(pk=True)
+    # 不使用外键：工单删除或转移后日志仍然保留
+    work_order_id = fields.IntField()
+    action = fields.CharField(max_length=20)  # created/assigned/status/updated/archived/deleted/compacted
+    status_from = fields.IntField(null=True)
+    status_to = fields.IntField(null=True)
+    operator = fields.ForeignKeyField(
+        'models.Users', related_name='work_order_logs', null=True, on_delete=fields.SET_NULL
+    )
+    remark = fields.TextField(null=True)
+    created_at = fields.DatetimeField()
+
+    # 编辑日志中记录的字段
+    FIELD_LABELS = {
+        "reporter_name": "报障人",
+        "contact_phone": "联系电话",
+        "location": "报障地点",
+        "problem_desc": "问题描述",
+        "problem_type": "问题类型",
+        "assigned_to_id": "签收人",
+        "processing_desc": "处理说明",
+        "solution_type": "解决方案类型",
+    }
+
+    @classmethod
+    def build(cls, created_at: datetime, **kwargs) -> "WorkOrderLogs":
+        """构造日志对象，用于批量写入"""
+        return build_model(cls, created_at=created_at, **kwargs)
+
+    async def save(self, *args, **kwargs):
+        if not self.created_at:
+            self.created_at = datetime.now()
+        await super().save(*args, **kwargs)
+
+    @classmethod
+    async def record_change(cls, order: "WorkOrders", original: dict, operator, db) -> None:
+        """根据保存前的快照判断变化类型并写入一条日志，没有需要记录的变化时不写入"""
+        changed = [
+            label for field, label in cls.FIELD_LABELS.items()
+            if original and order.__dict__.get(field) != original.get(field)
+        ]
+        old_status = original.get("status")
+
+        if not original:
+            action = "created"
+        elif old_status != order.status:
+            if order.status == 3:
+                action = "archived"
+            elif old_status == 0 and order.status == 1:
+                action = "assigned"
+            else:
+                action = "status"
+        elif changed:
+            action = "updated"
+        else:
+            return
+
+        log = cls.build(
+            # 日志时间与工单的修改时间一致
+            order.modified_at,
+            work_order_id=order.id,
+            action=action,
+            status_from=old_status,
+            status_to=order.status,
+            operator=operator,
+            remark="、".join(changed) or None
+        )
+        await log.save(using_db=db)
+
+    class Meta:
+        table = "work_order_logs"
+        indexes = (
+            ("work_order_id", "created_at"),  # 工单时间线
+            ("action", "work_order_id"),  # 归档工单的日志压缩
+            ("action", "created_at"),  # 列表增量同步中的删除记录
+        )
 
 # 创建 Pydantic 模型
 User_Pydantic = pydantic_model_creator(Users, name="User")
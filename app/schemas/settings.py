@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 
 class SystemSettingsUpdate(BaseModel):
@@ -9,6 +9,11 @@ class SystemSettingsResponse(BaseModel):
     archive_hours: int
     modified_at: datetime
 
+class DispatchAgentUpdate(BaseModel):
+    enabled: bool = True
+    max_load: Optional[int] = Field(None, ge=0)  # 为空时使用 AUTO_DISPATCH_MAX_LOAD，0 表示不限
+    skills: List[str] = []  # 擅长的问题类型，为空表示不限
+
 class ProblemTypeCreate(BaseModel):
     name: str
 
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, constr
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class ProblemTypeInfo(BaseModel):
@@ -24,7 +24,7 @@ class WorkOrderBase(BaseModel):
     problem_desc: str
 
 class WorkOrderCreate(WorkOrderBase):
-    pass
+    problem_type: Optional[str] = None  # 可选，开启按问题类型自动派单时用于匹配坐席
 
 class WorkOrderUpdate(BaseModel):
     status: Optional[int] = None
@@ -53,9 +53,51 @@ class WorkOrderInDB(WorkOrderBase):
             datetime: lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S") if dt else None
         }
 
-class WorkOrderLogCreate(BaseModel):
+class WorkOrderPage(BaseModel):
+    items: List[WorkOrderInDB]
+    next_cursor: Optional[str] = None  # 下一页游标，为空表示没有更多数据
+    total: Optional[int] = None  # 仅在 with_total=true 时返回
+
+class WorkOrderDelta(BaseModel):
+    """增量同步结果：自 modified_since 以来的变化"""
+    items: List[WorkOrderInDB]  # 新建或修改后仍满足筛选条件的工单，按 ID 排序
+    removed: List[int]  # 修改后不再满足筛选条件（如已归档）的工单 ID
+    deleted: List[int]  # 已删除的工单 ID
+    sync_time: str  # 下次同步时作为 modified_since 传入
+    reset: bool = False  # 变化过多未返回明细，需重新加载完整列表
+
+class WorkOrderBatchCreate(BaseModel):
+    # 逐条校验，单条数据不合法时只影响该条
+    items: List[Dict[str, Any]] = Field(..., min_length=1)
+
+class WorkOrderBatchItemResult(BaseModel):
+    index: int  # 在请求 items 中的位置
+    success: bool
+    id: Optional[int] = None
+    order_no: Optional[str] = None
+    error: Optional[str] = None
+
+class WorkOrderBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[WorkOrderBatchItemResult]
+
+class WorkOrderLogInDB(BaseModel):
+    id: int
     work_order_id: int
-    action: str
-    status_from: int
-    status_to: int
-    remark: str 
\ No newline at end of file
+    action: str  # created/assigned/status/updated/archived/deleted/compacted
+    status_from: Optional[int] = None
+    status_to: Optional[int] = None
+    operator: Optional[UserInfo] = None  # 为空表示系统或 API Token 操作
+    remark: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+        json_encoders = {
+            datetime: lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S") if dt else None
+        }
+
+class WorkOrderLogPage(BaseModel):
+    items: List[WorkOrderLogInDB]
+    next_cursor: Optional[str] = None  # 下一页游标，为空表示没有更多数据
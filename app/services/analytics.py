@@ -0,0 +1,368 @@
+import time
+from bisect import bisect_left
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Tuple
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+from app.models.models import WorkOrders, WorkOrderDurationStats
+from app.services.archive_store import all_orders_sql
+from app.services.statistics import full_day_range
+
+BUCKETS = WorkOrderDurationStats.BUCKETS
+
+# 分组方式对应的 SQL 表达式：(工单表, 处理时效统计表)
+GROUP_EXPRESSIONS = {
+    "none": ("NULL", "NULL"),
+    "problem_type": ("NULLIF(\"problem_type\", '')", "NULLIF(\"problem_type\", '')"),
+    "assignee": ("\"assigned_to_id\"", "NULLIF(\"assigned_to_id\", 0)"),
+    "day": ("date(\"created_at\")", "date(\"date\")"),
+}
+
+# 返回给前端的直方图上界（秒），必须是 BUCKETS 的子集，最后一个区间不设上界
+ASSIGN_HISTOGRAM = [300, 900, 1800, 3600, 7200, 14400, 28800, 86400]
+COMPLETE_HISTOGRAM = [3600, 7200, 14400, 28800, 86400, 172800, 259200, 604800]
+
+# 时效指标：(结束时间列, 未结束时计入超时的状态上限, 直方图)
+METRICS = {
+    "assign": ("assigned_time", 1, ASSIGN_HISTOGRAM),  # 签收耗时，新建状态的工单未签收
+    "complete": ("completed_at", 2, COMPLETE_HISTOGRAM),  # 完成耗时，新建和处理中的工单未完成
+}
+
+PERCENTILES = (50, 90, 99)
+
+# 耗时所在分桶的下标，与 WorkOrderDurationStats.entries 的分桶方式一致
+BUCKET_SQL = "CASE {} ELSE {} END".format(
+    " ".join(f"WHEN value <= {upper} THEN {index}" for index, upper in enumerate(BUCKETS)),
+    len(BUCKETS)
+)
+
+async def ensure_completed_at(db: BaseDBAsyncClient) -> None:
+    """
+    为已有数据库补充完成时间列，并从工单日志（或已完成工单的修改时间）回填
+
+    generate_schemas 只创建缺失的表，不会给已有表加列
+    """
+    if db.capabilities.dialect != "sqlite":
+        return
+    columns = await db.execute_query_dict('PRAGMA table_info("work_orders")')
+    if any(column["name"] == "completed_at" for column in columns):
+        return
+
+    await db.execute_script('ALTER TABLE "work_orders" ADD COLUMN "completed_at" TIMESTAMP')
+    await db.execute_query(
+        'UPDATE "work_orders" SET "completed_at" = COALESCE('
+        '(SELECT MIN("created_at") FROM "work_order_logs" AS l '
+        'WHERE l."work_order_id" = "work_orders"."id" AND l."action" = \'status\' AND l."status_to" = 2), '
+        'CASE WHEN "status" = 2 THEN "modified_at" END'
+        ') WHERE "status" >= 2'
+    )
+
+def durations_sql(columns: str, conditions: List[str]) -> str:
+    """
+    工单表和归档表中每个已签收/已完成指标一行的子查询，包含 columns、metric、value（耗时秒数）和 bucket
+
+    conditions 的参数需要按指标个数重复
+    """
+    selects = []
+    source = all_orders_sql()
+    for metric, column in WorkOrderDurationStats.METRICS.items():
+        where = " AND ".join(conditions + [f'"{column}" IS NOT NULL'])
+        selects.append(
+            f"SELECT {columns}, '{metric}' AS metric, "
+            f"strftime('%s', \"{column}\") - strftime('%s', \"created_at\") AS value "
+            f'FROM {source} WHERE {where}'
+        )
+    return f"SELECT *, {BUCKET_SQL} AS bucket FROM ({' UNION ALL '.join(selects)})"
+
+def build_filters(
+    status: Optional[int],
+    problem_type: Optional[str],
+    assigned_to: Optional[int],
+    order_no: Optional[str]
+) -> Tuple[List[str], List]:
+    """与统计接口相同的过滤条件（创建时间另行处理），返回条件列表和参数"""
+    conditions, params = [], []
+    if status is not None:
+        conditions.append('"status" = ?')
+        params.append(status)
+    if problem_type:
+        conditions.append('"problem_type" = ?')
+        params.append(problem_type)
+    if assigned_to is not None:
+        conditions.append('"assigned_to_id" = ?')
+        params.append(assigned_to)
+    if order_no:
+        conditions.append('"order_no" LIKE ?')
+        params.append(f"%{order_no}%")
+    return conditions, params
+
+def created_between(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    end_inclusive: bool = True,
+    column: str = '"created_at"'
+) -> Tuple[List[str], List]:
+    """创建时间范围条件（None 表示不限）"""
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f'{column} >= ?')
+        params.append(start.isoformat(" "))
+    if end is not None:
+        conditions.append(f'{column} <= ?' if end_inclusive else f'{column} < ?')
+        params.append(end.isoformat(" "))
+    return conditions, params
+
+async def raw_histograms(
+    db: BaseDBAsyncClient,
+    group_by: str,
+    conditions: List[str],
+    params: List
+) -> List[dict]:
+    """直接扫描工单表，按 (分组, 指标, 分桶) 汇总数量和耗时合计"""
+    subquery = durations_sql(f"{GROUP_EXPRESSIONS[group_by][0]} AS grp", conditions)
+    return await db.execute_query_dict(
+        f'SELECT grp, metric, bucket, COUNT(*) AS count, SUM(value) AS seconds '
+        f'FROM ({subquery}) GROUP BY grp, metric, bucket',
+        params * len(WorkOrderDurationStats.METRICS)
+    )
+
+async def rollup_histograms(
+    db: BaseDBAsyncClient,
+    group_by: str,
+    first_day: Optional[date],
+    last_day: Optional[date],
+    status: Optional[int],
+    problem_type: Optional[str],
+    assigned_to: Optional[int]
+) -> List[dict]:
+    """累加处理时效统计表中 [first_day, last_day] 的分桶（None 表示不限）"""
+    conditions, params = [], []
+    if first_day is not None:
+        conditions.append('"date" >= ?')
+        params.append(first_day.isoformat())
+    if last_day is not None:
+        conditions.append('"date" <= ?')
+        params.append(last_day.isoformat())
+    if status is not None:
+        conditions.append('"status" = ?')
+        params.append(status)
+    if problem_type:
+        conditions.append('"problem_type" = ?')
+        params.append(problem_type)
+    if assigned_to is not None:
+        conditions.append('"assigned_to_id" = ?')
+        params.append(assigned_to)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return await db.execute_query_dict(
+        f'SELECT {GROUP_EXPRESSIONS[group_by][1]} AS grp, "metric" AS metric, "bucket" AS bucket, '
+        f'SUM("count") AS count, SUM("seconds") AS seconds '
+        f'FROM "work_order_duration_stats" {where} GROUP BY 1, 2, 3',
+        params
+    )
+
+async def overdue_counts(
+    db: BaseDBAsyncClient,
+    metric: str,
+    group_by: str,
+    conditions: List[str],
+    params: List,
+    sla_seconds: int,
+    now: datetime
+) -> Dict:
+    """
+    尚未签收/完成且已超过时限的工单数，按分组返回
+
+    只按状态和创建时间判断，可以直接使用 (status, created_at) 索引，只需访问未结束的工单；
+    未结束的工单都在在用表中，不需要读取归档表
+    """
+    _, open_status, _ = METRICS[metric]
+    where = " AND ".join(conditions + [
+        '"status" < ?',
+        '"created_at" < ?',
+    ])
+    rows = await db.execute_query_dict(
+        f'SELECT {GROUP_EXPRESSIONS[group_by][0]} AS grp, COUNT(*) AS count '
+        f'FROM "work_orders" WHERE {where} GROUP BY 1',
+        [*params, open_status, (now - timedelta(seconds=sla_seconds)).isoformat(" ")]
+    )
+    return {row["grp"]: row["count"] for row in rows}
+
+def summarize(buckets: Dict[int, List[int]], histogram_edges: List[int], sla_seconds: int) -> dict:
+    """
+    由分桶计数计算数量、平均值、分位数、直方图和超时数
+
+    分位数按名次（nearest-rank）找到所在分桶后在桶内线性插值，超时数在 SLA 所在的桶内同样插值，
+    SLA 恰好是分桶上界时（如默认的 30 分钟、24 小时）结果是精确的
+    """
+    count = sum(bucket_count for bucket_count, _ in buckets.values())
+    total = sum(seconds for _, seconds in buckets.values())
+
+    def bounds(index: int) -> Tuple[int, Optional[int]]:
+        lower = BUCKETS[index - 1] if index > 0 else 0
+        upper = BUCKETS[index] if index < len(BUCKETS) else None
+        return lower, upper
+
+    percentiles = {}
+    for p in PERCENTILES:
+        rank = (count * p + 99) // 100
+        value, cumulative = None, 0
+        for index in sorted(buckets):
+            bucket_count, seconds = buckets[index]
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower, upper = bounds(index)
+                if upper is None:
+                    # 超过最后一个上界的桶用桶内平均值
+                    value = seconds / bucket_count
+                else:
+                    value = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                break
+            cumulative += bucket_count
+        percentiles[f"p{p}"] = None if value is None else round(value)
+
+    histogram = [0] * (len(histogram_edges) + 1)
+    breaches = 0.0
+    for index, (bucket_count, _) in buckets.items():
+        lower, upper = bounds(index)
+        # 直方图的上界都是分桶上界，分桶整体落在一个直方图区间内
+        histogram[len(histogram_edges) if upper is None else bisect_left(histogram_edges, upper)] += bucket_count
+        if lower >= sla_seconds or upper is None:
+            breaches += bucket_count
+        elif upper > sla_seconds:
+            breaches += bucket_count * (upper - sla_seconds) / (upper - lower)
+
+    return {
+        "count": count,
+        "avg": round(total / count) if count else None,
+        **percentiles,
+        "histogram": [
+            {"le": upper, "count": histogram[index]}
+            for index, upper in enumerate(histogram_edges + [None])
+        ],
+        "breaches": round(breaches),  # 已签收/已完成但超过时限
+    }
+
+async def resolution_analytics(
+    db: BaseDBAsyncClient,
+    group_by: str = "none",
+    sla_assign_seconds: int = 1800,
+    sla_complete_seconds: int = 86400,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[int] = None,
+    problem_type: Optional[str] = None,
+    assigned_to: Optional[int] = None,
+    order_no: Optional[str] = None
+) -> List[dict]:
+    """
+    按分组返回签收耗时和完成耗时的分布（单位：秒），创建时间范围为 [start, end]
+
+    整天的部分累加处理时效统计表，首尾不足一天的部分扫描工单表；
+    按工单编号模糊查询时无法使用统计表，全部扫描工单表
+    """
+    conditions, params = build_filters(status, problem_type, assigned_to, order_no)
+    date_conditions, date_params = created_between(start, end)
+
+    first_day, last_day = full_day_range(start, end)
+    rows = []
+    if order_no or (first_day is not None and last_day is not None and first_day > last_day):
+        rows.extend(await raw_histograms(db, group_by, conditions + date_conditions, params + date_params))
+    else:
+        rows.extend(await rollup_histograms(
+            db, group_by, first_day, last_day, status, problem_type, assigned_to
+        ))
+        if first_day is not None and start is not None and start < datetime.combine(first_day, dt_time.min):
+            edge_conditions, edge_params = created_between(start, datetime.combine(first_day, dt_time.min), False)
+            rows.extend(await raw_histograms(db, group_by, conditions + edge_conditions, params + edge_params))
+        if last_day is not None and end is not None:
+            next_day = datetime.combine(last_day + timedelta(days=1), dt_time.min)
+            if end >= next_day:
+                edge_conditions, edge_params = created_between(next_day, end)
+                rows.extend(await raw_histograms(db, group_by, conditions + edge_conditions, params + edge_params))
+
+    histograms: Dict = {}
+    for row in rows:
+        buckets = histograms.setdefault(row["grp"], {}).setdefault(row["metric"], {})
+        bucket = buckets.setdefault(row["bucket"], [0, 0])
+        bucket[0] += row["count"]
+        bucket[1] += row["seconds"]
+
+    # 日期条件加一元 + 不参与索引选择，让超时统计走 (status, created_at) 索引
+    overdue_conditions, overdue_params = created_between(start, end, column='+"created_at"')
+    now = datetime.now()
+    overdue = {
+        metric: await overdue_counts(
+            db, metric, group_by, conditions + overdue_conditions, params + overdue_params, sla, now
+        )
+        for metric, sla in (("assign", sla_assign_seconds), ("complete", sla_complete_seconds))
+    }
+
+    keys = set(histograms) | set(overdue["assign"]) | set(overdue["complete"])
+    return [
+        {
+            "key": key,
+            **{
+                metric: {
+                    **summarize(histograms.get(key, {}).get(metric, {}), METRICS[metric][2], sla),
+                    "overdue": overdue[metric].get(key, 0),  # 尚未签收/完成且已超过时限
+                }
+                for metric, sla in (("assign", sla_assign_seconds), ("complete", sla_complete_seconds))
+            }
+        }
+        for key in sorted(keys, key=lambda key: (key is None, str(key)))
+    ]
+
+async def reconcile_duration_stats(days: Optional[int] = None) -> dict:
+    """
+    从工单表重新计算最近 days 天（None 表示全部）的处理时效统计，返回修正的差异
+
+    与每日统计的对账方式相同，在一个事务内先删后插
+    """
+    started = time.perf_counter()
+    since = None if days is None else date.today() - timedelta(days=days - 1)
+    conditions = ['"created_at" >= ?'] if since else []
+    stats_filter = 'WHERE "date" >= ?' if since else ""
+    params = [since.isoformat()] if since else []
+    columns = '"date", "metric", "status", "problem_type", "assigned_to_id", "bucket", "count", "seconds"'
+
+    async with in_transaction("default") as connection:
+        before = await connection.execute_query_dict(
+            f'SELECT {columns} FROM "work_order_duration_stats" {stats_filter}', params
+        )
+        await connection.execute_query(f'DELETE FROM "work_order_duration_stats" {stats_filter}', params)
+        subquery = durations_sql(
+            'date("created_at") AS day, "status", COALESCE("problem_type", \'\') AS problem_type, '
+            'COALESCE("assigned_to_id", 0) AS assigned_to_id',
+            conditions
+        )
+        await connection.execute_query(
+            f'INSERT INTO "work_order_duration_stats" ({columns}) '
+            f'SELECT day, metric, "status", problem_type, assigned_to_id, bucket, COUNT(*), SUM(value) '
+            f'FROM ({subquery}) GROUP BY 1, 2, 3, 4, 5, 6',
+            params * len(WorkOrderDurationStats.METRICS)
+        )
+        after = await connection.execute_query_dict(
+            f'SELECT {columns} FROM "work_order_duration_stats" {stats_filter}', params
+        )
+
+    def as_dict(rows: List[dict]) -> Dict:
+        return {
+            (str(row["date"]), row["metric"], row["status"], row["problem_type"],
+             row["assigned_to_id"], row["bucket"]): (row["count"], row["seconds"])
+            for row in rows
+        }
+
+    old, new = as_dict(before), as_dict(after)
+    drift = sum(
+        abs(new.get(key, (0, 0))[0] - old.get(key, (0, 0))[0])
+        for key in set(old) | set(new)
+    )
+    return {
+        "rows": len(after),
+        "drift": drift,
+        "duration": round(time.perf_counter() - started, 3)
+    }
+
+async def ensure_duration_stats() -> None:
+    """处理时效统计表为空而已有签收过的工单时（如升级已有数据库）全量生成一次"""
+    if not await WorkOrderDurationStats.exists() and await WorkOrders.filter(assigned_time__isnull=False).exists():
+        await reconcile_duration_stats()
@@ -0,0 +1,112 @@
+"""
+已归档工单的冷存储
+
+归档任务把已归档（status=3）的工单从 work_orders 整行移到结构相同的 work_orders_archive，
+工单 ID 不变，日志和全文索引仍按 ID 关联。待处理的工单列表（status_lt=3）、签收和超时统计只访问
+在用表，其索引和扫描规模不再随历史工单增长；按 ID 读取、统计、导出和可能包含已归档工单的列表
+同时读取两张表。修改或删除已归档的工单时先把它移回在用表，沿用在用表的日志、统计和索引逻辑，
+之后由归档任务再次移出
+"""
+import asyncio
+from typing import List, Optional, Sequence, Type, Union
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+from tortoise.transactions import in_transaction
+from app.models.models import WorkOrders, WorkOrdersArchive
+
+ARCHIVE_TABLE = WorkOrdersArchive._meta.db_table
+
+# 每个事务移动的工单数量
+MOVE_CHUNK_SIZE = 1000
+
+OrderModel = Type[Union[WorkOrders, WorkOrdersArchive]]
+
+def order_columns() -> str:
+    """两张表共有的列（Tortoise 初始化后外键列才出现在投影中）"""
+    return ", ".join(f'"{column}"' for column in WorkOrders._meta.fields_db_projection.values())
+
+def all_orders_sql() -> str:
+    """在用和已归档工单的子查询，用于统计等直接拼接的 SQL：FROM {all_orders_sql()} WHERE ..."""
+    columns = order_columns()
+    return (
+        f'(SELECT {columns} FROM "{WorkOrders._meta.db_table}" '
+        f'UNION ALL SELECT {columns} FROM "{ARCHIVE_TABLE}")'
+    )
+
+def includes_archived(status: Optional[int] = None, status_lt: Optional[int] = None) -> bool:
+    """按状态筛选的条件是否可能包含已归档工单"""
+    if status is not None:
+        return status >= 3
+    if status_lt is not None:
+        return status_lt > 3
+    return True
+
+def order_models(status: Optional[int] = None, status_lt: Optional[int] = None) -> List[OrderModel]:
+    """满足状态条件的工单所在的表，在用表在前"""
+    return [WorkOrders, WorkOrdersArchive] if includes_archived(status, status_lt) else [WorkOrders]
+
+def order_querysets(
+    filters: Sequence[Q],
+    db: BaseDBAsyncClient,
+    status: Optional[int] = None,
+    status_lt: Optional[int] = None
+) -> List[QuerySet]:
+    """按相同条件查询各表"""
+    return [model.filter(*filters).using_db(db) for model in order_models(status, status_lt)]
+
+async def get_order(order_id: int, db: Optional[BaseDBAsyncClient] = None):
+    """按 ID 读取工单（含签收人），先查在用表，再查归档表"""
+    for model in (WorkOrders, WorkOrdersArchive):
+        query = model.filter(id=order_id)
+        if db is not None:
+            query = query.using_db(db)
+        order = await query.prefetch_related("assigned_to").first()
+        if order is not None:
+            return order
+    return None
+
+def _id_list(ids: Sequence[int]) -> str:
+    # ID 均为整数，直接拼接，避免超过 SQLite 的参数个数上限
+    return ",".join(str(int(order_id)) for order_id in ids)
+
+async def _move(source: str, target: str, ids: Sequence[int], connection: BaseDBAsyncClient) -> int:
+    columns = order_columns()
+    id_list = _id_list(ids)
+    await connection.execute_query(
+        f'INSERT INTO "{target}" ({columns}) SELECT {columns} FROM "{source}" WHERE "id" IN ({id_list})'
+    )
+    await connection.execute_query(f'DELETE FROM "{source}" WHERE "id" IN ({id_list})')
+    # 返回的修改行数包含变更计数触发器写入的行，changes() 只计本条语句删除的行
+    _, rows = await connection.execute_query('SELECT changes() AS "count"')
+    return rows[0]["count"]
+
+async def move_to_archive(ids: Sequence[int], connection: BaseDBAsyncClient) -> int:
+    """把在用表中的工单移到归档表，需在调用方的事务中执行，返回移动的数量"""
+    if not ids:
+        return 0
+    return await _move(WorkOrders._meta.db_table, ARCHIVE_TABLE, ids, connection)
+
+async def restore_archived_order(order_id: int, connection: Optional[BaseDBAsyncClient] = None) -> bool:
+    """把归档表中的工单移回在用表，以便修改或删除；不在归档表中时返回 False"""
+    if connection is None:
+        async with in_transaction("default") as connection:
+            return await restore_archived_order(order_id, connection)
+    return bool(await _move(ARCHIVE_TABLE, WorkOrders._meta.db_table, [order_id], connection))
+
+async def move_archived_orders(chunk_size: int = MOVE_CHUNK_SIZE) -> int:
+    """
+    把在用表中已归档的工单分批移到归档表，返回移动的数量
+
+    处理升级前已归档的工单，以及管理员修改后移回在用表的归档工单
+    """
+    moved = 0
+    while True:
+        async with in_transaction("default") as connection:
+            ids = await WorkOrders.filter(status=3).using_db(connection) \
+                .limit(chunk_size).values_list("id", flat=True)
+            if not ids:
+                return moved
+            moved += await move_to_archive(ids, connection)
+        # 批次之间让出事件循环和写锁
+        await asyncio.sleep(0)
@@ -0,0 +1,311 @@
+"""
+工单自动派单
+
+派单器只在持有自动派单租约的 worker 中运行（多 worker 时只有一个进程派单），
+该租约与定时任务的租约相互独立，关闭定时任务（SCHEDULER_ENABLED=false）的实例也参与竞选。在内存中维护两份状态：
+新建且未签收的工单按创建时间排序的优先队列，以及参与派单的坐席和各自处理中的工单数。
+选择坐席只在内存中进行，再按批次在一个事务内写入：每个坐席一条带条件的 UPDATE（工单仍为新建且未签收时才分配），
+RETURNING 返回实际分配成功的工单，与坐席手动签收同时发生时不会重复分配或覆盖对方的签收。
+
+成为主节点时和之后每隔 AUTO_DISPATCH_RESYNC_SECONDS 秒从数据库重建全部状态，
+期间完成的工单在重建时释放负载；其他 worker 新建的工单每隔 AUTO_DISPATCH_INTERVAL 秒按 ID 增量读取，
+本进程新建的工单立即唤醒派单
+"""
+import asyncio
+import heapq
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+from app.core.config import settings
+from app.models.models import (
+    DispatchAgent, WorkOrders, WorkOrderLogs, WorkOrderDailyStats, WorkOrderDurationStats
+)
+from app.services.events import event_broker
+from app.services.metrics import DISPATCHED_ORDERS
+from app.tasks.scheduler import LeaderScheduler
+
+# least_loaded: 处理中工单最少的坐席；round_robin: 按用户 ID 轮流；
+# skill: 优先擅长该问题类型的坐席，其次不限类型的坐席，都没有空闲时分配给其他空闲坐席，同类坐席中选负载最低的
+POLICIES = ("least_loaded", "round_robin", "skill")
+
+# 队列项：(创建时间, 工单 ID, 问题类型)，先创建的先分配
+QueueItem = Tuple[datetime, int, Optional[str]]
+
+class Agent:
+    """一个坐席的派单状态"""
+
+    __slots__ = ("user_id", "max_load", "skills", "load", "last")
+
+    def __init__(self, user_id: int, max_load: int, skills: Iterable[str], load: int = 0, last: int = 0):
+        self.user_id = user_id
+        self.max_load = max_load  # 0 表示不限
+        self.skills = frozenset(skills)
+        self.load = load  # 处理中的工单数
+        self.last = last  # 最近一次分配的序号，负载相同时先分配给等待最久的坐席
+
+    @property
+    def available(self) -> bool:
+        return not self.max_load or self.load < self.max_load
+
+class Dispatcher:
+    def __init__(
+        self,
+        policy: str = settings.AUTO_DISPATCH_POLICY,
+        max_load: int = settings.AUTO_DISPATCH_MAX_LOAD,
+        batch_size: int = settings.AUTO_DISPATCH_BATCH_SIZE,
+        interval: float = settings.AUTO_DISPATCH_INTERVAL,
+        resync_seconds: float = settings.AUTO_DISPATCH_RESYNC_SECONDS
+    ):
+        self.policy = policy
+        self.max_load = max_load
+        self.batch_size = batch_size
+        self.interval = interval
+        self.resync_seconds = resync_seconds
+        self.agents: Dict[int, Agent] = {}
+        self._agent_ids: List[int] = []  # 轮流分配的顺序
+        self._cursor = 0
+        self._sequence = 0
+        self._queue: List[QueueItem] = []
+        self._queued = set()
+        self._last_id = 0  # 已读入队列的最大工单 ID
+        self._loaded_at: Optional[float] = None  # 上次重建的时间（monotonic），为空表示需要重建
+        self._is_leader: Callable[[], bool] = lambda: True
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._queued)
+
+    def clear(self) -> None:
+        """丢弃内存中的状态，下次派单前从数据库重建"""
+        self.agents = {}
+        self._agent_ids = []
+        self._queue = []
+        self._queued = set()
+        self._last_id = 0
+        self._loaded_at = None
+
+    def notify(self) -> None:
+        """有新建的工单，立即派单"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def invalidate(self) -> None:
+        """坐席设置已修改，立即重建状态"""
+        self._loaded_at = None
+        self.notify()
+
+    async def rebuild(self) -> None:
+        """从数据库重建坐席、负载和待分配队列"""
+        rows = await DispatchAgent.filter(enabled=True, user__is_active=True).values("user_id", "max_load", "skills")
+        loads = dict(
+            await WorkOrders.filter(status=1, assigned_to_id__isnull=False)
+            .annotate(count=Count("id")).group_by("assigned_to_id").values_list("assigned_to_id", "count")
+        )
+        # 保留分配序号，重建后轮流和同负载时的先后顺序不变
+        self.agents = {
+            row["user_id"]: Agent(
+                row["user_id"],
+                self.max_load if row["max_load"] is None else row["max_load"],
+                row["skills"] or (),
+                loads.get(row["user_id"], 0),
+                self.agents[row["user_id"]].last if row["user_id"] in self.agents else 0
+            )
+            for row in rows
+        }
+        self._agent_ids = sorted(self.agents)
+        self._queue = []
+        self._queued = set()
+        self._last_id = 0
+        await self.load_orders()
+        self._loaded_at = time.monotonic()
+
+    async def load_orders(self) -> int:
+        """读入上次之后新建的工单，返回新加入队列的数量"""
+        rows = await WorkOrders.filter(
+            status=0, assigned_to_id__isnull=True, id__gt=self._last_id
+        ).order_by("id").values_list("id", "created_at", "problem_type")
+        added = 0
+        for order_id, created_at, problem_type in rows:
+            self._last_id = order_id
+            if order_id not in self._queued:
+                heapq.heappush(self._queue, (created_at, order_id, problem_type))
+                self._queued.add(order_id)
+                added += 1
+        return added
+
+    def choose(self, problem_type: Optional[str]) -> Optional[Agent]:
+        """按策略选择一个未满负载的坐席，都已满时返回 None"""
+        if self.policy == "round_robin":
+            count = len(self._agent_ids)
+            for step in range(count):
+                agent = self.agents[self._agent_ids[(self._cursor + step) % count]]
+                if agent.available:
+                    self._cursor = (self._cursor + step + 1) % count
+                    return agent
+            return None
+
+        candidates = [agent for agent in self.agents.values() if agent.available]
+        if self.policy == "skill" and candidates:
+            matched = [agent for agent in candidates if problem_type in agent.skills] if problem_type else []
+            candidates = matched or [agent for agent in candidates if not agent.skills] or candidates
+        return min(candidates, key=lambda agent: (agent.load, agent.last), default=None)
+
+    def plan(self) -> Dict[int, List[int]]:
+        """从队列中取出一批工单并选定坐席（预占负载），返回 {用户 ID: [工单 ID]}"""
+        planned: Dict[int, List[int]] = {}
+        count = 0
+        while self._queue and count < self.batch_size:
+            agent = self.choose(self._queue[0][2])
+            if agent is None:
+                break
+            _, order_id, _ = heapq.heappop(self._queue)
+            self._queued.discard(order_id)
+            agent.load += 1
+            self._sequence += 1
+            agent.last = self._sequence
+            planned.setdefault(agent.user_id, []).append(order_id)
+            count += 1
+        return planned
+
+    async def assign(self, planned: Dict[int, List[int]]) -> Dict[int, List[int]]:
+        """
+        在一个事务内写入分配结果、日志和统计，返回实际分配成功的 {用户 ID: [工单 ID]}
+
+        已被签收、修改或删除的工单不满足 UPDATE 的条件，不会分配
+        """
+        current_time = datetime.now()
+        timestamp = current_time.isoformat(" ")
+        assigned: Dict[int, List[int]] = {}
+        async with in_transaction("default") as connection:
+            for user_id, ids in planned.items():
+                # ID 均为整数，直接拼接，避免超过 SQLite 的参数个数上限
+                id_list = ",".join(str(int(order_id)) for order_id in ids)
+                _, rows = await connection.execute_query(
+                    'UPDATE "work_orders" SET "status" = 1, "assigned_to_id" = ?, "assigned_time" = ?, "modified_at" = ? '
+                    f'WHERE "id" IN ({id_list}) AND "status" = 0 AND "assigned_to_id" IS NULL RETURNING "id"',
+                    [user_id, timestamp, timestamp]
+                )
+                if rows:
+                    assigned[user_id] = [row["id"] for row in rows]
+
+            ids = [order_id for order_ids in assigned.values() for order_id in order_ids]
+            if not ids:
+                return assigned
+            rows = await WorkOrders.filter(id__in=ids).using_db(connection).values(
+                "id", "created_at", "status", "problem_type", "solution_type", "assigned_to_id",
+                "assigned_time", "completed_at"
+            )
+            deltas = Counter()
+            duration_deltas = {}
+            for row in rows:
+                old = {**row, "status": 0, "assigned_to_id": None, "assigned_time": None}
+                deltas[WorkOrderDailyStats.key(old)] -= 1
+                deltas[WorkOrderDailyStats.key(row)] += 1
+                WorkOrderDurationStats.add_transition(duration_deltas, old, row)
+            await WorkOrderDailyStats.adjust(deltas, connection)
+            await WorkOrderDurationStats.adjust(duration_deltas, connection)
+            await WorkOrderLogs.bulk_create([
+                WorkOrderLogs.build(
+                    current_time,
+                    work_order_id=order_id,
+                    action="assigned",
+                    status_from=0,
+                    status_to=1,
+                    remark="自动派单"
+                )
+                for order_id in ids
+            ], using_db=connection)
+        return assigned
+
+    async def dispatch_once(self) -> Optional[int]:
+        """分配一批工单，返回分配成功的数量；没有待分配的工单或空闲坐席时返回 None"""
+        planned = self.plan()
+        if not planned:
+            return None
+        try:
+            assigned = await self.assign(planned)
+        except Exception:
+            # 预占的负载和取出的工单已不准确，下次派单前重建
+            self._loaded_at = None
+            raise
+
+        count = 0
+        for user_id, ids in planned.items():
+            done = len(assigned.get(user_id, ()))
+            # 未分配成功的工单已由他人处理，归还预占的负载
+            self.agents[user_id].load -= len(ids) - done
+            count += done
+        if count:
+            DISPATCHED_ORDERS.inc(self.policy, amount=count)
+            # 一批只推送一个事件，客户端据此刷新列表和“我的工单”
+            event_broker.publish("dispatched", {
+                "assignments": [
+                    {"id": order_id, "assigned_to": user_id}
+                    for user_id, ids in assigned.items() for order_id in ids
+                ]
+            })
+        return count
+
+    async def run_once(self) -> int:
+        """同步队列后分配到没有待分配的工单或空闲坐席为止，返回分配的数量"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.resync_seconds:
+            await self.rebuild()
+        else:
+            await self.load_orders()
+        total = 0
+        while True:
+            count = await self.dispatch_once()
+            if count is None:
+                return total
+            total += count
+            # 批次之间让出事件循环和写锁
+            await asyncio.sleep(0)
+
+    async def _loop(self) -> None:
+        while self._running:
+            try:
+                if self._is_leader():
+                    await self.run_once()
+                elif self._loaded_at is not None:
+                    # 已不是主节点，由新的主节点接管
+                    self.clear()
+            except Exception as e:
+                self._loaded_at = None
+                print(f"[{datetime.now()}] 自动派单失败：{str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, is_leader: Callable[[], bool]) -> None:
+        """开始派单，is_leader 返回本进程是否为派单主节点"""
+        if self.policy not in POLICIES:
+            raise ValueError(f"未知的派单策略：{self.policy}，可选 {', '.join(POLICIES)}")
+        if self._task is None:
+            self._is_leader = is_leader
+            self._wakeup = asyncio.Event()
+            self._running = True
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # 不取消任务：取消与唤醒同时发生时会被 wait_for 忽略，改为通知循环在本轮结束后退出
+        self._running = False
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        self._wakeup = None
+        self.clear()
+
+dispatcher = Dispatcher()
+
+# 自动派单主节点的租约，多个 worker 中只有持有者派单
+dispatch_leader = LeaderScheduler([], lease_name="dispatch", title="自动派单")
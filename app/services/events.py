@@ -0,0 +1,212 @@
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.database import get_read_db
+from app.models.models import ChangeVersion, WorkOrderEvent, WorkOrders
+from app.services.sync import WORK_ORDERS
+from app.schemas.work_order import WorkOrderInDB
+
+# 状态变化类事件只推送列表展示需要的字段，新建事件推送完整工单
+DELTA_FIELDS = {
+    "id", "order_no", "status", "problem_type", "solution_type",
+    "assigned_to", "assigned_time", "modified_at"
+}
+
+def order_payload(order: WorkOrders, full: bool = False) -> dict:
+    """按接口返回的格式序列化工单（时间格式与列表接口一致）"""
+    include = None if full else DELTA_FIELDS
+    return WorkOrderInDB.model_validate(order).model_dump(mode="json", include=include)
+
+def encode_event(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def format_event(event_id: str, body: str) -> str:
+    """SSE 报文格式，body 为 encode_event 得到的 JSON"""
+    return f"id: {event_id}\ndata: {body}\n\n"
+
+class Subscriber:
+    """一个事件流连接，队列有上限，消费过慢时会被断开"""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def close(self):
+        # 丢弃积压的事件并放入结束标记，客户端重连后凭 Last-Event-ID 补齐
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class EventBroker:
+    """
+    工单事件广播
+
+    未调用 start() 时只在本进程内广播，事件编号为 "启动时间戳-序号"。
+    start() 之后发布的事件先写入 work_order_events 表，每个 worker 按序号读取新事件并推送给本进程的连接，
+    事件编号为 "数据库 epoch-表中序号"，各 worker 一致，客户端重连到其他 worker 也能续传；
+    其他进程发布的事件最多延迟 poll_interval 秒。
+    最近的事件保存在环形缓冲区中用于断线续传；数据库重建或事件已滚出缓冲区时，
+    向客户端发送 reset 事件让其重新加载列表
+    """
+
+    def __init__(self, buffer_size: int, queue_size: int, poll_interval: float = settings.EVENT_POLL_INTERVAL):
+        self._epoch = str(int(time.time()))
+        self._seq = 0
+        self._buffer: Deque[Tuple[int, str]] = deque(maxlen=buffer_size)
+        self._queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self.poll_interval = poll_interval
+        # 本进程已发布、尚未写入数据库的事件
+        self._outbox: List[str] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def last_event_id(self) -> str:
+        return f"{self._epoch}-{self._seq}"
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data: dict) -> None:
+        """发布事件：转发已启动时交给后台任务写入数据库，否则直接投递给本进程的连接"""
+        body = encode_event({"type": event_type, **data})
+        if self._task is None:
+            self._deliver(self._seq + 1, body)
+            return
+        self._outbox.append(body)
+        self._wakeup.set()
+
+    def _deliver(self, seq: int, body: str) -> None:
+        """记入缓冲区并投递给所有连接"""
+        self._seq = seq
+        message = format_event(self.last_event_id, body)
+        self._buffer.append((seq, message))
+
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._subscribers.discard(subscriber)
+                subscriber.close()
+
+    async def relay(self) -> None:
+        """写入本进程发布的事件，再读取所有 worker 写入的新事件并推送"""
+        written = bool(self._outbox)
+        if written:
+            outbox, self._outbox = self._outbox, []
+            try:
+                await WorkOrderEvent.bulk_create([WorkOrderEvent(data=body) for body in outbox])
+            except Exception:
+                # 写入失败时放回，下次重试
+                self._outbox[:0] = outbox
+                raise
+
+        rows = await WorkOrderEvent.filter(id__gt=self._seq).using_db(get_read_db()).order_by("id").values_list("id", "data")
+        for seq, body in rows:
+            self._deliver(seq, body)
+
+        if written:
+            # 只保留断线续传需要的最近事件，最新的一行始终保留，序号不会重复使用
+            await WorkOrderEvent.filter(id__lte=self._seq - self._buffer.maxlen).delete()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # 停止前最后一轮仍写入本进程尚未写入的事件
+            running = self._running
+            try:
+                await self.relay()
+            except Exception as e:
+                print(f"[{datetime.now()}] 转发工单事件失败：{str(e)}")
+            if not running:
+                break
+
+    async def start(self) -> None:
+        """开始经数据库在各 worker 间转发事件，需在 ensure_change_tracking 之后调用"""
+        if self._task is not None:
+            return
+        epochs = await ChangeVersion.filter(name=WORK_ORDERS).values_list("epoch", flat=True)
+        if not epochs:
+            # 未启用变更跟踪（非 SQLite）时没有数据库 epoch，保持进程内广播
+            return
+        rows = await WorkOrderEvent.all().order_by("-id").limit(self._buffer.maxlen).values_list("id", "data")
+        self._epoch = epochs[0]
+        self._seq = rows[0][0] if rows else 0
+        self._buffer.clear()
+        for seq, body in reversed(rows):
+            self._buffer.append((seq, format_event(f"{self._epoch}-{seq}", body)))
+        self._wakeup = asyncio.Event()
+        self._running = True
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        """停止转发，并写入本进程尚未写入的事件"""
+        if self._task is None:
+            return
+        # 不取消任务：取消与唤醒同时发生时会被 wait_for 忽略，改为通知循环写完最后一轮后退出
+        self._running = False
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def replay(self, last_event_id: Optional[str]) -> Optional[List[str]]:
+        """返回 last_event_id 之后的事件，无法续传时返回 None"""
+        if not last_event_id:
+            return []
+        try:
+            epoch, seq = last_event_id.rsplit("-", 1)
+            seq = int(seq)
+        except ValueError:
+            return None
+        if epoch != self._epoch or seq > self._seq:
+            return None
+        if seq < self._seq and (not self._buffer or self._buffer[0][0] > seq + 1):
+            return None
+        return [message for event_seq, message in self._buffer if event_seq > seq]
+
+    async def stream(
+        self,
+        last_event_id: Optional[str] = None,
+        heartbeat: float = settings.EVENT_HEARTBEAT_INTERVAL
+    ) -> AsyncIterator[str]:
+        """单个连接的事件流：先补发错过的事件，然后持续推送新事件"""
+        subscriber = Subscriber(self._queue_size)
+        self._subscribers.add(subscriber)
+        # 订阅与取积压事件之间没有 await，不会漏发或重发
+        backlog = self.replay(last_event_id)
+        try:
+            yield f"retry: {settings.EVENT_RETRY_MS}\n\n"
+
+            if backlog is None:
+                yield format_event(self.last_event_id, encode_event({"type": "reset"}))
+            else:
+                for message in backlog:
+                    yield message
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # 注释行作为心跳，防止代理断开空闲连接
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self._subscribers.discard(subscriber)
+
+event_broker = EventBroker(
+    buffer_size=settings.EVENT_BUFFER_SIZE,
+    queue_size=settings.EVENT_QUEUE_SIZE
+)
@@ -0,0 +1,195 @@
+"""
+业务指标和多 worker 汇总
+
+每个 worker 每隔 METRICS_FLUSH_INTERVAL 秒把本进程的指标快照写入 metrics_snapshots 表（每个进程一行），
+/metrics 把本进程的实时快照与其他 worker 最近写入的快照相加后输出，其他 worker 的数据最多延迟一个间隔。
+worker 退出时把自己的计数并入 retired 行，异常退出的 worker 由定时任务归并，计数不会因进程重启而回退；
+当前值类指标（正在处理的请求数、哈希排队数等）只合计最近仍在上报的 worker
+"""
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.core.config import settings
+from app.core.database import get_read_db
+from app.core.metrics import (
+    REGISTRY, Counter, Gauge, Histogram, Registry, Snapshot, decode_snapshot, encode_snapshot
+)
+
+RETIRED_WORKER = "retired"
+LIVE_FACTOR = 3  # 超过该倍数的上报间隔未更新的 worker 不再计入当前值
+FOLD_AFTER = timedelta(minutes=10)  # 超过该时间未更新的 worker 视为已退出，计数并入 retired 行
+
+WORK_ORDERS_CREATED = Counter("helpdesk_work_orders_created_total", "新建工单数", ("source",))
+ARCHIVED_ORDERS = Counter("helpdesk_archived_orders_total", "归档的工单数")
+DISPATCHED_ORDERS = Counter("helpdesk_dispatched_orders_total", "自动派单分配的工单数", ("policy",))
+DISPATCH_QUEUE = Gauge("helpdesk_dispatch_queue_depth", "等待自动派单的工单数")
+JOB_RUNS = Counter("helpdesk_scheduled_job_runs_total", "定时任务运行次数", ("job", "status"))
+JOB_DURATION = Histogram(
+    "helpdesk_scheduled_job_duration_seconds", "定时任务耗时", ("job",),
+    (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+)
+PASSWORD_HASH_QUEUE = Gauge("helpdesk_password_hash_queue_depth", "排队或计算中的密码哈希数")
+EVENT_SUBSCRIBERS = Gauge("helpdesk_event_subscribers", "工单事件流连接数")
+CACHE_REQUESTS = Counter("helpdesk_cache_requests_total", "缓存查找次数", ("cache", "result"))
+CACHE_HIT_RATIO = Gauge("helpdesk_cache_hit_ratio", "缓存命中率（各 worker 合计）", ("cache",))
+METRICS_WORKERS = Gauge("helpdesk_metrics_workers", "最近仍在上报指标的 worker 数")
+
+def collect_runtime() -> None:
+    """采集其他模块维护的计数"""
+    from app.api.deps import user_cache
+    from app.core import security
+    from app.services.dispatch import dispatcher
+    from app.services.events import event_broker
+    from app.services.reference_data import problem_type_cache, solution_type_cache
+
+    PASSWORD_HASH_QUEUE.set(security.hash_queue_depth)
+    EVENT_SUBSCRIBERS.set(event_broker.subscriber_count)
+    DISPATCH_QUEUE.set(dispatcher.queue_size)
+    for name, cache in (("users", user_cache), ("problem_types", problem_type_cache), ("solution_types", solution_type_cache)):
+        CACHE_REQUESTS.set_total(cache.hits, name, "hit")
+        CACHE_REQUESTS.set_total(cache.misses, name, "miss")
+
+REGISTRY.add_collector(collect_runtime)
+
+def _now() -> str:
+    # 与其他表一致，存不带时区的本地时间
+    return datetime.now().isoformat(" ")
+
+def _dump(snapshot: Snapshot) -> str:
+    return json.dumps(encode_snapshot(snapshot), separators=(",", ":"))
+
+class MetricsPublisher:
+    """定期写入本进程的指标快照，并汇总所有 worker 的快照"""
+
+    def __init__(self, registry: Registry = REGISTRY, interval: float = settings.METRICS_FLUSH_INTERVAL):
+        self.registry = registry
+        self.interval = interval
+        self.worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 已并入 retired 行的部分，之后写入的快照需减去
+        self._base: Snapshot = {}
+        self._published: Optional[Snapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def local_snapshot(self) -> Snapshot:
+        return self.registry.subtract(self.registry.snapshot(), self._base)
+
+    async def flush(self) -> None:
+        """写入本进程的快照"""
+        db = Tortoise.get_connection("default")
+        snapshot = self.local_snapshot()
+        changed, _ = await db.execute_query(
+            'UPDATE "metrics_snapshots" SET "updated_at" = ?, "data" = ? WHERE "worker" = ?',
+            [_now(), _dump(snapshot), self.worker]
+        )
+        if not changed:
+            if self._published is not None:
+                # 本进程长时间未能上报，已被当作退出的 worker 归并，已写入的部分不再重复计入
+                self._base = self.registry.merge([(self._base, False), (self._published, False)])
+                snapshot = self.local_snapshot()
+            await db.execute_query(
+                'INSERT INTO "metrics_snapshots" ("worker", "updated_at", "data") VALUES (?, ?, ?)',
+                [self.worker, _now(), _dump(snapshot)]
+            )
+        self._published = snapshot
+
+    async def collect(self) -> Snapshot:
+        """本进程的实时快照加上其他 worker 最近写入的快照"""
+        live_after = (datetime.now() - timedelta(seconds=self.interval * LIVE_FACTOR)).isoformat(" ")
+        _, rows = await get_read_db().execute_query(
+            'SELECT "data", "worker" != ? AND "updated_at" >= ? AS "live" FROM "metrics_snapshots" WHERE "worker" != ?',
+            [RETIRED_WORKER, live_after, self.worker]
+        )
+        snapshots = [(self.local_snapshot(), True)]
+        snapshots.extend((decode_snapshot(json.loads(row["data"])), bool(row["live"])) for row in rows)
+        merged = self.registry.merge(snapshots)
+
+        merged[METRICS_WORKERS.name] = {(): sum(1 for _, live in snapshots if live)}
+        lookups = merged[CACHE_REQUESTS.name]
+        ratios = merged[CACHE_HIT_RATIO.name] = {}
+        for (cache, result), hits in lookups.items():
+            if result == "hit":
+                total = hits + lookups.get((cache, "miss"), 0)
+                ratios[(cache,)] = round(hits / total, 4) if total else 0.0
+        return merged
+
+    async def render(self) -> str:
+        return self.registry.render(await self.collect())
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[{datetime.now()}] 写入运行指标失败：{str(e)}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        """停止上报，并把本进程的计数并入 retired 行"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush()
+            await fold_snapshots([self.worker], registry=self.registry)
+        except Exception as e:
+            print(f"[{datetime.now()}] 归并运行指标失败：{str(e)}")
+
+async def fold_snapshots(
+    workers: Optional[List[str]] = None,
+    older_than: timedelta = FOLD_AFTER,
+    registry: Registry = REGISTRY
+) -> int:
+    """把指定的或超过 older_than 未更新的 worker 的计数并入 retired 行并删除这些行，返回归并的行数"""
+    async with in_transaction("default") as connection:
+        if workers is None:
+            cutoff = (datetime.now() - older_than).isoformat(" ")
+            _, rows = await connection.execute_query(
+                'SELECT "worker", "data" FROM "metrics_snapshots" WHERE "worker" != ? AND "updated_at" < ?',
+                [RETIRED_WORKER, cutoff]
+            )
+        else:
+            _, rows = await connection.execute_query(
+                f'SELECT "worker", "data" FROM "metrics_snapshots" WHERE "worker" IN ({",".join("?" * len(workers))})',
+                workers
+            )
+        if not rows:
+            return 0
+        _, retired = await connection.execute_query(
+            'SELECT "data" FROM "metrics_snapshots" WHERE "worker" = ?', [RETIRED_WORKER]
+        )
+        merged = registry.merge(
+            (decode_snapshot(json.loads(row["data"])), False) for row in list(retired) + list(rows)
+        )
+        await connection.execute_query(
+            'INSERT INTO "metrics_snapshots" ("worker", "updated_at", "data") VALUES (?, ?, ?) '
+            'ON CONFLICT ("worker") DO UPDATE SET "updated_at" = excluded."updated_at", "data" = excluded."data"',
+            [RETIRED_WORKER, _now(), _dump(merged)]
+        )
+        names = [row["worker"] for row in rows]
+        await connection.execute_query(
+            f'DELETE FROM "metrics_snapshots" WHERE "worker" IN ({",".join("?" * len(names))})', names
+        )
+    return len(rows)
+
+async def fold_stale_metrics():
+    """定时归并已退出的 worker 的指标"""
+    count = await fold_snapshots()
+    if count:
+        print(f"[{datetime.now()}] 运行指标归并：合并了 {count} 个已退出 worker 的计数")
+
+metrics_publisher = MetricsPublisher()
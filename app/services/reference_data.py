@@ -0,0 +1,74 @@
+import hashlib
+import json
+import time
+from typing import FrozenSet, List, NamedTuple, Optional, Type
+from tortoise.models import Model
+from app.core.config import settings
+from app.models.models import ProblemType, SolutionType
+
+class NameSnapshot(NamedTuple):
+    names: List[str]  # 按创建顺序
+    name_set: FrozenSet[str]
+    etag: str
+
+class NameListCache:
+    """
+    问题类型、解决方案类型这类很少变化的名称列表的进程内缓存
+
+    本进程的新增和删除接口调用 bump() 使缓存立即失效；其他 worker 的修改
+    最迟在 ttl 秒后重新加载。ETag 由名称列表的内容计算，各 worker 内容相同时 ETag 相同
+    """
+
+    def __init__(self, model: Type[Model], ttl: float):
+        self.model = model
+        self.ttl = ttl
+        self.version = 0  # 每次新增、删除加一
+        self.hits = 0
+        self.misses = 0
+        self._snapshot: Optional[NameSnapshot] = None
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_version == self.version and time.monotonic() - self._loaded_at < self.ttl
+
+    def bump(self) -> None:
+        self.version += 1
+
+    async def _load(self) -> NameSnapshot:
+        version = self.version
+        names = await self.model.all().order_by("id").values_list("name", flat=True)
+        digest = hashlib.sha1(json.dumps(names, ensure_ascii=False).encode("utf-8")).hexdigest()
+        self._snapshot = NameSnapshot(names, frozenset(names), f'"{self.model._meta.db_table}-{digest[:16]}"')
+        # 加载期间又有修改时保持失效，下次再加载
+        self._loaded_version = version
+        self._loaded_at = time.monotonic()
+        return self._snapshot
+
+    async def get(self) -> NameSnapshot:
+        if self._is_fresh():
+            self.hits += 1
+            return self._snapshot
+        # 表很小，失效瞬间的并发请求各自加载一次即可
+        self.misses += 1
+        return await self._load()
+
+    async def contains(self, name: str) -> bool:
+        """名称是否存在；缓存中没有时重新加载一次，其他 worker 刚新增的名称也能立即使用"""
+        if name in (await self.get()).name_set:
+            return True
+        self.bump()
+        return name in (await self.get()).name_set
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "size": len(self._snapshot.names) if self._snapshot else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+problem_type_cache = NameListCache(ProblemType, ttl=settings.REFERENCE_CACHE_TTL)
+solution_type_cache = NameListCache(SolutionType, ttl=settings.REFERENCE_CACHE_TTL)
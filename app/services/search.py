@@ -0,0 +1,152 @@
+"""
+工单全文检索
+
+基于 SQLite FTS5。中文没有分词边界，写入索引前先把连续的汉字切成
+重叠的二字词（如 "打印机" -> "打印 印机 机"），英文和数字按词保留，
+再交给 unicode61 分词器，这样两个字的关键词也能命中
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+FTS_TABLE = "work_orders_fts"
+
+# 参与全文检索的工单字段
+SEARCH_FIELDS = ("problem_desc", "location", "processing_desc")
+
+_TOKEN_RE = re.compile(r"[㐀-鿿豈-﫿]+|[0-9A-Za-z]+")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+
+def _is_cjk(token: str) -> bool:
+    return bool(_CJK_RE.match(token))
+
+def segment(text: Optional[str]) -> str:
+    """把文本切分为写入索引的词，汉字额外保留末字以支持单字前缀检索"""
+    if not text:
+        return ""
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if _is_cjk(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return " ".join(tokens)
+
+def build_match_query(q: str) -> Optional[str]:
+    """把用户输入转换为 FTS5 MATCH 表达式，所有词都需命中"""
+    terms = []
+    for run in _TOKEN_RE.findall(q):
+        if _is_cjk(run) and len(run) > 1:
+            terms.extend(f'"{run[i:i + 2]}"' for i in range(len(run) - 1))
+        else:
+            # 单个汉字或英文数字按前缀匹配
+            terms.append(f'"{run}"*')
+    return " ".join(terms) or None
+
+def _is_sqlite(db: BaseDBAsyncClient) -> bool:
+    return db.capabilities.dialect == "sqlite"
+
+async def ensure_search_index(db: Optional[BaseDBAsyncClient] = None) -> None:
+    """创建全文索引表（已存在时跳过）"""
+    db = db or connections.get("default")
+    if not _is_sqlite(db):
+        return
+    await db.execute_script(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" '
+        f'USING fts5({", ".join(SEARCH_FIELDS)}, tokenize="unicode61")'
+    )
+
+async def index_work_order(order, db: BaseDBAsyncClient, created: bool = False) -> None:
+    """写入或更新一条工单的索引"""
+    if not _is_sqlite(db):
+        return
+    if not created:
+        await db.execute_query(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = ?', [order.id])
+    await db.execute_query(
+        f'INSERT INTO "{FTS_TABLE}" (rowid, {", ".join(SEARCH_FIELDS)}) VALUES (?, ?, ?, ?)',
+        [order.id, *(segment(getattr(order, field)) for field in SEARCH_FIELDS)]
+    )
+
+async def index_work_orders(orders, db: BaseDBAsyncClient) -> None:
+    """批量写入新建工单的索引"""
+    if not _is_sqlite(db) or not orders:
+        return
+    await db.execute_many(
+        f'INSERT INTO "{FTS_TABLE}" (rowid, {", ".join(SEARCH_FIELDS)}) VALUES (?, ?, ?, ?)',
+        [[order.id, *(segment(getattr(order, field)) for field in SEARCH_FIELDS)] for order in orders]
+    )
+
+async def remove_work_order(order_id: int, db: BaseDBAsyncClient) -> None:
+    """删除一条工单的索引"""
+    if not _is_sqlite(db):
+        return
+    await db.execute_query(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = ?', [order_id])
+
+def _match_sql(match: str, candidates: Optional[Sequence[str]]) -> Tuple[str, list]:
+    sql = f'FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH ?'
+    if candidates:
+        sql += f' AND rowid IN ({" UNION ALL ".join(candidates)})'
+    return sql, [match]
+
+async def search_work_order_ids(
+    q: str,
+    db: BaseDBAsyncClient,
+    candidates: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0
+) -> List[int]:
+    """
+    按相关度（bm25）返回匹配的工单 id
+
+    candidates 为其他筛选条件对应的工单 id 子查询（每张表一条），与全文检索在同一条 SQL 中取交集，
+    limit、offset 只用于分页，不会截断交集
+    """
+    match = build_match_query(q)
+    if not match or not _is_sqlite(db):
+        return []
+    sql, params = _match_sql(match, candidates)
+    sql = f"SELECT rowid AS id {sql} ORDER BY rank"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    rows = await db.execute_query_dict(sql, params)
+    return [row["id"] for row in rows]
+
+async def count_work_order_matches(q: str, db: BaseDBAsyncClient, candidates: Optional[Sequence[str]] = None) -> int:
+    """满足筛选条件且匹配检索词的工单数"""
+    match = build_match_query(q)
+    if not match or not _is_sqlite(db):
+        return 0
+    sql, params = _match_sql(match, candidates)
+    rows = await db.execute_query_dict(f'SELECT count(*) AS "count" {sql}', params)
+    return rows[0]["count"]
+
+async def rebuild_search_index(db: BaseDBAsyncClient, batch_size: int = 1000) -> int:
+    """清空并重建全文索引，返回写入的工单数"""
+    await db.execute_script(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+    await ensure_search_index(db)
+
+    indexed = 0
+    # 已归档的工单移到归档表后 ID 不变，同样可以检索
+    for table in ("work_orders", "work_orders_archive"):
+        # 升级后尚未启动过服务的数据库还没有归档表
+        if not await db.execute_query_dict("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [table]):
+            continue
+        last_id = 0
+        while True:
+            rows = await db.execute_query_dict(
+                f'SELECT id, {", ".join(SEARCH_FIELDS)} FROM "{table}" '
+                f'WHERE id > ? ORDER BY id LIMIT ?',
+                [last_id, batch_size]
+            )
+            if not rows:
+                break
+            await db.execute_many(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, {", ".join(SEARCH_FIELDS)}) VALUES (?, ?, ?, ?)',
+                [[row["id"], *(segment(row[field]) for field in SEARCH_FIELDS)] for row in rows]
+            )
+            indexed += len(rows)
+            last_id = rows[-1]["id"]
+    return indexed
@@ -0,0 +1,159 @@
+import time
+from collections import Counter
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import List, Optional, Tuple
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.functions import Count, Sum
+from tortoise.transactions import in_transaction
+from app.models.models import WorkOrders, WorkOrderDailyStats
+from app.services.archive_store import all_orders_sql, order_models
+
+def full_day_range(
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> Tuple[Optional[date], Optional[date]]:
+    """
+    返回 [start, end] 内完整覆盖的第一天和最后一天（None 表示不限）
+
+    结束时间精确到秒，23:59:59 视为覆盖当天
+    """
+    first_day = None
+    if start is not None:
+        first_day = start.date() if start.time() == dt_time.min else start.date() + timedelta(days=1)
+    last_day = None
+    if end is not None:
+        last_day = end.date() if end.time() >= dt_time(23, 59, 59) else end.date() - timedelta(days=1)
+    return first_day, last_day
+
+async def raw_buckets(queries, start: Optional[datetime], end: Optional[datetime]) -> Counter:
+    """直接扫描工单表（及归档表）统计 [start, end) 内的工单（None 表示不限），键为 (状态, 问题类型)"""
+    buckets = Counter()
+    for query in queries:
+        if start is not None:
+            query = query.filter(created_at__gte=start)
+        if end is not None:
+            query = query.filter(created_at__lt=end)
+        rows = await query.annotate(
+            count=Count("id")
+        ).group_by("status", "problem_type").values("status", "problem_type", "count")
+        for row in rows:
+            buckets[(row["status"], row["problem_type"] or None)] += row["count"]
+    return buckets
+
+async def count_buckets(
+    db: BaseDBAsyncClient,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[int] = None,
+    problem_type: Optional[str] = None,
+    assigned_to: Optional[int] = None,
+    order_no: Optional[str] = None
+) -> Counter:
+    """
+    按 (状态, 问题类型) 统计创建时间在 [start, end] 内的工单数
+
+    整天的部分累加每日统计表，首尾不足一天的部分扫描工单表（可能包含已归档工单时同时扫描归档表）；
+    按工单编号模糊查询时无法使用统计表，全部扫描工单表
+    """
+    filters = {}
+    if status is not None:
+        filters["status"] = status
+    if problem_type:
+        filters["problem_type"] = problem_type
+    if assigned_to is not None:
+        filters["assigned_to_id"] = assigned_to
+    queries = [model.filter(**filters).using_db(db) for model in order_models(status)]
+
+    if order_no:
+        queries = [query.filter(order_no__icontains=order_no) for query in queries]
+        if end is not None:
+            queries = [query.filter(created_at__lte=end) for query in queries]
+        return await raw_buckets(queries, start, None)
+
+    first_day, last_day = full_day_range(start, end)
+    if first_day is not None and last_day is not None and first_day > last_day:
+        # 不足一整天，直接扫描
+        return await raw_buckets([query.filter(created_at__lte=end) for query in queries], start, None)
+
+    buckets = Counter()
+
+    # 整天部分：累加每日统计
+    stats = WorkOrderDailyStats.all().using_db(db)
+    if first_day is not None:
+        stats = stats.filter(date__gte=first_day)
+    if last_day is not None:
+        stats = stats.filter(date__lte=last_day)
+    if status is not None:
+        stats = stats.filter(status=status)
+    if problem_type:
+        stats = stats.filter(problem_type=problem_type)
+    if assigned_to is not None:
+        stats = stats.filter(assigned_to_id=assigned_to)
+    rows = await stats.annotate(
+        total=Sum("count")
+    ).group_by("status", "problem_type").values("status", "problem_type", "total")
+    for row in rows:
+        buckets[(row["status"], row["problem_type"] or None)] += row["total"]
+
+    # 首尾不足一天的部分：扫描工单表
+    if first_day is not None and start is not None and start < datetime.combine(first_day, dt_time.min):
+        buckets.update(await raw_buckets(queries, start, datetime.combine(first_day, dt_time.min)))
+    if last_day is not None and end is not None:
+        next_day = datetime.combine(last_day + timedelta(days=1), dt_time.min)
+        if end >= next_day:
+            buckets.update(await raw_buckets([query.filter(created_at__lte=end) for query in queries], next_day, None))
+
+    return +buckets
+
+async def reconcile_daily_stats(days: Optional[int] = None) -> dict:
+    """
+    从工单表和归档表重新计算最近 days 天（None 表示全部）的每日统计，返回修正的差异
+
+    在一个事务内先删后插，期间其他写入等待，统计不会出现中间状态
+    """
+    started = time.perf_counter()
+    since = None if days is None else date.today() - timedelta(days=days - 1)
+    date_filter = 'WHERE "created_at" >= ?' if since else ""
+    stats_filter = 'WHERE "date" >= ?' if since else ""
+    params = [since.isoformat()] if since else []
+
+    async with in_transaction("default") as connection:
+        before = await connection.execute_query_dict(
+            'SELECT "date", "status", "problem_type", "solution_type", "assigned_to_id", "count" '
+            f'FROM "work_order_daily_stats" {stats_filter}',
+            params
+        )
+        await connection.execute_query(f'DELETE FROM "work_order_daily_stats" {stats_filter}', params)
+        await connection.execute_query(
+            'INSERT INTO "work_order_daily_stats" '
+            '("date", "status", "problem_type", "solution_type", "assigned_to_id", "count") '
+            'SELECT date("created_at"), "status", COALESCE("problem_type", \'\'), '
+            'COALESCE("solution_type", \'\'), COALESCE("assigned_to_id", 0), COUNT(*) '
+            f'FROM {all_orders_sql()} {date_filter} '
+            'GROUP BY 1, 2, 3, 4, 5',
+            params
+        )
+        after = await connection.execute_query_dict(
+            'SELECT "date", "status", "problem_type", "solution_type", "assigned_to_id", "count" '
+            f'FROM "work_order_daily_stats" {stats_filter}',
+            params
+        )
+
+    def as_counter(rows: List[dict]) -> Counter:
+        return Counter({
+            (str(row["date"]), row["status"], row["problem_type"], row["solution_type"], row["assigned_to_id"]): row["count"]
+            for row in rows
+        })
+
+    diff = as_counter(after)
+    diff.subtract(as_counter(before))
+    return {
+        "rows": len(after),
+        "drift": sum(abs(value) for value in diff.values()),
+        "duration": round(time.perf_counter() - started, 3)
+    }
+
+async def ensure_daily_stats() -> None:
+    """统计表为空而已有工单时（如升级已有数据库）全量生成一次"""
+    if not await WorkOrderDailyStats.exists() and await WorkOrders.exists():
+        await reconcile_daily_stats()
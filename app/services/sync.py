@@ -0,0 +1,102 @@
+"""
+工单列表的条件请求与增量同步
+
+change_versions 表为每类数据保存一个变更计数，由 SQLite 触发器在工单（含归档表）增删改、
+用户改名或删除时递增（列表中包含签收人姓名）。读取计数只需一次主键查询，
+列表据此生成 ETag，计数未变化时直接返回 304，不再执行列表查询。
+users 计数在用户的登录名、密码、启用状态或角色变化以及删除时递增，各 worker 据此使已认证用户的缓存失效。
+签收人改名或删除不修改工单的修改时间，触发器另在 user_changes 表记录时间，增量同步据此返回其签收的工单。
+epoch 在首次创建时随机生成，数据库重建后计数从 0 开始也不会与旧的 ETag 相同
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+CHANGE_TABLE = "change_versions"
+WORK_ORDERS = "work_orders"
+USERS = "users"
+
+# 增量同步返回的下次起点比本次查询开始时提前的时间：
+# 修改时间在提交前生成，查询开始时尚未提交的修改仍会在下次同步中返回
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# 增量同步最多返回的变更数，超过时客户端应重新加载完整列表
+SYNC_MAX_CHANGES = 500
+
+# (触发器名, 触发条件, 递增的计数)
+_TRIGGERS = (
+    ("work_orders_changed_insert", 'AFTER INSERT ON "work_orders"', WORK_ORDERS),
+    ("work_orders_changed_update", 'AFTER UPDATE ON "work_orders"', WORK_ORDERS),
+    ("work_orders_changed_delete", 'AFTER DELETE ON "work_orders"', WORK_ORDERS),
+    # 已归档工单所在的归档表（见 app/services/archive_store.py）
+    ("work_orders_changed_archive_insert", 'AFTER INSERT ON "work_orders_archive"', WORK_ORDERS),
+    ("work_orders_changed_archive_update", 'AFTER UPDATE ON "work_orders_archive"', WORK_ORDERS),
+    ("work_orders_changed_archive_delete", 'AFTER DELETE ON "work_orders_archive"', WORK_ORDERS),
+    # 登录等操作不改变列表内容，只在姓名或用户名变化时递增
+    ("work_orders_changed_user_update", 'AFTER UPDATE OF "username", "full_name" ON "users"', WORK_ORDERS),
+    ("work_orders_changed_user_delete", 'AFTER DELETE ON "users"', WORK_ORDERS),
+    # 已认证用户的缓存（见 app/api/deps.py）
+    ("users_changed_update", 'AFTER UPDATE OF "username", "password_hash", "is_active", "is_admin" ON "users"', USERS),
+    ("users_changed_delete", 'AFTER DELETE ON "users"', USERS),
+)
+
+# 记录用户改名或删除时间的触发器：(触发器名, 触发条件, 用户 ID)。
+# 时间格式与 Tortoise 写入的本地时间一致；SQLite 只精确到毫秒，补足到该毫秒末尾，同一毫秒内的同步起点不会漏掉
+_USER_CHANGE_TRIGGERS = (
+    ("user_changes_update", 'AFTER UPDATE OF "username", "full_name" ON "users"', 'new."id"'),
+    ("user_changes_delete", 'AFTER DELETE ON "users"', 'old."id"'),
+)
+
+def _is_sqlite(db: BaseDBAsyncClient) -> bool:
+    return db.capabilities.dialect == "sqlite"
+
+async def ensure_change_tracking(db: Optional[BaseDBAsyncClient] = None) -> None:
+    """创建工单、用户的变更计数、用户改名记录和触发器（已存在时跳过）"""
+    db = db or connections.get("default")
+    if not _is_sqlite(db):
+        return
+    statements = [
+        f'INSERT OR IGNORE INTO "{CHANGE_TABLE}" ("name", "epoch", "version") '
+        f"VALUES ('{name}', lower(hex(randomblob(4))), 0)"
+        for name in (WORK_ORDERS, USERS)
+    ]
+    statements.extend(
+        f'CREATE TRIGGER IF NOT EXISTS "{name}" {event} BEGIN '
+        f'UPDATE "{CHANGE_TABLE}" SET "version" = "version" + 1 WHERE "name" = \'{counter}\'; END'
+        for name, event, counter in _TRIGGERS
+    )
+    statements.extend(
+        f'CREATE TRIGGER IF NOT EXISTS "{name}" {event} BEGIN '
+        f'INSERT OR REPLACE INTO "user_changes" ("user_id", "changed_at") '
+        f"VALUES ({user_id}, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime') || '999'); END"
+        for name, event, user_id in _USER_CHANGE_TRIGGERS
+    )
+    await db.execute_script(";\n".join(statements) + ";")
+
+async def get_change_marker(db: BaseDBAsyncClient, name: str = WORK_ORDERS) -> Optional[str]:
+    """读取变更计数，未启用变更跟踪时返回 None"""
+    if not _is_sqlite(db):
+        return None
+    _, rows = await db.execute_query(
+        f'SELECT "epoch", "version" FROM "{CHANGE_TABLE}" WHERE "name" = ?', [name]
+    )
+    if not rows:
+        return None
+    return f'{rows[0]["epoch"]}-{rows[0]["version"]}'
+
+def list_etag(marker: str, query_string: str) -> str:
+    """由变更计数和查询参数生成弱 ETag，不同的筛选条件和分页得到不同的 ETag"""
+    digest = hashlib.sha1(query_string.encode("utf-8")).hexdigest()[:12]
+    return f'W/"wo-{marker}-{digest}"'
+
+def parse_since(value: str) -> datetime:
+    """解析增量同步的起点，带时区的时间转换为本地时间（与数据库中的存储方式一致）"""
+    since = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if since.tzinfo is not None:
+        since = since.astimezone().replace(tzinfo=None)
+    return since
+
+def next_sync_time(started: datetime) -> str:
+    return (started - SYNC_OVERLAP).isoformat(" ")
@@ -1,43 +1,218 @@
+import asyncio
+import time
+from collections import Counter
 from datetime import datetime, timedelta
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from app.models.models import WorkOrders, SystemSettings
+from tortoise.functions import Count, Max
+from tortoise.transactions import in_transaction
+from app.core.config import settings as app_settings
+from app.models.models import (
+    WorkOrders,
+    WorkOrdersArchive,
+    WorkOrderLogs,
+    WorkOrderDailyStats,
+    WorkOrderDurationStats,
+    SystemSettings
+)
+from app.services.statistics import reconcile_daily_stats
+from app.services.analytics import reconcile_duration_stats
+from app.services.archive_store import move_archived_orders, move_to_archive
+from app.services.events import event_broker
+from app.services.metrics import ARCHIVED_ORDERS, fold_stale_metrics
+from app.tasks.scheduler import Job, LeaderScheduler
+
+# 每个事务归档的工单数量，避免长时间占用 SQLite 写锁
+ARCHIVE_CHUNK_SIZE = 1000
+
+async def archive_completed_orders(chunk_size: int = ARCHIVE_CHUNK_SIZE) -> dict:
+    """
+    按批次归档已完成且超过归档时间的工单，并移到归档表
+
+    每批在一个事务内用一条 UPDATE 完成并移到归档表，批次之间让出事件循环；
+    之后把在用表中其他已归档的工单（升级前归档或被管理员修改过的）也移到归档表，
+    返回归档数量、批次数、移到归档表的其他工单数和耗时
+    """
+    started = time.perf_counter()
+
+    # 获取系统设置中的归档时间
+    settings = await SystemSettings.get_settings()
+    archive_time = datetime.now() - timedelta(hours=settings.archive_hours)
+
+    archived_count = 0
+    chunks = 0
+    while True:
+        async with in_transaction("default") as connection:
+            # 查找一批需要归档的工单（已完成且超过归档时间）
+            ids = await WorkOrders.filter(
+                status=2,  # 已完成状态
+                modified_at__lt=archive_time,  # 最后修改时间早于归档时间
+                archived_at__isnull=True  # 尚未归档
+            ).limit(chunk_size).values_list("id", flat=True)
+            if not ids:
+                break
+
+            # 归档前的统计行主键，用于把计数从已完成移到已归档
+            rows = await WorkOrders.filter(id__in=ids).using_db(connection).values(
+                "created_at", "status", "problem_type", "solution_type", "assigned_to_id",
+                "assigned_time", "completed_at"
+            )
+
+            current_time = datetime.now()
+            # 按选出的 ID 计数：SQLite 返回的修改行数包含变更计数触发器写入的行
+            await WorkOrders.filter(id__in=ids).update(
+                status=3,  # 归档状态
+                archived_at=current_time,
+                modified_at=current_time
+            )
+            archived_count += len(ids)
+            await WorkOrderLogs.bulk_create([
+                WorkOrderLogs.build(
+                    current_time,
+                    work_order_id=order_id,
+                    action="archived",
+                    status_from=2,
+                    status_to=3
+                )
+                for order_id in ids
+            ], using_db=connection)
+
+            deltas = Counter()
+            duration_deltas = {}
+            for row in rows:
+                deltas[WorkOrderDailyStats.key(row)] -= 1
+                deltas[WorkOrderDailyStats.key({**row, "status": 3})] += 1
+                WorkOrderDurationStats.add_transition(duration_deltas, row, {**row, "status": 3})
+            await WorkOrderDailyStats.adjust(deltas, connection)
+            await WorkOrderDurationStats.adjust(duration_deltas, connection)
+            await move_to_archive(ids, connection)
+            chunks += 1
+
+        ARCHIVED_ORDERS.inc(amount=len(ids))
+        event_broker.publish("archived", {"ids": ids})
+
+        # 批次之间让出事件循环和写锁
+        await asyncio.sleep(0)
+
+    moved = await move_archived_orders(chunk_size)
+
+    return {
+        "archived": archived_count,
+        "chunks": chunks,
+        "moved": moved,
+        "duration": round(time.perf_counter() - started, 3)
+    }
+
+async def compact_archived_logs(
+    days: int = app_settings.LOG_COMPACT_DAYS,
+    chunk_size: int = ARCHIVE_CHUNK_SIZE
+) -> dict:
+    """
+    压缩归档超过 days 天的工单日志
+
+    保留创建、签收、状态变化等节点日志，把编辑日志合并为一条 compacted 日志
+    """
+    started = time.perf_counter()
+    archive_before = datetime.now() - timedelta(days=days)
+
+    compacted_logs = 0
+    compacted_orders = 0
+    last_order_id = 0
+    while True:
+        # 按工单 ID 顺序遍历仍有编辑日志的工单
+        candidate_ids = await WorkOrderLogs.filter(
+            action="updated",
+            work_order_id__gt=last_order_id
+        ).order_by("work_order_id").distinct().limit(chunk_size).values_list("work_order_id", flat=True)
+        if not candidate_ids:
+            break
+        last_order_id = candidate_ids[-1]
+
+        async with in_transaction("default") as connection:
+            order_ids = await WorkOrdersArchive.filter(
+                id__in=candidate_ids,
+                archived_at__lt=archive_before
+            ).using_db(connection).values_list("id", flat=True)
+            if order_ids:
+                edits = await WorkOrderLogs.filter(
+                    work_order_id__in=order_ids,
+                    action="updated"
+                ).using_db(connection).annotate(
+                    count=Count("id"),
+                    last_at=Max("created_at")
+                ).group_by("work_order_id").values("work_order_id", "count", "last_at")
+
+                await WorkOrderLogs.filter(
+                    work_order_id__in=order_ids,
+                    action="updated"
+                ).using_db(connection).delete()
+                await WorkOrderLogs.bulk_create([
+                    WorkOrderLogs.build(
+                        edit["last_at"],
+                        work_order_id=edit["work_order_id"],
+                        action="compacted",
+                        remark=f"合并了 {edit['count']} 条编辑日志"
+                    )
+                    for edit in edits
+                ], using_db=connection)
+
+                compacted_logs += sum(edit["count"] for edit in edits)
+                compacted_orders += len(edits)
+
+        # 批次之间让出事件循环和写锁
+        await asyncio.sleep(0)
+
+    return {
+        "orders": compacted_orders,
+        "logs": compacted_logs,
+        "duration": round(time.perf_counter() - started, 3)
+    }
+
+async def compact_old_logs():
+    """定时压缩归档工单的日志"""
+    result = await compact_archived_logs()
+    print(
+        f"[{datetime.now()}] 日志压缩完成：{result['orders']} 个工单合并了 {result['logs']} 条编辑日志，"
+        f"耗时 {result['duration']} 秒"
+    )
+
+async def reconcile_stats():
+    """定时用工单表对账最近几天的每日统计和处理时效统计"""
+    result = await reconcile_daily_stats(app_settings.STATS_RECONCILE_DAYS)
+    if result["drift"]:
+        print(f"[{datetime.now()}] 每日统计对账：修正了 {result['drift']} 个计数差异")
+    result = await reconcile_duration_stats(app_settings.STATS_RECONCILE_DAYS)
+    if result["drift"]:
+        print(f"[{datetime.now()}] 处理时效统计对账：修正了 {result['drift']} 个计数差异")
 
 async def archive_old_orders():
     """自动归档超时工单"""
-    try:
-        # 获取系统设置中的归档时间
-        settings = await SystemSettings.get_settings()
-        archive_hours = settings.archive_hours
-        
-        # 计算需要归档的时间点
-        archive_time = datetime.now() - timedelta(hours=archive_hours)
-        
-        # 查找并更新需要归档的工单
-        orders = await WorkOrders.filter(
-            status=2,  # 已完成状态
-            modified_at__lt=archive_time,  # 最后修改时间早于归档时间
-            archived_at__isnull=True  # 尚未归档
-        )
-        
-        # 批量更新状态为已归档
-        archived_count = 0
-        for order in orders:
-            order.status = 3
-            order.archived_at = datetime.now()
-            await order.save()
-            archived_count += 1
-        
-        print(f"[{datetime.now()}] 自动归档完成：归档了 {archived_count} 个工单")
-    except Exception as e:
-        print(f"[{datetime.now()}] 自动归档失败：{str(e)}")
-
-def setup_archive_scheduler():
-    """设置定时任务"""
-    scheduler = AsyncIOScheduler()
-    
-    # 添加每小时执行一次的任务
-    scheduler.add_job(archive_old_orders, 'interval', hours=1)
-    
-    # 启动调度器
-    scheduler.start()
-    print("工单自动归档定时任务已启动") 
\ No newline at end of file
+    result = await archive_completed_orders()
+    print(
+        f"[{datetime.now()}] 自动归档完成：归档了 {result['archived']} 个工单，"
+        f"共 {result['chunks']} 批，另将 {result['moved']} 个已归档工单移到归档表，耗时 {result['duration']} 秒"
+    )
+
+# 定时任务列表，失败时由调度器记录错误
+ARCHIVE_JOBS = [
+    # 每小时执行一次自动归档
+    Job("archive", "自动归档", archive_old_orders, timedelta(hours=1)),
+    # 每小时对账一次最近的每日统计
+    Job("reconcile_stats", "每日统计对账", reconcile_stats, timedelta(hours=1)),
+    # 每天压缩一次归档工单的日志
+    Job("compact_logs", "日志压缩", compact_old_logs, timedelta(days=1)),
+    # 定期归并已退出的 worker 的运行指标
+    Job("fold_metrics", "运行指标归并", fold_stale_metrics, timedelta(minutes=10)),
+]
+
+archive_scheduler = LeaderScheduler(ARCHIVE_JOBS)
+
+async def setup_archive_scheduler():
+    """设置定时任务，多个 worker 中只有持有租约的一个会实际运行"""
+    if not app_settings.SCHEDULER_ENABLED:
+        print("定时任务已关闭（SCHEDULER_ENABLED=false）")
+        return
+    await archive_scheduler.start()
+    print("工单自动归档定时任务已启动")
+
+async def shutdown_archive_scheduler():
+    """停止定时任务并释放租约"""
+    await archive_scheduler.stop()
@@ -0,0 +1,99 @@
+"""
+性能测试: 登录风暴期间 GET /work-orders 的延迟
+
+在进程内运行应用（与 uvicorn 单进程相同，共用一个事件循环），
+并发发起大量登录请求的同时持续请求工单列表，输出列表接口的延迟分位数
+
+运行: python -m app.tasks.bench_login_storm [登录并发数] [列表请求数]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import httpx
+from tortoise import Tortoise
+from app.main import app, TORTOISE_ORM
+from app.core.security import get_password_hash
+from app.services.search import ensure_search_index
+from app.models.models import Users, WorkOrders
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PASSWORD = "bench123"
+
+async def init_db(db_path: str):
+    # 使用临时数据库文件
+    config = {**TORTOISE_ORM, "connections": {"default": f"sqlite://{db_path}"}}
+    await Tortoise.init(config=config)
+    await Tortoise.generate_schemas()
+    await ensure_search_index()
+
+    password_hash = get_password_hash(PASSWORD)
+    await Users.create(username="bench", password_hash=password_hash, full_name="压测用户")
+    for i in range(200):
+        await WorkOrders.create(
+            order_no=f"BENCH-{i:05d}",
+            reporter_name="张三",
+            contact_phone="13800000000",
+            location="三楼机房",
+            problem_desc="打印机无法打印"
+        )
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def login(client: httpx.AsyncClient):
+    response = await client.post(
+        "/api/v1/auth/login",
+        data={"username": "bench", "password": PASSWORD}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def run_benchmark(login_count: int, list_count: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        token = await login(client)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        latencies = []
+
+        async def poll_list():
+            for _ in range(list_count):
+                started = time.perf_counter()
+                response = await client.get("/api/v1/work-orders", headers=headers)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        storm = asyncio.gather(*[login(client) for _ in range(login_count)])
+        await asyncio.gather(storm, poll_list())
+        elapsed = time.perf_counter() - started
+
+    logger.info(f"登录并发 {login_count}，列表请求 {list_count}，总耗时 {elapsed:.2f} 秒")
+    logger.info(
+        "GET /work-orders 延迟(ms): "
+        f"p50={percentile(latencies, 50):.1f} "
+        f"p90={percentile(latencies, 90):.1f} "
+        f"p99={percentile(latencies, 99):.1f} "
+        f"max={max(latencies):.1f}"
+    )
+
+async def run_bench(login_count: int = 50, list_count: int = 200):
+    """运行性能测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            await run_benchmark(login_count, list_count)
+        finally:
+            await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(run_bench(*args))
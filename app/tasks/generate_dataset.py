@@ -0,0 +1,298 @@
+"""
+生成性能测试用的模拟数据：用户、问题/解决方案类型、工单及其日志
+
+工单的创建时间集中在工作日白天，问题类型和签收人的分布有明显倾斜，
+签收耗时、处理耗时按对数正态分布生成，状态由这些时间点和归档时间推出，
+与实际运行一段时间后的数据库相近。相同的参数和随机种子生成相同的数据
+
+运行: python -m app.tasks.generate_dataset --db data/loadtest.sqlite3 --orders 100000
+"""
+import argparse
+import asyncio
+import logging
+import math
+import random
+import time
+from bisect import bisect
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import List, Optional
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.core.database import build_connections, open_read_connections
+from app.core.security import get_password_hash
+from app.models.models import Users, WorkOrders, ProblemType, SolutionType, SystemSettings
+from app.services.archive_store import move_archived_orders
+from app.services.search import ensure_search_index, rebuild_search_index
+from app.services.statistics import reconcile_daily_stats
+from app.services.analytics import reconcile_duration_stats
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 生成的所有用户使用同一个密码，admin 为管理员，其余为维修人员
+PASSWORD = "loadtest123"
+CHUNK_SIZE = 5000
+
+# 问题类型及权重，每种类型配有若干描述
+PROBLEM_TYPES = {
+    "硬件故障": (30, ["电脑无法开机", "显示器黑屏", "键盘按键失灵", "鼠标无反应", "主机风扇异响"]),
+    "软件故障": (24, ["办公软件打开后闪退", "系统频繁蓝屏", "浏览器无法打开网页", "财务软件报错无法登录"]),
+    "网络故障": (18, ["无法连接内网", "无线网络频繁掉线", "网速很慢", "VPN 连接失败"]),
+    "打印机故障": (11, ["打印机卡纸", "打印出来有黑条", "无法添加网络打印机", "扫描件发不到邮箱"]),
+    "账号权限": (8, ["域账号被锁定", "忘记邮箱密码", "需要开通共享文件夹权限"]),
+    "邮件问题": (5, ["邮件收不到外部来信", "邮箱容量已满", "Outlook 一直提示输入密码"]),
+    "电话故障": (3, ["座机没有拨号音", "分机无法外呼"]),
+    "其他": (1, ["会议室投影仪没有信号", "需要安装新软件"]),
+}
+SOLUTION_TYPES = ["更换配件", "重装系统", "远程协助", "现场处理", "重置密码", "修改配置"]
+PROCESSING_DESCS = ["已现场处理，用户确认恢复正常", "远程协助完成设置", "更换配件后测试正常", "已重置并告知用户"]
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高"
+GIVEN_NAMES = ["伟", "芳", "娜", "敏", "静", "磊", "强", "洋", "艳", "杰", "军", "勇", "婷", "涛", "明", "超", "秀英", "建国", "海燕", "志强"]
+BUILDINGS = ["行政楼", "研发中心A座", "研发中心B座", "生产车间", "仓库", "财务中心"]
+
+# 创建时间的分布：工作日为主，白天上午和下午各有一个高峰
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 4, 10, 16, 15, 12, 6, 9, 14, 14, 12, 8, 4, 3, 2, 2, 1, 1]
+WEEKEND_WEIGHT = 0.25
+
+# 签收耗时中位数 15 分钟，处理耗时中位数 3 小时，长尾明显
+ASSIGN_DELAY = (math.log(15 * 60), 1.1)
+COMPLETE_DELAY = (math.log(3 * 3600), 1.3)
+# 少量工单一直无人签收或一直未处理完成
+STUCK_RATIO = 0.005
+
+def weighted_choice(rng: random.Random, items: list, cumulative: list):
+    return items[bisect(cumulative, rng.random() * cumulative[-1])]
+
+def random_created_times(rng: random.Random, count: int, days: int, now: datetime) -> List[datetime]:
+    """生成 count 个按时间排序的创建时间"""
+    start = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    slots, weights = [], []
+    for day in range(days + 1):
+        day_start = start + timedelta(days=day)
+        day_weight = WEEKEND_WEIGHT if day_start.weekday() >= 5 else 1.0
+        for hour, hour_weight in enumerate(HOUR_WEIGHTS):
+            slot = day_start + timedelta(hours=hour)
+            # 当前这个小时只到 now 为止
+            seconds = min(3600.0, (now - slot).total_seconds())
+            if seconds > 0:
+                slots.append((slot, seconds))
+                weights.append(day_weight * hour_weight * seconds / 3600)
+    cumulative = list(accumulate(weights))
+
+    times = []
+    for _ in range(count):
+        slot, seconds = weighted_choice(rng, slots, cumulative)
+        times.append(slot + timedelta(seconds=rng.random() * seconds))
+    times.sort()
+    return times
+
+def order_row(
+    rng: random.Random,
+    order_id: int,
+    order_no: str,
+    created_at: datetime,
+    now: datetime,
+    archive_after: timedelta,
+    assignees: list,
+    assignee_weights: list,
+    type_names: list,
+    type_weights: list
+) -> tuple:
+    """生成一个工单及其日志"""
+    problem_type = weighted_choice(rng, type_names, type_weights)
+    reporter = rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES)
+    phone = f"1{rng.choice('3578')}{rng.randrange(10 ** 9):09d}"
+    location = f"{rng.choice(BUILDINGS)}{rng.randint(1, 12)}楼{rng.randint(1, 30):02d}室"
+    problem_desc = rng.choice(PROBLEM_TYPES[problem_type][1])
+
+    status = 0
+    assigned_to = assigned_time = completed_at = archived_at = None
+    processing_desc = solution_type = None
+    typed = False
+    logs = [(order_id, "created", None, 0, None, None, created_at)]
+    modified_at = created_at
+
+    stuck = rng.random() < STUCK_RATIO
+    assign_at = created_at + timedelta(seconds=rng.lognormvariate(*ASSIGN_DELAY))
+    if not (stuck and rng.random() < 0.5) and assign_at <= now:
+        status = 1
+        assigned_to = weighted_choice(rng, assignees, assignee_weights)
+        assigned_time = modified_at = assign_at
+        logs.append((order_id, "assigned", 0, 1, assigned_to, None, assign_at))
+
+        complete_at = assign_at + timedelta(seconds=rng.lognormvariate(*COMPLETE_DELAY))
+        if not stuck and complete_at <= now:
+            status, typed = 2, True
+            processing_desc = rng.choice(PROCESSING_DESCS)
+            solution_type = rng.choice(SOLUTION_TYPES)
+            completed_at = modified_at = complete_at
+            logs.append((order_id, "status", 1, 2, assigned_to, "问题类型、处理说明、解决方案类型", complete_at))
+
+            # 自动归档每小时执行一次
+            archive_at = complete_at + archive_after + timedelta(seconds=rng.random() * 3600)
+            if archive_at <= now:
+                status = 3
+                archived_at = modified_at = archive_at
+                logs.append((order_id, "archived", 2, 3, None, None, archive_at))
+        elif rng.random() < 0.4:
+            # 处理中的工单有一部分已选好问题类型
+            typed = True
+            processing_desc = "正在排查"
+
+    order = (
+        order_id, order_no, reporter, phone, location, problem_desc,
+        problem_type if typed else None,
+        status, assigned_to, assigned_time, processing_desc, solution_type,
+        created_at, modified_at, archived_at, completed_at
+    )
+    return order, logs
+
+ORDER_COLUMNS = (
+    "id", "order_no", "reporter_name", "contact_phone", "location", "problem_desc",
+    "problem_type", "status", "assigned_to_id", "assigned_time", "processing_desc", "solution_type",
+    "created_at", "modified_at", "archived_at", "completed_at"
+)
+LOG_COLUMNS = ("work_order_id", "action", "status_from", "status_to", "operator_id", "remark", "created_at")
+
+def insert_sql(table: str, columns: tuple) -> str:
+    names = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    return f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})'
+
+def to_db(row: tuple) -> list:
+    # 与 save() 的存储格式一致：不带时区的本地时间
+    return [str(value) if isinstance(value, datetime) else value for value in row]
+
+async def create_users(count: int) -> List[int]:
+    """创建管理员和 count 个维修人员，返回维修人员的 ID"""
+    # bcrypt 较慢，所有用户共用一个哈希
+    password_hash = get_password_hash(PASSWORD)
+    await Users.create(username="admin", password_hash=password_hash, full_name="管理员", is_admin=True)
+    ids = []
+    for i in range(count):
+        user = await Users.create(
+            username=f"tech{i + 1:02d}",
+            password_hash=password_hash,
+            full_name=f"维修员{i + 1:02d}"
+        )
+        ids.append(user.id)
+    return ids
+
+async def generate_dataset(
+    orders: int = 100000,
+    users: int = 20,
+    days: int = 365,
+    seed: int = 20,
+    now: Optional[datetime] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> dict:
+    """
+    在当前连接的空数据库中生成模拟数据，返回各状态的工单数和耗时
+
+    工单和日志直接批量写入，已归档的工单移到归档表，完成后重建全文索引、每日统计和处理时效统计
+    """
+    started = time.perf_counter()
+    if await WorkOrders.exists():
+        raise ValueError("目标数据库中已有工单，请使用新的数据库文件")
+
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    archive_after = timedelta(hours=(await SystemSettings.get_settings()).archive_hours)
+
+    assignees = await create_users(users)
+    # 少数人处理了大部分工单
+    assignee_weights = list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(assignees))))
+    type_names = list(PROBLEM_TYPES)
+    type_weights = list(accumulate(weight for weight, _ in PROBLEM_TYPES.values()))
+    for name in type_names:
+        await ProblemType.create(name=name)
+    for name in SOLUTION_TYPES:
+        await SolutionType.create(name=name)
+
+    created_times = random_created_times(rng, orders, days, now)
+    db = Tortoise.get_connection("default")
+    order_sql = insert_sql("work_orders", ORDER_COLUMNS)
+    log_sql = insert_sql("work_order_logs", LOG_COLUMNS)
+
+    status_counts = Counter()
+    log_count = 0
+    day, day_no = None, 0
+    for offset in range(0, orders, chunk_size):
+        order_rows, log_rows = [], []
+        for index in range(offset, min(offset + chunk_size, orders)):
+            created_at = created_times[index]
+            # 编号按创建日期每天从 001 开始
+            if created_at.date() != day:
+                day, day_no = created_at.date(), 0
+            day_no += 1
+            order, logs = order_row(
+                rng, index + 1, f"SZIT-{day:%Y%m%d}-{day_no:03d}", created_at, now,
+                archive_after, assignees, assignee_weights, type_names, type_weights
+            )
+            status_counts[order[7]] += 1
+            order_rows.append(to_db(order))
+            log_rows.extend(to_db(log) for log in logs)
+
+        async with in_transaction("default") as connection:
+            await connection.execute_many(order_sql, order_rows)
+            await connection.execute_many(log_sql, log_rows)
+        log_count += len(log_rows)
+
+    # 已归档的工单与归档任务一样移到归档表
+    await move_archived_orders(chunk_size)
+    await rebuild_search_index(db)
+    await reconcile_daily_stats()
+    await reconcile_duration_stats()
+
+    return {
+        "orders": orders,
+        "users": len(assignees) + 1,
+        "logs": log_count,
+        "status": {status: status_counts[status] for status in range(4)},
+        "duration": round(time.perf_counter() - started, 3)
+    }
+
+async def init_db(db_path: str, read_pool: bool = True):
+    # 使用与服务相同的连接参数（WAL、只读连接等），便于压测直接使用生成的数据库
+    connections_config = build_connections(f"sqlite://{db_path}")
+    if not read_pool:
+        connections_config = {"default": connections_config["default"]}
+    await Tortoise.init(config={
+        "connections": connections_config,
+        "apps": {"models": {"models": ["app.models.models"], "default_connection": "default"}},
+    })
+    await Tortoise.generate_schemas(safe=True)
+    await ensure_search_index()
+    await open_read_connections()
+
+async def run_generate(args: argparse.Namespace):
+    """运行生成流程"""
+    logger.info(f"开始生成模拟数据: {args.db}")
+    await init_db(args.db)
+    try:
+        result = await generate_dataset(args.orders, args.users, args.days, args.seed)
+        logger.info(
+            f"生成完成：{result['orders']} 个工单（各状态 {result['status']}），{result['users']} 个用户，"
+            f"{result['logs']} 条日志，耗时 {result['duration']} 秒；所有用户的密码为 {PASSWORD}"
+        )
+    except Exception as e:
+        logger.error(f"生成过程中出错: {str(e)}")
+        raise
+    finally:
+        await Tortoise.close_connections()
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="生成性能测试用的模拟数据")
+    parser.add_argument("--db", default="data/loadtest.sqlite3", help="SQLite 数据库文件（需为新文件）")
+    parser.add_argument("--orders", type=int, default=100000, help="工单数")
+    parser.add_argument("--users", type=int, default=20, help="维修人员数")
+    parser.add_argument("--days", type=int, default=365, help="工单创建时间跨越的天数")
+    parser.add_argument("--seed", type=int, default=20, help="随机种子")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run_generate(parse_args()))
@@ -0,0 +1,392 @@
+"""
+性能测试：在模拟数据上按混合负载请求主要接口，输出吞吐量和延迟分位数的 JSON 报告
+
+负载包括新建工单（API Token）、工单列表（含筛选、翻页和全文检索）、统计、签收、
+处理完成和登录，各类请求按权重随机混合。可在进程内运行应用（与 uvicorn 单进程相同），
+也可请求本地启动的 uvicorn（需以 DATABASE_URL 指向同一个模拟数据库启动）。
+报告包含提交号和主要配置，可用 --compare 与之前的报告对比
+
+运行:
+    python -m app.tasks.generate_dataset --db data/loadtest.sqlite3
+    python -m app.tasks.load_test --db data/loadtest.sqlite3 --duration 30 --output report.json
+    python -m app.tasks.load_test --url http://127.0.0.1:8000 --output report.json --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.api.work_orders import API_TOKEN
+from app.core.config import settings
+from app.services.analytics import ensure_completed_at
+from app.tasks.generate_dataset import PASSWORD, PROBLEM_TYPES, SOLUTION_TYPES, init_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+API = settings.API_V1_STR
+REPORT_VERSION = 1
+
+# 各类请求的权重：以查询为主，写入和登录较少
+WORKLOADS = {
+    "list": 35,
+    "search": 8,
+    "statistics": 10,
+    "ingest": 20,
+    "assign": 12,
+    "update": 12,
+    "login": 3,
+}
+PERCENTILES = (50, 90, 95, 99)
+
+# 记录在报告中的配置，对比报告时便于判断差异来源
+REPORTED_SETTINGS = (
+    "FAST_JSON_RESPONSES", "SQLITE_JOURNAL_MODE", "SQLITE_SYNCHRONOUS",
+    "SQLITE_READ_POOL_SIZE", "BCRYPT_ROUNDS", "PASSWORD_HASH_WORKERS",
+)
+
+def percentile(ordered: List[float], pct: float) -> float:
+    """最近秩分位数，ordered 需已排序"""
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    summary = {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {},
+    }
+    if ordered:
+        summary["latency_ms"] = {
+            **{f"p{pct}": round(percentile(ordered, pct), 2) for pct in PERCENTILES},
+            "mean": round(sum(ordered) / len(ordered), 2),
+            "max": round(ordered[-1], 2),
+        }
+    return summary
+
+class LoadState:
+    """各虚拟用户共享的状态：可签收的新工单和各用户处理中的工单"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.new_orders: List[int] = []
+        self.in_progress: Dict[str, List[int]] = defaultdict(list)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: Dict[str, str] = {}
+
+    async def measure(self, name: str, request) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.errors[name] += 1
+            self.error_samples.setdefault(name, repr(e))
+            return None
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            self.error_samples.setdefault(name, f"{response.status_code} {response.text[:200]}")
+            return None
+        return response
+
+class VirtualUser:
+    """一个维修人员：登录后按权重循环发起请求"""
+
+    def __init__(self, client: httpx.AsyncClient, state: LoadState, username: str, rng: random.Random):
+        self.client = client
+        self.state = state
+        self.username = username
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+
+    async def login(self) -> bool:
+        response = await self.state.measure("login", self.client.post(
+            f"{API}/auth/login", data={"username": self.username, "password": PASSWORD}
+        ))
+        if response is None:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return True
+
+    def date_range(self) -> dict:
+        """最近 1~90 天的统计范围"""
+        end = datetime.now().replace(hour=23, minute=59, second=59, microsecond=0)
+        start = (end - timedelta(days=self.rng.choice((1, 7, 30, 90)))).replace(hour=0, minute=0, second=0)
+        return {
+            "start_date": start.strftime("%Y-%m-%d %H:%M:%S"),
+            "end_date": end.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    async def list(self):
+        rng = self.rng
+        params = rng.choice([
+            {"limit": 20},
+            {"limit": 20, "status": 0},
+            {"limit": 20, "status": 1},
+            {"limit": 20, "status_lt": 3},
+            {"limit": 20, "problem_type": rng.choice(list(PROBLEM_TYPES))},
+            {"limit": 50, "with_total": True},
+        ])
+        response = await self.state.measure("list", self.client.get(
+            f"{API}/work-orders", params=params, headers=self.headers
+        ))
+        # 部分请求继续翻到下一页
+        if response is not None and response.json()["next_cursor"] and rng.random() < 0.3:
+            await self.state.measure("list", self.client.get(
+                f"{API}/work-orders",
+                params={**params, "cursor": response.json()["next_cursor"]},
+                headers=self.headers
+            ))
+
+    async def search(self):
+        keyword = self.rng.choice(self.rng.choice(list(PROBLEM_TYPES.values()))[1])[:4]
+        await self.state.measure("search", self.client.get(
+            f"{API}/work-orders", params={"q": keyword, "limit": 20}, headers=self.headers
+        ))
+
+    async def statistics(self):
+        await self.state.measure("statistics", self.client.get(
+            f"{API}/work-orders/statistics", params=self.date_range(), headers=self.headers
+        ))
+
+    async def ingest(self):
+        rng = self.rng
+        response = await self.state.measure("ingest", self.client.post(
+            f"{API}/work-orders",
+            json={
+                "reporter_name": f"压测{rng.randrange(10000)}",
+                "contact_phone": f"138{rng.randrange(10 ** 8):08d}",
+                "location": f"研发中心A座{rng.randint(1, 12)}楼",
+                "problem_desc": rng.choice(rng.choice(list(PROBLEM_TYPES.values()))[1]),
+            },
+            headers={"Authorization": f"Bearer {API_TOKEN}"}
+        ))
+        if response is not None:
+            self.state.new_orders.append(response.json()["id"])
+
+    async def assign(self):
+        if not self.state.new_orders:
+            return await self.ingest()
+        order_id = self.state.new_orders.pop(self.rng.randrange(len(self.state.new_orders)))
+        response = await self.state.measure("assign", self.client.put(
+            f"{API}/work-orders/{order_id}/assign", headers=self.headers
+        ))
+        if response is not None:
+            self.state.in_progress[self.username].append(order_id)
+
+    async def update(self):
+        own = self.state.in_progress[self.username]
+        if not own:
+            return await self.assign()
+        order_id = own.pop(0)
+        await self.state.measure("update", self.client.put(
+            f"{API}/work-orders/{order_id}",
+            json={
+                "status": 2,
+                "problem_type": self.rng.choice(list(PROBLEM_TYPES)),
+                "solution_type": self.rng.choice(SOLUTION_TYPES),
+                "processing_desc": "压测处理完成",
+            },
+            headers=self.headers
+        ))
+
+    async def run(self, deadline: float, weights: Dict[str, int]):
+        names = list(weights)
+        values = [weights[name] for name in names]
+        while time.perf_counter() < deadline:
+            await getattr(self, self.rng.choices(names, values)[0])()
+
+async def load_new_orders(client: httpx.AsyncClient, state: LoadState, headers: dict, limit: int = 300):
+    """读取数据集中已有的新建工单，供签收请求使用"""
+    cursor = None
+    while len(state.new_orders) < limit:
+        params = {"status": 0, "limit": 100, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get(f"{API}/work-orders", params=params, headers=headers)).json()
+        state.new_orders.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+async def run_load(
+    client: httpx.AsyncClient,
+    concurrency: int = 20,
+    duration: float = 30,
+    seed: int = 20,
+    weights: Optional[Dict[str, int]] = None,
+    users: int = 20
+) -> dict:
+    """按混合负载请求 duration 秒，返回各类请求的吞吐量和延迟分位数"""
+    weights = {name: weight for name, weight in (weights or WORKLOADS).items() if weight > 0}
+    rng = random.Random(seed)
+    state = LoadState(rng)
+
+    # 虚拟用户轮流使用生成的维修人员账号，开始计时前先登录，避免登录风暴计入结果
+    admin = VirtualUser(client, state, "admin", rng)
+    virtual_users = [
+        VirtualUser(client, state, f"tech{index % users + 1:02d}", random.Random(seed * 1000 + index))
+        for index in range(concurrency)
+    ]
+    for user in [admin, *virtual_users]:
+        if not await user.login():
+            raise RuntimeError(f"{user.username} 登录失败：{state.error_samples.get('login')}")
+    await load_new_orders(client, state, admin.headers)
+    state.latencies.clear()
+    state.errors.clear()
+
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*[user.run(deadline, weights) for user in virtual_users])
+    elapsed = time.perf_counter() - started
+
+    operations = {
+        name: summarize(state.latencies[name], state.errors[name], elapsed)
+        for name in WORKLOADS if name in state.latencies or name in state.errors
+    }
+    total = summarize(
+        [latency for values in state.latencies.values() for latency in values],
+        sum(state.errors.values()),
+        elapsed
+    )
+    return {
+        "elapsed": round(elapsed, 3),
+        "total": total,
+        "operations": operations,
+        "error_samples": state.error_samples,
+    }
+
+def git_revision() -> dict:
+    """当前提交号及工作区是否有未提交的修改"""
+    root = Path(__file__).resolve().parents[2]
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True
+        ).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+def build_report(result: dict, args: argparse.Namespace, dataset: Optional[dict]) -> dict:
+    return {
+        "version": REPORT_VERSION,
+        "meta": {
+            **git_revision(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "target": args.url or "in-process",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "seed": args.seed,
+            "weights": WORKLOADS,
+            "dataset": dataset,
+            "settings": {name: getattr(settings, name) for name in REPORTED_SETTINGS},
+        },
+        **result,
+    }
+
+def format_change(old: Optional[float], new: Optional[float]) -> str:
+    if old is None or new is None:
+        return f"{old} -> {new}"
+    change = f" ({(new - old) / old * 100:+.1f}%)" if old else ""
+    return f"{old} -> {new}{change}"
+
+def compare_reports(baseline: dict, report: dict) -> List[str]:
+    """逐项对比两份报告的吞吐量和延迟"""
+    lines = [f"对比基线 {baseline['meta'].get('commit')}（{baseline['meta'].get('created_at')}）:"]
+    names = ["total"] + [name for name in report["operations"] if name in baseline["operations"]]
+    for name in names:
+        old = baseline["total"] if name == "total" else baseline["operations"][name]
+        new = report["total"] if name == "total" else report["operations"][name]
+        latency = ", ".join(
+            f"{key} {format_change(old['latency_ms'].get(key), new['latency_ms'].get(key))}"
+            for key in ("p50", "p95", "p99")
+        )
+        lines.append(f"  {name}: 吞吐量 {format_change(old['throughput'], new['throughput'])} 次/秒, {latency} ms")
+    return lines
+
+def log_report(report: dict):
+    for name, summary in [("total", report["total"]), *report["operations"].items()]:
+        latency = summary["latency_ms"]
+        logger.info(
+            f"{name}: {summary['requests']} 次，错误 {summary['errors']}，{summary['throughput']} 次/秒，"
+            f"p50={latency.get('p50')} p95={latency.get('p95')} p99={latency.get('p99')} max={latency.get('max')} ms"
+        )
+    for name, sample in report["error_samples"].items():
+        logger.warning(f"{name} 请求出错示例：{sample}")
+
+async def dataset_info(db_path: str) -> dict:
+    db = Tortoise.get_connection("default")
+    _, rows = await db.execute_query(
+        'SELECT (SELECT COUNT(*) FROM "work_orders") + (SELECT COUNT(*) FROM "work_orders_archive") AS "count"'
+    )
+    return {"db": db_path, "orders": rows[0]["count"]}
+
+async def run_test(args: argparse.Namespace) -> dict:
+    """运行性能测试并写出报告"""
+    dataset = None
+    if args.url:
+        client = httpx.AsyncClient(
+            base_url=args.url,
+            timeout=60,
+            limits=httpx.Limits(max_connections=args.concurrency)
+        )
+    else:
+        # 进程内运行时不经过 startup 事件，也不启动定时任务
+        await init_db(args.db)
+        await ensure_completed_at(Tortoise.get_connection("default"))
+        dataset = await dataset_info(args.db)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-test", timeout=60)
+
+    try:
+        async with client:
+            logger.info(f"开始压测 {args.url or args.db}：并发 {args.concurrency}，持续 {args.duration} 秒")
+            result = await run_load(client, args.concurrency, args.duration, args.seed, users=args.users)
+    finally:
+        if not args.url:
+            await Tortoise.close_connections()
+
+    report = build_report(result, args, dataset)
+    log_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        logger.info(f"报告已写入 {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        for line in compare_reports(baseline, report):
+            logger.info(line)
+    return report
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="按混合负载压测主要接口")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--db", default="data/loadtest.sqlite3", help="进程内运行时使用的模拟数据库")
+    target.add_argument("--url", help="请求已启动的服务，如 http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发虚拟用户数")
+    parser.add_argument("--duration", type=float, default=30, help="持续时间(秒)")
+    parser.add_argument("--users", type=int, default=20, help="生成数据时的维修人员数")
+    parser.add_argument("--seed", type=int, default=20, help="随机种子")
+    parser.add_argument("--output", help="JSON 报告输出路径")
+    parser.add_argument("--compare", help="与之前的 JSON 报告对比")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run_test(parse_args(sys.argv[1:])))
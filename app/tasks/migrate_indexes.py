@@ -0,0 +1,60 @@
+"""
+数据库迁移脚本: 为已有数据库补建 WorkOrders 的组合索引和新增的列
+"""
+import asyncio
+import logging
+from tortoise import Tortoise
+from app.core.config import settings
+from app.services.analytics import ensure_completed_at
+from app.services.sync import ensure_change_tracking
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+async def init_db():
+    # 初始化数据库连接
+    await Tortoise.init(
+        db_url=settings.DATABASE_URL,
+        modules={"models": ["app.models.models"]}
+    )
+
+async def migrate_indexes():
+    """
+    按模型定义补建缺失的表和索引（CREATE ... IF NOT EXISTS）及新增的列，
+    然后执行 ANALYZE 让查询规划器获得最新的统计信息
+    """
+    try:
+        conn = Tortoise.get_connection("default")
+        before = await conn.execute_query_dict(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='work_orders'"
+        )
+
+        await Tortoise.generate_schemas(safe=True)
+        await ensure_completed_at(conn)
+        await ensure_change_tracking(conn)
+
+        after = await conn.execute_query_dict(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='work_orders'"
+        )
+        created = {row["name"] for row in after} - {row["name"] for row in before}
+        for name in sorted(created):
+            logger.info(f"创建索引: {name}")
+        logger.info(f"共新建 {len(created)} 个索引")
+
+        await conn.execute_script("ANALYZE")
+        logger.info("已更新查询规划统计信息")
+    except Exception as e:
+        logger.error(f"迁移过程中出错: {str(e)}")
+        raise
+
+async def run_migration():
+    """运行迁移流程"""
+    logger.info("开始迁移过程...")
+    await init_db()
+    await migrate_indexes()
+    await Tortoise.close_connections()
+    logger.info("迁移完成")
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
@@ -0,0 +1,45 @@
+"""
+从工单表全量重建每日统计和处理时效统计（升级已有数据库或统计出现偏差时使用）
+
+运行: python -m app.tasks.rebuild_daily_stats
+"""
+import asyncio
+import logging
+from tortoise import Tortoise
+from app.core.config import settings
+from app.services.statistics import reconcile_daily_stats
+from app.services.analytics import ensure_completed_at, reconcile_duration_stats
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+async def init_db():
+    # 初始化数据库连接
+    await Tortoise.init(
+        db_url=settings.DATABASE_URL,
+        modules={"models": ["app.models.models"]}
+    )
+    await Tortoise.generate_schemas(safe=True)
+    # 旧数据库的工单表没有完成时间列，处理时效统计依赖该列
+    await ensure_completed_at(Tortoise.get_connection("default"))
+
+async def run_rebuild():
+    """运行重建流程"""
+    logger.info("开始重建每日统计...")
+    await init_db()
+    try:
+        for name, rebuild in (("每日统计", reconcile_daily_stats), ("处理时效统计", reconcile_duration_stats)):
+            result = await rebuild()
+            logger.info(
+                f"{name}重建完成，共 {result['rows']} 行，修正 {result['drift']} 个计数差异，"
+                f"耗时 {result['duration']} 秒"
+            )
+    except Exception as e:
+        logger.error(f"重建过程中出错: {str(e)}")
+        raise
+    finally:
+        await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    asyncio.run(run_rebuild())
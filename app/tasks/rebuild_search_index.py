@@ -0,0 +1,37 @@
+"""
+重建工单全文检索索引（升级已有数据库或索引损坏时使用）
+
+运行: python -m app.tasks.rebuild_search_index
+"""
+import asyncio
+import logging
+from tortoise import Tortoise
+from app.core.config import settings
+from app.services.search import rebuild_search_index
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+async def init_db():
+    # 初始化数据库连接
+    await Tortoise.init(
+        db_url=settings.DATABASE_URL,
+        modules={"models": ["app.models.models"]}
+    )
+
+async def run_rebuild():
+    """运行重建流程"""
+    logger.info("开始重建全文索引...")
+    await init_db()
+    try:
+        indexed = await rebuild_search_index(Tortoise.get_connection("default"))
+        logger.info(f"重建完成，共索引 {indexed} 个工单")
+    except Exception as e:
+        logger.error(f"重建过程中出错: {str(e)}")
+        raise
+    finally:
+        await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    asyncio.run(run_rebuild())
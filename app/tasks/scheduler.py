@@ -0,0 +1,204 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from tortoise import Tortoise
+from app.core.config import settings
+from app.models.models import ScheduledJobState, storage_datetime
+from app.services.metrics import JOB_DURATION, JOB_RUNS
+
+class Job(NamedTuple):
+    name: str  # 任务标识，也是 scheduled_jobs 表的主键
+    title: str  # 日志中显示的名称
+    func: Callable[[], Awaitable]
+    interval: timedelta
+
+def _now() -> str:
+    # 与工单表一致，存不带时区的本地时间
+    return datetime.now().isoformat(" ")
+
+class LeaderScheduler:
+    """
+    多 worker 部署时只在一个进程中运行定时任务
+
+    每个 worker 定期尝试获取或续期数据库中的租约（scheduler_leases 表的一行），
+    持有未过期租约的 worker 启动 APScheduler；续期失败或租约被他人持有时立即停止调度。
+    主节点退出时释放租约，异常退出时其他 worker 在租约过期后接管。
+    各任务的上次运行时间记录在 scheduled_jobs 表，接管后按原来的节奏继续，不会立即重复运行。
+    jobs 为空时只竞选主节点（如自动派单），由调用方根据 is_leader 决定是否工作
+    """
+
+    def __init__(
+        self,
+        jobs: List[Job],
+        lease_name: str = "scheduler",
+        lease_seconds: float = settings.SCHEDULER_LEASE_SECONDS,
+        title: str = "定时任务"
+    ):
+        self.jobs = jobs
+        self.lease_name = lease_name
+        self.lease_seconds = lease_seconds
+        self.title = title  # 日志中显示的名称
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.scheduler: Optional[AsyncIOScheduler] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lease_until = 0.0  # 本进程确认持有租约的截止时间（monotonic）
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._lease_until
+
+    async def try_acquire(self) -> bool:
+        """获取或续期租约：租约不存在、已过期或本来就由自己持有时成功"""
+        now = datetime.now()
+        requested = time.monotonic()
+        db = Tortoise.get_connection("default")
+        # 单条语句完成判断和写入，多个 worker 同时争抢时只有一个成功
+        _, rows = await db.execute_query(
+            'INSERT INTO "scheduler_leases" ("name", "holder", "expires_at") VALUES (?, ?, ?) '
+            'ON CONFLICT ("name") DO UPDATE SET "holder" = excluded."holder", "expires_at" = excluded."expires_at" '
+            'WHERE "scheduler_leases"."holder" = excluded."holder" OR "scheduler_leases"."expires_at" < ? '
+            'RETURNING "holder"',
+            [
+                self.lease_name,
+                self.holder,
+                (now + timedelta(seconds=self.lease_seconds)).isoformat(" "),
+                now.isoformat(" "),
+            ]
+        )
+        if rows:
+            self._lease_until = requested + self.lease_seconds
+        else:
+            self._lease_until = 0.0
+        return bool(rows)
+
+    async def current_holder(self) -> Optional[str]:
+        """当前持有未过期租约的 worker（可能是其他进程），没有时返回 None"""
+        db = Tortoise.get_connection("default")
+        _, rows = await db.execute_query(
+            'SELECT "holder" FROM "scheduler_leases" WHERE "name" = ? AND "expires_at" >= ?',
+            [self.lease_name, _now()]
+        )
+        return rows[0]["holder"] if rows else None
+
+    async def release(self) -> None:
+        """释放自己持有的租约，让其他 worker 立即接管"""
+        self._lease_until = 0.0
+        db = Tortoise.get_connection("default")
+        await db.execute_query(
+            'DELETE FROM "scheduler_leases" WHERE "name" = ? AND "holder" = ?',
+            [self.lease_name, self.holder]
+        )
+
+    async def _next_run_times(self) -> dict:
+        """按上次开始运行的时间计算各任务的下一次运行时间，从未运行过的任务在一个周期后运行"""
+        states = {
+            state.name: state
+            for state in await ScheduledJobState.filter(name__in=[job.name for job in self.jobs])
+        }
+        now = datetime.now()
+        result = {}
+        for job in self.jobs:
+            state = states.get(job.name)
+            if state is None or state.last_started_at is None:
+                result[job.name] = now + job.interval
+            else:
+                result[job.name] = max(now, storage_datetime(state.last_started_at) + job.interval)
+        return result
+
+    async def _run_job(self, job: Job) -> None:
+        """运行一个任务并记录状态；租约已失效时跳过，避免与新的主节点重复运行"""
+        if not self.is_leader:
+            return
+        db = Tortoise.get_connection("default")
+        await db.execute_query(
+            'INSERT INTO "scheduled_jobs" ("name", "holder", "last_started_at", "last_status") '
+            'VALUES (?, ?, ?, \'running\') '
+            'ON CONFLICT ("name") DO UPDATE SET "holder" = excluded."holder", '
+            '"last_started_at" = excluded."last_started_at", "last_status" = excluded."last_status"',
+            [job.name, self.holder, _now()]
+        )
+
+        started = time.perf_counter()
+        status, error = "success", None
+        try:
+            await job.func()
+        except Exception as e:
+            status, error = "failed", str(e)
+            print(f"[{datetime.now()}] {job.title}失败：{error}")
+
+        duration = time.perf_counter() - started
+        JOB_RUNS.inc(job.name, status)
+        JOB_DURATION.observe(duration, job.name)
+        await db.execute_query(
+            'UPDATE "scheduled_jobs" SET "last_finished_at" = ?, "last_status" = ?, '
+            '"last_error" = ?, "last_duration" = ? WHERE "name" = ?',
+            [_now(), status, error, round(duration, 3), job.name]
+        )
+
+    async def _start_jobs(self) -> None:
+        next_run_times = await self._next_run_times()
+        scheduler = AsyncIOScheduler()
+        for job in self.jobs:
+            scheduler.add_job(
+                self._run_job,
+                "interval",
+                args=[job],
+                id=job.name,
+                seconds=job.interval.total_seconds(),
+                next_run_time=next_run_times[job.name],
+                max_instances=1,
+                coalesce=True,
+                misfire_grace_time=None
+            )
+        scheduler.start()
+        self.scheduler = scheduler
+        started = f"，已启动 {len(self.jobs)} 个定时任务" if self.jobs else ""
+        print(f"[{datetime.now()}] 本进程（{self.holder}）成为{self.title}主节点{started}")
+
+    def _stop_jobs(self) -> None:
+        if self.scheduler:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+            stopped = "，已停止定时任务" if self.jobs else ""
+            print(f"[{datetime.now()}] 本进程（{self.holder}）不再是{self.title}主节点{stopped}")
+
+    async def _loop(self) -> None:
+        """每隔租约时长的三分之一尝试获取或续期租约"""
+        while True:
+            try:
+                leader = await self.try_acquire()
+            except Exception as e:
+                # 无法确认租约（如数据库繁忙）时按失去租约处理
+                leader = False
+                self._lease_until = 0.0
+                print(f"[{datetime.now()}] {self.title}租约续期失败：{str(e)}")
+
+            if leader and not self.scheduler:
+                await self._start_jobs()
+            elif not leader and self.scheduler:
+                self._stop_jobs()
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self, release: bool = True) -> None:
+        """停止竞选和调度；release 为 False 时模拟异常退出，保留租约直到过期"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._stop_jobs()
+        if release:
+            await self.release()
+        else:
+            self._lease_until = 0.0
@@ -0,0 +1,336 @@
+"""
+测试处理时效分析：统计表增量维护无差异，分位数、直方图、超时数与逐条计算一致，
+旧数据库补充完成时间列，并统计一年数据量的查询耗时
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from tortoise import Tortoise
+from app.api.work_orders import (
+    create_work_orders_batch,
+    assign_work_order,
+    update_work_order,
+    delete_work_order,
+    get_work_orders_analytics,
+    API_TOKEN
+)
+from app.models.models import (
+    Users, WorkOrders, WorkOrdersArchive, WorkOrderDurationStats, ProblemType, SolutionType, storage_datetime
+)
+from app.schemas.work_order import WorkOrderBatchCreate, WorkOrderUpdate
+from app.services.analytics import (
+    BUCKETS,
+    METRICS,
+    PERCENTILES,
+    ensure_completed_at,
+    reconcile_duration_stats,
+    resolution_analytics
+)
+from app.tasks.archive import archive_completed_orders
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ORDER_COUNT = 400
+PROBLEM_TYPES = ["硬件故障", "软件故障"]
+SLA_ASSIGN = 1800
+SLA_COMPLETE = 86400
+BENCH_ROWS = 1000000
+BENCH_USERS = 20
+
+async def init_db(db_path: str):
+    await init_test_db(db_path)
+    for name in PROBLEM_TYPES:
+        await ProblemType.create(name=name)
+    await SolutionType.create(name="更换")
+
+async def create_history(users: list, admin: Users) -> list:
+    """通过接口创建、签收、完成工单，把各时间点分散开后全量生成统计"""
+    items = [
+        {"reporter_name": f"张三{i}", "contact_phone": "13800000000",
+         "location": "三楼机房", "problem_desc": "打印机无法打印"}
+        for i in range(ORDER_COUNT)
+    ]
+    result = await create_work_orders_batch(WorkOrderBatchCreate(items=items), token=f"Bearer {API_TOKEN}")
+    ids = [item.id for item in result.results]
+
+    for order_id in ids[:300]:
+        await assign_work_order(order_id, current_user=random.choice(users))
+    for order_id in ids[:200]:
+        await update_work_order(order_id, WorkOrderUpdate(
+            status=2, problem_type=random.choice(PROBLEM_TYPES),
+            processing_desc="已处理", solution_type="更换"
+        ), current_user=admin)
+
+    now = datetime.now()
+    for order_id in ids:
+        order = await WorkOrders.get(id=order_id)
+        created_at = now - timedelta(seconds=random.randint(0, 20 * 86400), microseconds=random.randint(0, 999999))
+        changes = {"created_at": created_at}
+        if order.assigned_time is not None:
+            changes["assigned_time"] = created_at + timedelta(seconds=random.randint(0, 7200))
+        if order.completed_at is not None:
+            changes["completed_at"] = changes["assigned_time"] + timedelta(seconds=random.randint(0, 3 * 86400))
+        await WorkOrders.filter(id=order_id).update(**changes)
+    await reconcile_duration_stats()
+    return ids
+
+async def apply_transitions(ids: list, users: list, admin: Users):
+    """通过接口继续签收、编辑、完成、归档和删除，统计表增量维护"""
+    for order_id in ids[300:350]:
+        await assign_work_order(order_id, current_user=random.choice(users))
+    for order_id in ids[:40]:
+        await update_work_order(order_id, WorkOrderUpdate(problem_type=random.choice(PROBLEM_TYPES)), current_user=admin)
+    for order_id in ids[200:260]:
+        await update_work_order(order_id, WorkOrderUpdate(
+            status=2, problem_type=random.choice(PROBLEM_TYPES),
+            processing_desc="已处理", solution_type="更换"
+        ), current_user=admin)
+
+    await WorkOrders.filter(id__in=ids[:80]).update(modified_at=datetime.now() - timedelta(days=30))
+    await archive_completed_orders()
+
+    for order_id in ids[-10:] + ids[100:110]:
+        await delete_work_order(order_id, current_user=admin)
+
+async def check_incremental():
+    """增量维护的统计与工单表重新计算的结果一致"""
+    result = await reconcile_duration_stats()
+    assert result["drift"] == 0, result
+    logger.info(f"√ 增量维护的处理时效统计与对账结果一致（{result['rows']} 行）")
+
+def nearest_rank(values: list, p: int):
+    return values[(len(values) * p + 99) // 100 - 1] if values else None
+
+def bucket_bounds(value: int):
+    """精确值所在分桶的上下界"""
+    index = bisect_left(BUCKETS, value)
+    return (BUCKETS[index - 1] if index else 0), (BUCKETS[index] if index < len(BUCKETS) else None)
+
+async def expected_analytics(group_by: str, start=None, end=None, **filters) -> dict:
+    """逐条读取工单（含归档表），用 Python 计算期望结果"""
+    rows = []
+    for model in (WorkOrders, WorkOrdersArchive):
+        query = model.all()
+        if start is not None:
+            query = query.filter(created_at__gte=start)
+        if end is not None:
+            query = query.filter(created_at__lte=end)
+        if "status" in filters:
+            query = query.filter(status=filters["status"])
+        if "problem_type" in filters:
+            query = query.filter(problem_type=filters["problem_type"])
+        if "assigned_to" in filters:
+            query = query.filter(assigned_to_id=filters["assigned_to"])
+        if "order_no" in filters:
+            query = query.filter(order_no__icontains=filters["order_no"])
+        rows.extend(await query.values(
+            "created_at", "assigned_time", "completed_at", "status", "problem_type", "assigned_to_id"
+        ))
+    now = datetime.now()
+    groups = defaultdict(list)
+    for row in rows:
+        key = {
+            "none": None,
+            "problem_type": row["problem_type"] or None,
+            "assignee": row["assigned_to_id"],
+            "day": row["created_at"].date().isoformat(),
+        }[group_by]
+        groups[key].append(row)
+
+    result = {}
+    for key, items in groups.items():
+        result[key] = {}
+        for metric, sla in (("assign", SLA_ASSIGN), ("complete", SLA_COMPLETE)):
+            end_column, open_status, edges = METRICS[metric]
+            values = sorted(
+                WorkOrderDurationStats.duration(row["created_at"], row[end_column])
+                for row in items if row[end_column] is not None
+            )
+            histogram = [0] * (len(edges) + 1)
+            for value in values:
+                histogram[bisect_left(edges, value)] += 1
+            result[key][metric] = {
+                "count": len(values),
+                "avg": round(sum(values) / len(values)) if values else None,
+                **{f"p{p}": nearest_rank(values, p) for p in PERCENTILES},
+                "histogram": histogram,
+                "breaches": sum(1 for value in values if value > sla),
+                "overdue": sum(
+                    1 for row in items
+                    if row["status"] < open_status
+                    and (now - storage_datetime(row["created_at"])).total_seconds() > sla
+                ),
+            }
+    return result
+
+async def compare(group_by: str, start=None, end=None, **filters):
+    db = Tortoise.get_connection("default")
+    expected = await expected_analytics(group_by, start, end, **filters)
+    actual = await resolution_analytics(
+        db, group_by, SLA_ASSIGN, SLA_COMPLETE, start=start, end=end, **filters
+    )
+    context = (group_by, start, end, filters)
+    assert {group["key"] for group in actual} == set(expected), context
+    for group in actual:
+        for metric in ("assign", "complete"):
+            want, got = expected[group["key"]][metric], group[metric]
+            for field in ("count", "avg", "breaches", "overdue"):
+                assert got[field] == want[field], (context, metric, field, got[field], want[field])
+            assert [bucket["count"] for bucket in got["histogram"]] == want["histogram"], (context, metric)
+            for p in PERCENTILES:
+                if want[f"p{p}"] is None:
+                    assert got[f"p{p}"] is None, (context, metric, p)
+                    continue
+                # 分位数是桶内插值的估计值，应落在精确值所在的分桶内
+                lower, upper = bucket_bounds(want[f"p{p}"])
+                assert lower <= got[f"p{p}"] <= (upper or float("inf")), (context, metric, p)
+
+async def check_distributions(users: list):
+    """各分组方式、时间范围与过滤条件下的结果与逐条计算一致"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    ranges = [
+        (None, None),
+        (today - timedelta(days=7), today + timedelta(hours=23, minutes=59, seconds=59)),
+        (today - timedelta(days=12, hours=-7), today - timedelta(days=2, hours=3)),
+        (today - timedelta(days=3, hours=-1), today - timedelta(days=3, hours=-20)),
+    ]
+    filters = [{}, {"status": 3}, {"problem_type": "硬件故障"}, {"assigned_to": users[0].id}, {"order_no": "-01"}]
+    for group_by in ("none", "problem_type", "assignee", "day"):
+        for start, end in ranges:
+            for conditions in filters:
+                await compare(group_by, start, end, **conditions)
+    logger.info(f"√ {4 * len(ranges) * len(filters)} 组分组、时间范围与过滤条件的结果与逐条计算一致")
+
+async def check_endpoint(users: list):
+    """接口按签收人分组时附带姓名，过滤条件生效"""
+    result = await get_work_orders_analytics(
+        group_by="assignee", sla_assign_minutes=30, sla_complete_hours=24,
+        start_date=None, end_date=None, status=3, problem_type=None,
+        order_no=None, assigned_to=None, current_user=users[0]
+    )
+    labels = {group["label"] for group in result["groups"]}
+    assert labels <= {user.full_name for user in users}, labels
+    archived = await WorkOrdersArchive.all().count()
+    assert archived and not await WorkOrders.filter(status=3).exists(), "已归档的工单都已移到归档表"
+    assert sum(group["complete"]["count"] for group in result["groups"]) == archived
+    logger.info("√ 分析接口过滤与分组正确")
+
+async def check_backfill(tmp_dir: str):
+    """已有数据库没有完成时间列时补充该列，并从日志或修改时间回填"""
+    db_path = os.path.join(tmp_dir, "old.sqlite3")
+    connection = sqlite3.connect(db_path)
+    connection.executescript('''
+        CREATE TABLE "work_orders" (
+            "id" INTEGER PRIMARY KEY, "status" INT NOT NULL,
+            "created_at" TIMESTAMP NOT NULL, "modified_at" TIMESTAMP NOT NULL
+        );
+        CREATE TABLE "work_order_logs" (
+            "id" INTEGER PRIMARY KEY, "work_order_id" INT NOT NULL, "action" VARCHAR(20) NOT NULL,
+            "status_to" INT, "created_at" TIMESTAMP NOT NULL
+        );
+        INSERT INTO "work_orders" VALUES
+            (1, 2, '2024-01-01 08:00:00', '2024-01-02 10:00:00'),
+            (2, 3, '2024-01-01 08:00:00', '2024-03-01 00:00:00'),
+            (3, 1, '2024-01-01 08:00:00', '2024-01-01 09:00:00');
+        INSERT INTO "work_order_logs" VALUES
+            (1, 2, 'status', 2, '2024-01-01 18:00:00');
+    ''')
+    connection.commit()
+    connection.close()
+
+    await Tortoise.init(db_url=f"sqlite://{db_path}", modules={"models": ["app.models.models"]})
+    try:
+        db = Tortoise.get_connection("default")
+        await ensure_completed_at(db)
+        await ensure_completed_at(db)
+        rows = await db.execute_query_dict('SELECT "id", "completed_at" FROM "work_orders" ORDER BY "id"')
+    finally:
+        await Tortoise.close_connections()
+    assert [str(row["completed_at"]) for row in rows] == [
+        "2024-01-02 10:00:00", "2024-01-01 18:00:00", "None"
+    ], rows
+    logger.info("√ 旧数据库已补充完成时间列并回填")
+
+async def bench_year():
+    """生成一年的工单数据，统计对账和分析查询耗时"""
+    db = Tortoise.get_connection("default")
+    await db.execute_query('DELETE FROM "work_orders"')
+    for i in range(BENCH_USERS):
+        await Users.create(username=f"bench{i}", password_hash="x", full_name=f"压测{i}")
+    first_user = await Users.filter(username="bench0").first().values_list("id", flat=True)
+
+    started = time.perf_counter()
+    await db.execute_query(f'''
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {BENCH_ROWS})
+        INSERT INTO "work_orders" (
+            "order_no", "reporter_name", "contact_phone", "location", "problem_desc", "status",
+            "problem_type", "assigned_to_id", "created_at", "modified_at", "assigned_time", "completed_at"
+        )
+        SELECT 'B' || n, '张三', '13800000000', '三楼机房', '打印机无法打印', status,
+               CASE n % 3 WHEN 0 THEN '硬件故障' WHEN 1 THEN '软件故障' END,
+               CASE WHEN status > 0 THEN {first_user} + n % {BENCH_USERS} END,
+               datetime('now', '-' || minutes || ' minutes'),
+               datetime('now'),
+               CASE WHEN status > 0 THEN datetime('now', '-' || minutes || ' minutes', '+' || (n * 7 % 7200) || ' seconds') END,
+               CASE WHEN status > 1 THEN datetime('now', '-' || minutes || ' minutes', '+' || (n * 13 % 259200) || ' seconds') END
+        FROM (
+            -- 最近三天的工单处于各个状态，更早的已归档
+            SELECT n, n % 525600 AS minutes, CASE WHEN n % 525600 < 4320 THEN n % 4 ELSE 3 END AS status
+            FROM seq
+        )
+    ''')
+    logger.info(f"生成 {BENCH_ROWS} 个工单，耗时 {time.perf_counter() - started:.2f} 秒")
+
+    result = await reconcile_duration_stats()
+    logger.info(f"全量生成处理时效统计 {result['rows']} 行，耗时 {result['duration']} 秒")
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cases = [
+        ("none", None, None),
+        ("problem_type", None, None),
+        ("assignee", None, None),
+        ("day", None, None),
+        ("none", today - timedelta(days=365, hours=-9), today + timedelta(hours=18)),
+    ]
+    for group_by, start, end in cases:
+        started = time.perf_counter()
+        groups = await resolution_analytics(db, group_by, SLA_ASSIGN, SLA_COMPLETE, start=start, end=end)
+        elapsed = time.perf_counter() - started
+        logger.info(f"按 {group_by} 分组（{len(groups)} 组，范围 {start} ~ {end}）分析耗时 {elapsed:.3f} 秒")
+
+async def run_test():
+    """运行测试"""
+    random.seed(16)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await check_backfill(tmp_dir)
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            admin = await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+            users = [
+                await Users.create(username=f"u{i}", password_hash="x", full_name=f"用户{i}")
+                for i in range(3)
+            ]
+            ids = await create_history(users, admin)
+            await apply_transitions(ids, users, admin)
+            await check_incremental()
+            await check_distributions(users)
+            await check_endpoint(users)
+            await bench_year()
+        finally:
+            await Tortoise.close_connections()
+
+def test_analytics():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
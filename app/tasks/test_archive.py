@@ -0,0 +1,120 @@
+"""
+测试自动归档：超过一个批次的工单分批归档，检查批次数、工单状态、归档日志和统计增量
+
+可直接运行: python -m app.tasks.test_archive
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from tortoise import Tortoise
+from app.models.models import (
+    Users, WorkOrders, WorkOrdersArchive, WorkOrderLogs, WorkOrderDailyStats, WorkOrderDurationStats,
+    build_model
+)
+from app.services.analytics import reconcile_duration_stats
+from app.services.statistics import reconcile_daily_stats
+from app.tasks.archive import archive_completed_orders
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5
+EXPIRED = CHUNK_SIZE * 2 + 3  # 已完成且超过归档时间，分三批归档
+RECENT = 2  # 刚完成，未到归档时间
+PROCESSING = 2  # 处理中，不归档
+
+async def init_db(db_path: str) -> list:
+    """写入工单并对账统计，返回应归档的工单 ID"""
+    await init_test_db(db_path)
+    user = await Users.create(username="u1", password_hash="x", full_name="用户1")
+    now = datetime.now()
+    earlier = now - timedelta(days=30)
+    orders = []
+    for i in range(EXPIRED + RECENT + PROCESSING):
+        status = 2 if i < EXPIRED + RECENT else 1
+        modified_at = earlier if i < EXPIRED or status == 1 else now
+        created_at = modified_at - timedelta(hours=2)
+        orders.append(build_model(
+            WorkOrders,
+            order_no=f"ARCH-{i:05d}", reporter_name=f"张三{i}", contact_phone="13800000000",
+            location="三楼", problem_desc=f"打印机卡纸 {i}", status=status,
+            problem_type="硬件故障" if i % 2 else "软件故障", assigned_to_id=user.id,
+            created_at=created_at, modified_at=modified_at,
+            assigned_time=created_at + timedelta(minutes=10),
+            completed_at=modified_at if status == 2 else None
+        ))
+    await WorkOrders.bulk_create(orders)
+    await reconcile_daily_stats()
+    await reconcile_duration_stats()
+    return await WorkOrders.filter(order_no__lt=f"ARCH-{EXPIRED:05d}").order_by("id").values_list("id", flat=True)
+
+async def daily_counts() -> Counter:
+    """每日统计按状态汇总的工单数"""
+    counts = Counter()
+    for status, count in await WorkOrderDailyStats.all().values_list("status", "count"):
+        counts[status] += count
+    return counts
+
+async def duration_counts() -> Counter:
+    """处理时效统计按 (指标, 状态) 汇总的工单数和耗时"""
+    counts = Counter()
+    for metric, status, count, seconds in await WorkOrderDurationStats.all().values_list(
+        "metric", "status", "count", "seconds"
+    ):
+        counts[(metric, status, "count")] += count
+        counts[(metric, status, "seconds")] += seconds
+    return counts
+
+async def check_chunks(expired_ids: list):
+    daily_before = await daily_counts()
+    duration_before = await duration_counts()
+
+    result = await archive_completed_orders(chunk_size=CHUNK_SIZE)
+    assert (result["archived"], result["chunks"], result["moved"]) == (EXPIRED, 3, 0), result
+    logger.info(f"√ {EXPIRED} 个工单分 {result['chunks']} 批归档")
+
+    archived = await WorkOrdersArchive.all().order_by("id").values("id", "status", "archived_at", "modified_at")
+    assert [row["id"] for row in archived] == list(expired_ids), archived
+    assert all(row["status"] == 3 and row["archived_at"] == row["modified_at"] for row in archived), archived
+    assert Counter(await WorkOrders.all().values_list("status", flat=True)) == {2: RECENT, 1: PROCESSING}
+    logger.info("√ 只有超过归档时间的已完成工单被归档并移到归档表")
+
+    logs = await WorkOrderLogs.filter(action="archived").values_list("work_order_id", "status_from", "status_to")
+    assert sorted(logs) == [(order_id, 2, 3) for order_id in expired_ids], logs
+    logger.info("√ 每个归档的工单写入一条归档日志")
+
+    daily_after = await daily_counts()
+    assert daily_after - daily_before == {3: EXPIRED}, (daily_before, daily_after)
+    assert daily_before - daily_after == {2: EXPIRED}, (daily_before, daily_after)
+    duration_after = await duration_counts()
+    for metric in ("assign", "complete"):
+        for column in ("count", "seconds"):
+            moved = duration_before[(metric, 2, column)] - duration_after[(metric, 2, column)]
+            assert moved > 0 and duration_after[(metric, 3, column)] - duration_before[(metric, 3, column)] == moved
+    assert (await reconcile_daily_stats())["drift"] == 0
+    assert (await reconcile_duration_stats())["drift"] == 0
+    logger.info("√ 统计按批次从已完成移到已归档，对账无偏差")
+
+    result = await archive_completed_orders(chunk_size=CHUNK_SIZE)
+    assert (result["archived"], result["chunks"]) == (0, 0), result
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        expired_ids = await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            await check_chunks(expired_ids)
+        finally:
+            await Tortoise.close_connections()
+
+def test_archive():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,170 @@
+"""
+测试已归档工单的冷存储：归档任务把工单移到归档表、待处理列表只查询在用表、
+包含已归档工单的列表和导出合并两张表、按 ID 读取、修改和删除已归档的工单，
+以及升级前已归档工单的迁移和全文索引重建
+
+可直接运行: python -m app.tasks.test_archive_store
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.core.security import create_access_token
+from app.models.models import Users, WorkOrders, WorkOrdersArchive, build_model
+from app.services.archive_store import includes_archived, move_archived_orders
+from app.services.search import rebuild_search_index
+from app.services.statistics import reconcile_daily_stats
+from app.tasks.archive import archive_completed_orders
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+LIST_URL = "/api/v1/work-orders"
+COMPLETED = 10
+PENDING = 3
+
+async def init_db(db_path: str) -> Users:
+    await init_test_db(db_path)
+    admin = await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+    await Users.create(username="staff", password_hash="x", full_name="值班员")
+    # 已完成的工单最后修改在一个月前，到达归档时间；创建时间相同的工单按 ID 排序
+    earlier = datetime.now() - timedelta(days=30)
+    orders = []
+    for i in range(COMPLETED + PENDING):
+        completed = i < COMPLETED
+        orders.append(build_model(
+            WorkOrders,
+            order_no=f"COLD-{i:05d}", reporter_name=f"张三{i}", contact_phone="13800000000",
+            location="三楼", problem_desc=f"{'打印机卡纸' if completed else '网络断开'} {i}",
+            status=2 if completed else 1, assigned_to_id=admin.id,
+            processing_desc="已处理" if completed else None,
+            created_at=earlier + timedelta(hours=i // 2), modified_at=earlier, assigned_time=earlier,
+            completed_at=earlier if completed else None
+        ))
+    await WorkOrders.bulk_create(orders)
+    await reconcile_daily_stats()
+    return admin
+
+async def check_archive():
+    """归档任务把工单移到归档表，统计不受影响"""
+    assert not includes_archived(status_lt=3) and includes_archived(status=3) and includes_archived()
+    result = await archive_completed_orders(chunk_size=4)
+    assert (result["archived"], result["chunks"], result["moved"]) == (COMPLETED, 3, 0), result
+    assert await WorkOrders.all().count() == PENDING
+    assert await WorkOrdersArchive.filter(status=3, archived_at__isnull=False).count() == COMPLETED
+    assert (await reconcile_daily_stats())["drift"] == 0
+    logger.info("√ 已归档的工单移到归档表，统计无偏差")
+
+async def check_list(client: httpx.AsyncClient):
+    """待处理列表只含在用表；不限状态的列表合并两张表，游标分页顺序与总数正确"""
+    response = await client.get(LIST_URL, params={"status_lt": 3, "with_total": True})
+    page = response.json()
+    assert page["total"] == PENDING and all(item["status"] == 1 for item in page["items"]), page
+
+    expected = [
+        (order["created_at"], order["id"])
+        for order in await WorkOrders.all().values("created_at", "id")
+    ] + [
+        (order["created_at"], order["id"])
+        for order in await WorkOrdersArchive.all().values("created_at", "id")
+    ]
+    expected = [order_id for _, order_id in sorted(expected, reverse=True)]
+
+    seen = []
+    params = {"limit": 4, "with_total": True}
+    while True:
+        page = (await client.get(LIST_URL, params=params)).json()
+        assert page["total"] == COMPLETED + PENDING, page
+        seen.extend(item["id"] for item in page["items"])
+        if not page["next_cursor"]:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert seen == expected, (seen, expected)
+
+    page = (await client.get(LIST_URL, params={"status": 3, "with_total": True, "limit": 100})).json()
+    assert page["total"] == len(page["items"]) == COMPLETED
+    assert all(item["assigned_to"]["full_name"] == "管理员" for item in page["items"])
+
+    archived_id = page["items"][0]["id"]
+    response = await client.get(f"{LIST_URL}/{archived_id}")
+    assert response.status_code == 200 and response.json()["status"] == 3, response.text
+
+    export = await client.get(f"{LIST_URL}/export")
+    assert export.status_code == 200
+    assert all(f"COLD-{i:05d}" in export.text for i in range(COMPLETED + PENDING)), export.text
+    logger.info("√ 列表、按 ID 读取和导出包含归档表中的工单")
+
+async def check_search(client: httpx.AsyncClient):
+    """全文索引重建时包含归档表，检索结果包含已归档的工单"""
+    db = Tortoise.get_connection("default")
+    assert await rebuild_search_index(db) == COMPLETED + PENDING
+    page = (await client.get(LIST_URL, params={"q": "打印机卡纸", "limit": 100, "with_total": True})).json()
+    assert page["total"] == len(page["items"]) == COMPLETED, page
+    logger.info("√ 全文索引重建包含已归档的工单")
+
+async def check_write(client: httpx.AsyncClient, staff_headers: dict):
+    """修改或删除已归档的工单时先移回在用表，之后由归档任务再次移出"""
+    archived_id = (await WorkOrdersArchive.all().order_by("id").first()).id
+
+    response = await client.put(f"{LIST_URL}/{archived_id}", json={"processing_desc": "补充说明"}, headers=staff_headers)
+    assert response.status_code != 200 and await WorkOrdersArchive.exists(id=archived_id), "非管理员不能修改已归档的工单"
+
+    response = await client.put(f"{LIST_URL}/{archived_id}", json={"processing_desc": "补充说明"})
+    assert response.status_code == 200 and response.json()["processing_desc"] == "补充说明", response.text
+    assert not await WorkOrdersArchive.exists(id=archived_id)
+    assert (await WorkOrders.get(id=archived_id)).status == 3
+
+    result = await archive_completed_orders()
+    assert (result["archived"], result["moved"]) == (0, 1), result
+    assert (await WorkOrdersArchive.get(id=archived_id)).processing_desc == "补充说明"
+
+    deleted_id = (await WorkOrdersArchive.all().order_by("-id").first()).id
+    response = await client.delete(f"{LIST_URL}/{deleted_id}")
+    assert response.status_code == 200, response.text
+    assert not await WorkOrders.exists(id=deleted_id) and not await WorkOrdersArchive.exists(id=deleted_id)
+    assert (await client.get(f"{LIST_URL}/{deleted_id}")).status_code != 200
+    assert (await reconcile_daily_stats())["drift"] == 0
+    logger.info("√ 修改和删除已归档的工单后统计无偏差")
+
+async def check_legacy():
+    """升级前已归档、仍在在用表中的工单分批移到归档表"""
+    order = await WorkOrders.filter(status=1).first()
+    await WorkOrders.filter(id=order.id).update(status=3, archived_at=datetime.now())
+    assert await move_archived_orders(chunk_size=1) == 1
+    assert await WorkOrdersArchive.exists(id=order.id) and not await WorkOrders.filter(status=3).exists()
+    assert await move_archived_orders() == 0
+    logger.info("√ 在用表中的已归档工单已迁移")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            token = create_access_token(data={"sub": "admin"})
+            staff_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'staff'})}"}
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://test",
+                headers={"Authorization": f"Bearer {token}"}
+            ) as client:
+                await check_archive()
+                await check_list(client)
+                await check_search(client)
+                await check_write(client, staff_headers)
+                await check_legacy()
+        finally:
+            await Tortoise.close_connections()
+
+def test_archive_store():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
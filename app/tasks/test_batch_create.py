@@ -0,0 +1,113 @@
+"""
+测试批量创建工单：逐条返回结果、编号连续、全文索引可检索，并统计写入速度
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from tortoise import Tortoise
+from app.api.work_orders import create_work_order, create_work_orders_batch, API_TOKEN
+from app.core.config import settings
+from app.core.database import get_read_db
+from app.models.models import WorkOrders
+from app.schemas.work_order import WorkOrderBatchCreate, WorkOrderCreate
+from app.services.search import search_work_order_ids
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TOKEN = f"Bearer {API_TOKEN}"
+BENCH_BATCHES = 20
+
+def make_item(i: int) -> dict:
+    return {
+        "reporter_name": f"张三{i}",
+        "contact_phone": f"1380000{i:04d}",
+        "location": "三楼机房",
+        "problem_desc": f"打印机卡纸 {i}"
+    }
+
+async def check_partial_failure():
+    """不合法的条目单独失败，其余工单正常创建"""
+    items = [make_item(0), {"reporter_name": "缺少字段"}, make_item(2)]
+    result = await create_work_orders_batch(WorkOrderBatchCreate(items=items), token=TOKEN)
+
+    assert result.created == 2 and result.failed == 1, result
+    assert [item.success for item in result.results] == [True, False, True]
+    assert "contact_phone" in result.results[1].error
+    assert result.results[0].order_no.endswith("-001")
+    assert result.results[2].order_no.endswith("-002")
+
+    order = await WorkOrders.get(id=result.results[2].id)
+    assert order.reporter_name == "张三2" and order.status == 0
+    logger.info("√ 单条校验失败不影响同批其他工单")
+
+async def check_numbering_with_single_create():
+    """批量创建与单个创建交错时编号依然唯一且连续"""
+    single = WorkOrderCreate(**make_item(9))
+    batch = WorkOrderBatchCreate(items=[make_item(i) for i in range(50)])
+    outcomes = await asyncio.gather(
+        create_work_order(single, token=TOKEN),
+        create_work_orders_batch(batch, token=TOKEN),
+        create_work_order(single, token=TOKEN),
+        create_work_orders_batch(batch, token=TOKEN)
+    )
+
+    order_nos = [outcomes[0].order_no, outcomes[2].order_no]
+    for result in (outcomes[1], outcomes[3]):
+        order_nos.extend(item.order_no for item in result.results)
+    numbers = sorted(int(no.rsplit("-", 1)[-1]) for no in order_nos)
+    assert numbers == list(range(3, 3 + 102)), "工单编号不连续"
+    logger.info("√ 与单个创建交错时编号唯一且连续")
+
+async def check_search_index():
+    """批量创建的工单可以被全文检索到"""
+    ids = await search_work_order_ids("卡纸", get_read_db())
+    assert len(ids) == 104, len(ids)
+    logger.info("√ 批量创建的工单已写入全文索引")
+
+async def check_limit():
+    """超过单次上限时拒绝整个请求"""
+    items = [make_item(i) for i in range(settings.WORK_ORDER_BATCH_SIZE + 1)]
+    try:
+        await create_work_orders_batch(WorkOrderBatchCreate(items=items), token=TOKEN)
+    except Exception as e:
+        assert getattr(e, "status_code", None) == 400, e
+    else:
+        raise AssertionError("超过上限的请求未被拒绝")
+    logger.info("√ 超过单次上限时拒绝请求")
+
+async def bench_throughput():
+    """按最大批量连续写入，统计每秒创建的工单数"""
+    batch = WorkOrderBatchCreate(
+        items=[make_item(i) for i in range(settings.WORK_ORDER_BATCH_SIZE)]
+    )
+    started = time.perf_counter()
+    for _ in range(BENCH_BATCHES):
+        await create_work_orders_batch(batch, token=TOKEN)
+    elapsed = time.perf_counter() - started
+
+    count = BENCH_BATCHES * settings.WORK_ORDER_BATCH_SIZE
+    logger.info(f"批量写入 {count} 个工单，耗时 {elapsed:.2f} 秒，约 {count / elapsed:.0f} 个/秒")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_test_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            await check_partial_failure()
+            await check_numbering_with_single_create()
+            await check_search_index()
+            await check_limit()
+            await bench_throughput()
+        finally:
+            await Tortoise.close_connections()
+
+def test_batch_create():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,147 @@
+"""
+测试每日统计：工单变化时增量维护、对账无差异，以及任意时间范围的统计与直接扫描一致
+"""
+import asyncio
+import logging
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from app.api.work_orders import (
+    create_work_orders_batch,
+    assign_work_order,
+    update_work_order,
+    delete_work_order,
+    API_TOKEN
+)
+from app.models.models import Users, WorkOrders, WorkOrdersArchive, ProblemType, SolutionType
+from app.schemas.work_order import WorkOrderBatchCreate, WorkOrderUpdate
+from app.services.statistics import count_buckets, raw_buckets, reconcile_daily_stats
+from app.tasks.archive import archive_completed_orders
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ORDER_COUNT = 300
+DAYS = 10
+PROBLEM_TYPES = ["硬件故障", "软件故障"]
+
+async def init_db(db_path: str):
+    await init_test_db(db_path)
+    for name in PROBLEM_TYPES:
+        await ProblemType.create(name=name)
+    await SolutionType.create(name="更换")
+
+async def create_history() -> list:
+    """创建工单并把创建时间分散到最近几天，然后全量生成统计"""
+    items = [
+        {"reporter_name": f"张三{i}", "contact_phone": "13800000000",
+         "location": "三楼机房", "problem_desc": "打印机无法打印"}
+        for i in range(ORDER_COUNT)
+    ]
+    result = await create_work_orders_batch(WorkOrderBatchCreate(items=items), token=f"Bearer {API_TOKEN}")
+    ids = [item.id for item in result.results]
+
+    now = datetime.now()
+    async with in_transaction("default"):
+        for order_id in ids:
+            created_at = now - timedelta(minutes=random.randint(0, DAYS * 24 * 60))
+            await WorkOrders.filter(id=order_id).update(created_at=created_at, modified_at=created_at)
+    await reconcile_daily_stats()
+    return ids
+
+async def apply_transitions(ids: list, users: list, admin: Users):
+    """通过接口执行签收、编辑、完成、归档和删除"""
+    random.shuffle(ids)
+    for order_id in ids[:200]:
+        await assign_work_order(order_id, current_user=random.choice(users))
+    for order_id in ids[:150]:
+        order = await WorkOrders.get(id=order_id)
+        await update_work_order(order_id, WorkOrderUpdate(
+            problem_type=random.choice(PROBLEM_TYPES)
+        ), current_user=admin if order.assigned_to_id is None else await order.assigned_to)
+    for order_id in ids[:100]:
+        await update_work_order(order_id, WorkOrderUpdate(
+            status=2, processing_desc="已处理", solution_type="更换"
+        ), current_user=admin)
+
+    await WorkOrders.filter(id__in=ids[:50]).update(modified_at=datetime.now() - timedelta(days=30))
+    await archive_completed_orders()
+
+    for order_id in ids[-20:]:
+        await delete_work_order(order_id, current_user=admin)
+
+async def check_incremental():
+    """增量维护的统计与工单表重新计算的结果一致"""
+    result = await reconcile_daily_stats()
+    assert result["drift"] == 0, result
+    logger.info(f"√ 增量维护的统计与对账结果一致（{result['rows']} 行）")
+
+async def check_ranges(users: list):
+    """各种时间范围与过滤条件下，统计结果与直接扫描一致"""
+    db = Tortoise.get_connection("default")
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    ranges = [
+        (None, None),
+        (today - timedelta(days=3), today + timedelta(hours=23, minutes=59, seconds=59)),
+        (today - timedelta(days=5, hours=-7), today - timedelta(days=1, hours=3)),
+        (today - timedelta(days=2, hours=-1), today - timedelta(days=2, hours=-20)),
+        (today - timedelta(days=4, hours=-6), None),
+        (None, today - timedelta(days=6, hours=-11)),
+    ]
+    filters = [
+        {},
+        {"status": 1},
+        {"problem_type": "硬件故障"},
+        {"assigned_to": users[0].id},
+        {"order_no": "-01"},
+    ]
+    for start, end in ranges:
+        for conditions in filters:
+            expected_queries = []
+            for model in (WorkOrders, WorkOrdersArchive):
+                expected_query = model.all()
+                if "status" in conditions:
+                    expected_query = expected_query.filter(status=conditions["status"])
+                if "problem_type" in conditions:
+                    expected_query = expected_query.filter(problem_type=conditions["problem_type"])
+                if "assigned_to" in conditions:
+                    expected_query = expected_query.filter(assigned_to_id=conditions["assigned_to"])
+                if "order_no" in conditions:
+                    expected_query = expected_query.filter(order_no__icontains=conditions["order_no"])
+                if end is not None:
+                    expected_query = expected_query.filter(created_at__lte=end)
+                expected_queries.append(expected_query)
+            expected = +await raw_buckets(expected_queries, start, None)
+
+            actual = await count_buckets(db, start=start, end=end, **conditions)
+            assert actual == expected, (start, end, conditions, actual, expected)
+    logger.info(f"√ {len(ranges) * len(filters)} 组时间范围与过滤条件的统计均与直接扫描一致")
+
+async def run_test():
+    """运行测试"""
+    random.seed(15)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            admin = await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+            users = [
+                await Users.create(username=f"u{i}", password_hash="x", full_name=f"用户{i}")
+                for i in range(3)
+            ]
+            ids = await create_history()
+            await apply_transitions(ids, users, admin)
+            await check_incremental()
+            await check_ranges(users)
+        finally:
+            await Tortoise.close_connections()
+
+def test_daily_stats():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,313 @@
+"""
+测试自动派单：负载最低、轮流和按问题类型匹配三种策略，负载上限、与手动签收并发时不重复分配、
+分配后的日志和统计、从数据库重建状态、批量分配的吞吐量，以及坐席设置接口、派单循环和派单主节点租约
+
+可直接运行: python -m app.tasks.test_dispatch
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.api.work_orders import API_TOKEN, assign_work_order, create_work_orders_batch, update_work_order
+from app.core.security import create_access_token
+from app.models.models import DispatchAgent, ProblemType, SolutionType, Users, WorkOrders, WorkOrderLogs
+from app.schemas.work_order import WorkOrderBatchCreate, WorkOrderUpdate
+from app.services.analytics import reconcile_duration_stats
+from app.services.dispatch import Dispatcher, dispatch_leader, dispatcher
+from app.services.statistics import reconcile_daily_stats
+from app.tasks.archive import archive_scheduler
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+PROBLEM_TYPES = ["硬件故障", "软件故障", "网络故障"]
+THROUGHPUT_ORDERS = 3000
+THROUGHPUT_AGENTS = 30
+
+async def init_db(db_path: str) -> list:
+    await init_test_db(db_path)
+    for name in PROBLEM_TYPES:
+        await ProblemType.create(name=name)
+    await SolutionType.create(name="更换")
+    await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+    agents = []
+    for name in ("a", "b", "c"):
+        user = await Users.create(username=f"agent_{name}", password_hash="x", full_name=f"坐席{name}")
+        await DispatchAgent.create(user=user)
+        agents.append(user)
+    return agents
+
+async def create_orders(count: int, problem_type: str = None) -> list:
+    """通过批量接口创建新建工单，返回 ID"""
+    items = [
+        {"reporter_name": f"张三{i}", "contact_phone": "13800000000", "location": "三楼",
+         "problem_desc": "打印机卡纸", "problem_type": problem_type}
+        for i in range(count)
+    ]
+    result = await create_work_orders_batch(WorkOrderBatchCreate(items=items), token=f"Bearer {API_TOKEN}")
+    assert result.created == count, result
+    return [item.id for item in result.results]
+
+async def assignees(ids: list) -> list:
+    """按工单 ID 顺序返回签收人"""
+    rows = dict(await WorkOrders.filter(id__in=ids).values_list("id", "assigned_to_id"))
+    return [rows[order_id] for order_id in sorted(ids)]
+
+async def check_stats():
+    assert (await reconcile_daily_stats())["drift"] == 0
+    assert (await reconcile_duration_stats())["drift"] == 0
+
+async def finish_all():
+    """把新建和处理中的工单直接改为已完成，清空负载和队列，供下一项测试使用"""
+    await WorkOrders.filter(status__in=(0, 1)).update(status=2)
+    await reconcile_daily_stats()
+    await reconcile_duration_stats()
+
+async def check_least_loaded(agents: list):
+    """分配给处理中工单最少的坐席，负载上限内分配，完成的工单在重建状态后释放负载"""
+    a, b, c = agents
+    # 坐席 a 已手动签收两个工单
+    for order_id in await create_orders(2):
+        await assign_work_order(order_id, current_user=a)
+
+    engine = Dispatcher(policy="least_loaded", max_load=4)
+    ids = await create_orders(7)
+    assert await engine.run_once() == 7 and engine.queue_size == 0
+    assert {agent.user_id: agent.load for agent in engine.agents.values()} == {a.id: 3, b.id: 3, c.id: 3}
+    for user in agents:
+        assert await WorkOrders.filter(status=1, assigned_to_id=user.id).count() == 3
+
+    order = await WorkOrders.get(id=ids[0])
+    assert order.assigned_time is not None and order.status == 1
+    logs = await WorkOrderLogs.filter(work_order_id=ids[0]).order_by("id").values_list("action", "remark")
+    assert logs == [("created", None), ("assigned", "自动派单")], logs
+    await check_stats()
+
+    # 上限为 4，只能再分配 3 个
+    more = await create_orders(5)
+    assert await engine.run_once() == 3 and engine.queue_size == 2
+    assert sum(1 for user_id in await assignees(more) if user_id) == 3
+
+    # 完成工单后负载在重建时释放
+    await update_work_order(ids[0], WorkOrderUpdate(
+        status=2, problem_type="硬件故障", processing_desc="已处理", solution_type="更换"
+    ), current_user=await Users.get(id=order.assigned_to_id))
+    assert await engine.run_once() == 0, "重建前负载未释放"
+    engine.invalidate()
+    assert await engine.run_once() == 1 and engine.queue_size == 1
+    await check_stats()
+
+    await finish_all()
+    logger.info("√ 负载最低的坐席优先，负载上限和负载释放正确")
+
+async def check_round_robin(agents: list):
+    """按用户 ID 轮流分配，跳过未启用的坐席和停用的用户"""
+    a, b, c = agents
+    engine = Dispatcher(policy="round_robin", max_load=0)
+    ids = await create_orders(6)
+    assert await engine.run_once() == 6
+    assert await assignees(ids) == [a.id, b.id, c.id] * 2
+
+    await DispatchAgent.filter(user_id=b.id).update(enabled=False)
+    await Users.filter(id=c.id).update(is_active=False)
+    engine.invalidate()
+    ids = await create_orders(2)
+    assert await engine.run_once() == 2
+    assert await assignees(ids) == [a.id, a.id]
+
+    await DispatchAgent.filter(user_id=b.id).update(enabled=True)
+    await Users.filter(id=c.id).update(is_active=True)
+    await finish_all()
+    logger.info("√ 轮流分配，未启用的坐席不参与")
+
+async def check_skill(agents: list):
+    """优先擅长该问题类型的坐席，其次不限类型的坐席"""
+    a, b, c = agents
+    await DispatchAgent.filter(user_id=a.id).update(skills=["硬件故障"])
+    await DispatchAgent.filter(user_id=b.id).update(skills=["软件故障"])
+    engine = Dispatcher(policy="skill", max_load=0)
+    hardware = await create_orders(3, "硬件故障")
+    software = await create_orders(3, "软件故障")
+    other = await create_orders(2, "网络故障") + await create_orders(2)
+    assert await engine.run_once() == 10
+    assert set(await assignees(hardware)) == {a.id}
+    assert set(await assignees(software)) == {b.id}
+    assert set(await assignees(other)) == {c.id}
+
+    # 没有空闲的匹配坐席时分配给其他空闲坐席
+    await finish_all()
+    engine = Dispatcher(policy="skill", max_load=2)
+    hardware = await create_orders(3, "硬件故障")
+    assert await engine.run_once() == 3
+    assert await assignees(hardware) == [a.id, a.id, c.id]
+    await check_stats()
+    await finish_all()
+    logger.info("√ 按问题类型匹配坐席")
+
+async def check_race(agents: list):
+    """已在队列中的工单被手动签收或删除后不再分配"""
+    a, b, _ = agents
+    engine = Dispatcher(policy="least_loaded", max_load=0)
+    ids = await create_orders(3)
+    await engine.rebuild()
+    assert engine.queue_size == 3
+    await assign_work_order(ids[0], current_user=a)
+    await (await WorkOrders.get(id=ids[1])).delete()
+
+    loads = {agent.user_id: agent.load for agent in engine.agents.values()}
+    assert await engine.run_once() == 1
+    assert (await WorkOrders.get(id=ids[0])).assigned_to_id == a.id, "手动签收不被覆盖"
+    assert await WorkOrderLogs.filter(work_order_id=ids[0], action="assigned").count() == 1
+    assert sum(agent.load for agent in engine.agents.values()) == sum(loads.values()) + 1, "未分配成功的工单归还负载"
+    await check_stats()
+    logger.info("√ 与手动签收并发时不重复分配")
+
+async def check_throughput():
+    """批量分配大量工单，负载均衡"""
+    users = []
+    for i in range(THROUGHPUT_AGENTS):
+        user = await Users.create(username=f"bulk_{i}", password_hash="x", full_name=f"坐席{i}")
+        await DispatchAgent.create(user=user)
+        users.append(user)
+    await finish_all()
+
+    ids = []
+    for _ in range(THROUGHPUT_ORDERS // 500):
+        ids.extend(await create_orders(500))
+    engine = Dispatcher(policy="least_loaded", max_load=0, batch_size=500)
+    started = time.perf_counter()
+    assert await engine.run_once() == THROUGHPUT_ORDERS
+    elapsed = time.perf_counter() - started
+
+    loads = Counter(await assignees(ids))
+    assert max(loads.values()) - min(loads.values()) <= 1, loads
+    await check_stats()
+    logger.info(f"√ 分配 {THROUGHPUT_ORDERS} 个工单耗时 {elapsed:.2f} 秒（{THROUGHPUT_ORDERS / elapsed:.0f} 个/秒）")
+
+async def check_api(client: httpx.AsyncClient, agents: list):
+    """坐席设置接口、创建工单时的问题类型校验"""
+    a = agents[0]
+    staff = {"Authorization": f"Bearer {create_access_token(data={'sub': a.username})}"}
+    url = f"/api/v1/settings/dispatch/agents/{a.id}"
+    assert (await client.put(url, json={"skills": []}, headers=staff)).status_code == 403
+    assert (await client.put(url, json={"skills": ["不存在"]})).status_code == 400
+    assert (await client.put("/api/v1/settings/dispatch/agents/9999", json={})).status_code == 404
+    response = await client.put(url, json={"enabled": True, "max_load": 2, "skills": ["网络故障"]})
+    assert response.status_code == 200, response.text
+
+    response = await client.get("/api/v1/settings/dispatch")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    agent = next(item for item in data["agents"] if item["user_id"] == a.id)
+    assert (agent["max_load"], agent["skills"]) == (2, ["网络故障"]), agent
+    assert agent["load"] == await WorkOrders.filter(status=1, assigned_to_id=a.id).count()
+
+    api = {"Authorization": f"Bearer {API_TOKEN}"}
+    order = {"reporter_name": "李四", "contact_phone": "13900000000", "location": "五楼", "problem_desc": "网络断开"}
+    response = await client.post("/api/v1/work-orders", json={**order, "problem_type": "不存在"}, headers=api)
+    assert response.status_code == 400
+    response = await client.post("/api/v1/work-orders", json={**order, "problem_type": "网络故障"}, headers=api)
+    assert response.status_code == 200 and response.json()["problem_type"] == "网络故障", response.text
+    response = await client.post(
+        "/api/v1/work-orders/batch", json={"items": [order, {**order, "problem_type": "不存在"}]}, headers=api
+    )
+    assert (response.json()["created"], response.json()["failed"]) == (1, 1), response.text
+    await check_stats()
+    logger.info("√ 坐席设置接口和问题类型校验")
+
+async def check_loop(client: httpx.AsyncClient):
+    """派单循环：新建工单立即分配，不是主节点时不派单"""
+    leader = True
+    await finish_all()
+    await DispatchAgent.all().update(max_load=None, skills=[])
+    interval = dispatcher.interval
+    dispatcher.interval = 60
+    dispatcher.start(lambda: leader)
+    try:
+        api = {"Authorization": f"Bearer {API_TOKEN}"}
+        order = {"reporter_name": "王五", "contact_phone": "13700000000", "location": "六楼", "problem_desc": "显示器闪烁"}
+
+        async def created_and_assigned() -> bool:
+            order_id = (await client.post("/api/v1/work-orders", json=order, headers=api)).json()["id"]
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if (await WorkOrders.get(id=order_id)).status == 1:
+                    return True
+            return False
+
+        # 轮询间隔很长，创建后立即被唤醒
+        assert await created_and_assigned()
+        leader = False
+        assert not await created_and_assigned(), "不是主节点时不派单"
+        assert dispatcher.queue_size == 0
+    finally:
+        await dispatcher.stop()
+        dispatcher.interval = interval
+    logger.info("√ 派单循环在新建工单后立即分配")
+
+async def check_leader(client: httpx.AsyncClient):
+    """派单使用单独的租约，定时任务未运行时也有一个 worker 派单，设置接口显示正在派单的 worker"""
+    assert not archive_scheduler.is_leader
+    assert (await client.get("/api/v1/settings/dispatch")).json()["leader"] is None
+    await dispatch_leader.start()
+    dispatcher.start(lambda: dispatch_leader.is_leader)
+    try:
+        for _ in range(100):
+            if dispatch_leader.is_leader:
+                break
+            await asyncio.sleep(0.01)
+        response = await client.post(
+            "/api/v1/work-orders",
+            json={"reporter_name": "赵六", "contact_phone": "13600000000", "location": "七楼", "problem_desc": "无法上网"},
+            headers={"Authorization": f"Bearer {API_TOKEN}"}
+        )
+        order_id = response.json()["id"]
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if (await WorkOrders.get(id=order_id)).status == 1:
+                break
+        else:
+            raise AssertionError("持有派单租约时没有派单")
+        assert (await client.get("/api/v1/settings/dispatch")).json()["leader"] == dispatch_leader.holder
+    finally:
+        await dispatcher.stop()
+        await dispatch_leader.stop()
+    assert (await client.get("/api/v1/settings/dispatch")).json()["leader"] is None
+    logger.info("√ 派单主节点租约独立于定时任务，设置接口显示正在派单的 worker")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agents = await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            token = create_access_token(data={"sub": "admin"})
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://test",
+                headers={"Authorization": f"Bearer {token}"}
+            ) as client:
+                await check_least_loaded(agents)
+                await check_round_robin(agents)
+                await check_skill(agents)
+                await check_race(agents)
+                await check_api(client, agents)
+                await check_loop(client)
+                await check_leader(client)
+                await check_throughput()
+        finally:
+            await Tortoise.close_connections()
+
+def test_dispatch():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
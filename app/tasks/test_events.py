@@ -0,0 +1,142 @@
+"""
+测试工单事件推送：断线续传、无法续传时的 reset、慢连接的背压以及多个 worker 经数据库转发事件
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from tortoise import Tortoise
+from app.models.models import WorkOrderEvent
+from app.services.events import EventBroker
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def parse(message: str) -> dict:
+    """解析一条 SSE 报文中的数据"""
+    for line in message.splitlines():
+        if line.startswith("data: "):
+            return json.loads(line[len("data: "):])
+    return {}
+
+async def read_events(stream, count: int) -> list:
+    """从事件流中读取 count 条事件（跳过 retry 和心跳）"""
+    events = []
+    async for message in stream:
+        if message.startswith("id: "):
+            events.append(parse(message))
+            if len(events) == count:
+                break
+    return events
+
+async def check_live_and_resume():
+    """连接后实时收到事件，断线后凭 Last-Event-ID 补齐错过的事件"""
+    broker = EventBroker(buffer_size=10, queue_size=10)
+    stream = broker.stream(heartbeat=0.05)
+    await stream.__anext__()  # retry 报文，此时已订阅
+    broker.publish("deleted", {"id": 1})
+    assert (await read_events(stream, 1))[0] == {"type": "deleted", "id": 1}
+    last_event_id = broker.last_event_id
+    await stream.aclose()
+    assert broker.subscriber_count == 0
+
+    broker.publish("deleted", {"id": 2})
+    broker.publish("deleted", {"id": 3})
+    resumed = broker.stream(last_event_id, heartbeat=0.05)
+    events = await read_events(resumed, 2)
+    assert [event["id"] for event in events] == [2, 3], events
+    await resumed.aclose()
+    logger.info("√ 断线续传补齐了错过的事件")
+
+async def check_reset():
+    """事件已滚出缓冲区或服务重启后，客户端收到 reset"""
+    broker = EventBroker(buffer_size=2, queue_size=10)
+    broker.publish("deleted", {"id": 1})
+    stale = broker.last_event_id
+    for order_id in range(2, 6):
+        broker.publish("deleted", {"id": order_id})
+
+    for last_event_id in (stale, "0-1", "invalid"):
+        stream = broker.stream(last_event_id, heartbeat=0.05)
+        assert (await read_events(stream, 1))[0]["type"] == "reset"
+        await stream.aclose()
+    logger.info("√ 无法续传时发送 reset")
+
+async def check_backpressure():
+    """积压超过上限的连接被断开，不影响其他连接"""
+    broker = EventBroker(buffer_size=100, queue_size=5)
+    slow = broker.stream(heartbeat=0.05)
+    fast = broker.stream(heartbeat=0.05)
+    await slow.__anext__()
+    await fast.__anext__()
+
+    received = []
+    for order_id in range(20):
+        broker.publish("deleted", {"id": order_id})
+        received.extend(await read_events(fast, 1))
+    assert len(received) == 20
+    assert broker.subscriber_count == 1
+
+    # 慢连接的积压被丢弃，随后流结束
+    remaining = [message async for message in slow]
+    assert remaining == [], remaining
+    await fast.aclose()
+    logger.info("√ 慢连接超过积压上限后被断开")
+
+async def check_workers():
+    """各 worker 的连接都能收到任一 worker 发布的事件，编号一致，重连到其他 worker 也能续传"""
+    workers = [EventBroker(buffer_size=3, queue_size=10, poll_interval=0.05) for _ in range(3)]
+    first, second, third = workers
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_test_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            await first.start()
+            await second.start()
+            stream = second.stream(heartbeat=0.05)
+            await stream.__anext__()
+            first.publish("deleted", {"id": 1})
+            second.publish("deleted", {"id": 2})
+            events = await asyncio.wait_for(read_events(stream, 2), 5)
+            assert sorted(event["id"] for event in events) == [1, 2], events
+            await stream.aclose()
+            await asyncio.sleep(0.2)
+            assert first.last_event_id == second.last_event_id
+            logger.info("√ 其他 worker 的连接收到了事件，事件编号一致")
+
+            last_event_id = second.last_event_id
+            first.publish("deleted", {"id": 3})
+            await asyncio.sleep(0.2)
+            # 新启动的 worker 从数据库载入最近的事件
+            await third.start()
+            for worker in (first, third):
+                resumed = worker.stream(last_event_id, heartbeat=0.05)
+                events = await asyncio.wait_for(read_events(resumed, 1), 5)
+                assert events == [{"type": "deleted", "id": 3}], events
+                await resumed.aclose()
+            logger.info("√ 重连到其他 worker 后续传了错过的事件")
+
+            for order_id in range(4, 10):
+                first.publish("deleted", {"id": order_id})
+            await first.stop()
+            assert await WorkOrderEvent.all().values_list("id", flat=True) == [7, 8, 9]
+            logger.info("√ 停止时写入了尚未写入的事件，表中只保留最近的事件")
+        finally:
+            for worker in workers:
+                await worker.stop()
+            await Tortoise.close_connections()
+
+async def run_test():
+    """运行测试"""
+    await check_live_and_resume()
+    await check_reset()
+    await check_backpressure()
+    await check_workers()
+
+def test_events():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,152 @@
+"""
+测试工单列表的快速序列化路径：输出与 response_model 路径逐字节一致，并对比两种路径的耗时
+
+可直接运行: python -m app.tasks.test_fast_json
+也可由 pytest 收集执行
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.models.models import Users, WorkOrders, build_model
+from app.schemas.work_order import WorkOrderPage
+from app.services import serialization
+from app.services.serialization import dumps, work_order_encoder
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+ORDER_COUNT = 5000
+BENCH_REQUESTS = 50
+
+async def init_db(db_path: str):
+    await init_test_db(db_path)
+    user = await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+    now = datetime.now()
+    orders = []
+    for i in range(ORDER_COUNT):
+        created_at = now - timedelta(minutes=i, microseconds=i)
+        order = build_model(
+            WorkOrders,
+            order_no=f"FAST-{i:05d}",
+            reporter_name=f"张三{i}",
+            contact_phone="13800000000",
+            location="三楼机房 \"A\" 区\n东侧 😀",
+            problem_desc=f"打印机卡纸 {i}\t\\ 无法打印",
+            problem_type="硬件故障" if i % 3 else None,
+            status=i % 3,
+            created_at=created_at,
+            modified_at=created_at
+        )
+        if i % 3:
+            order.assigned_to_id = user.id
+            order.assigned_time = created_at + timedelta(minutes=5)
+            order.processing_desc = "已清理卡纸" if i % 3 == 2 else None
+        orders.append(order)
+    await WorkOrders.bulk_create(orders)
+    # 同一创建时间的两条工单，翻页时按 id 区分
+    await WorkOrders.filter(order_no="FAST-00011").update(created_at=orders[10].created_at)
+
+async def fetch(client: httpx.AsyncClient, fast: bool, params: dict) -> bytes:
+    settings.FAST_JSON_RESPONSES = fast
+    response = await client.get("/api/v1/work-orders", params=params)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/json", response.headers
+    return response.content
+
+async def check_wire_format(client: httpx.AsyncClient):
+    """各种查询条件下，两种路径的响应逐字节一致（包括翻页游标）"""
+    cases = [
+        {"limit": 20},
+        {"limit": 100, "with_total": True},
+        {"limit": 7, "status": 1},
+        {"limit": 50, "status_lt": 3, "problem_type": "硬件故障"},
+        {"limit": 5, "q": "卡纸", "with_total": True},
+        {"limit": 5, "order_no": "FAST-019"},
+        {"limit": 20, "status": 9},
+    ]
+    for params in cases:
+        page = 0
+        while params is not None and page < 3:
+            slow = await fetch(client, False, params)
+            fast = await fetch(client, True, params)
+            assert fast == slow, (params, fast[:300], slow[:300])
+            cursor = json.loads(slow)["next_cursor"]
+            params = {**params, "cursor": cursor} if cursor else None
+            page += 1
+    logger.info(f"√ {len(cases)} 组查询条件下两种路径的响应逐字节一致")
+
+async def bench_requests(client: httpx.AsyncClient):
+    """对比整页请求的耗时"""
+    params = {"limit": 100, "status_lt": 3}
+    for fast in (False, True):
+        await fetch(client, fast, params)
+        started = time.perf_counter()
+        for _ in range(BENCH_REQUESTS):
+            await fetch(client, fast, params)
+        elapsed = (time.perf_counter() - started) / BENCH_REQUESTS * 1000
+        logger.info(f"{'快速路径' if fast else '原有路径'}: GET /work-orders?limit=100 平均 {elapsed:.1f} ms")
+
+async def bench_serialization():
+    """只对比序列化部分：ORM 对象经 Pydantic 校验和编码 vs values() 行直接编码"""
+    orders = await WorkOrders.all().prefetch_related("assigned_to")
+    rows = await work_order_encoder.fetch(WorkOrders.all())
+
+    started = time.perf_counter()
+    page = WorkOrderPage.model_validate({"items": orders, "next_cursor": None, "total": None})
+    slow = json.dumps(page.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode()
+    slow_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = dumps({"items": work_order_encoder.to_dicts(rows), "next_cursor": None, "total": None})
+    fast_elapsed = time.perf_counter() - started
+
+    assert fast == slow
+
+    # 未安装 orjson 时退回标准库，输出同样一致
+    encoder, serialization.orjson = serialization.orjson, None
+    try:
+        assert dumps({"items": work_order_encoder.to_dicts(rows), "next_cursor": None, "total": None}) == slow
+    finally:
+        serialization.orjson = encoder
+    logger.info(
+        f"序列化 {len(rows)} 个工单: 原有路径 {slow_elapsed * 1000:.0f} ms，"
+        f"快速路径 {fast_elapsed * 1000:.0f} ms（{slow_elapsed / fast_elapsed:.1f} 倍）"
+    )
+
+async def run_test():
+    """运行测试"""
+    enabled = settings.FAST_JSON_RESPONSES
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            token = create_access_token(data={"sub": "admin"})
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport,
+                base_url="http://test",
+                headers={"Authorization": f"Bearer {token}"}
+            ) as client:
+                await check_wire_format(client)
+                await bench_requests(client)
+            await bench_serialization()
+        finally:
+            settings.FAST_JSON_RESPONSES = enabled
+            await Tortoise.close_connections()
+
+def test_fast_json():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,207 @@
+"""
+测试工单列表的条件请求和增量同步：ETag 随工单增删改和签收人改名变化、
+匹配的 If-None-Match 返回 304、modified_since 返回变化的工单（含签收人改名的工单）、
+不再满足筛选条件的工单和删除记录
+
+可直接运行: python -m app.tasks.test_list_sync
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.models.models import Users, WorkOrders, build_model
+from app.services.sync import SYNC_MAX_CHANGES, ensure_change_tracking, get_change_marker
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+LIST_URL = "/api/v1/work-orders"
+
+async def init_db(db_path: str):
+    await init_test_db(db_path)
+    # 每个 worker 启动时都会执行，重复执行不重置 epoch 和计数
+    marker = await get_change_marker(Tortoise.get_connection("default"))
+    await ensure_change_tracking()
+    assert await get_change_marker(Tortoise.get_connection("default")) == marker
+    admin = await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+    # 旧工单的修改时间在一小时前
+    earlier = datetime.now() - timedelta(hours=1)
+    for i in range(5):
+        await WorkOrders.bulk_create([build_model(
+            WorkOrders,
+            order_no=f"SYNC-{i:05d}", reporter_name=f"张三{i}", contact_phone="13800000000",
+            location="三楼", problem_desc=f"打印机卡纸 {i}", status=1, assigned_to_id=admin.id,
+            created_at=earlier, modified_at=earlier, assigned_time=earlier
+        )])
+    return admin
+
+async def check_conditional(client: httpx.AsyncClient, admin: Users):
+    """ETag 不变时返回 304；工单增删改和签收人改名后 ETag 变化；不同查询参数的 ETag 不同"""
+    params = {"status_lt": 3, "limit": 10}
+    response = await client.get(LIST_URL, params=params)
+    assert response.status_code == 200 and len(response.json()["items"]) == 5
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"') and response.headers["cache-control"] == "private, no-cache"
+
+    response = await client.get(LIST_URL, params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b"" and response.headers["etag"] == etag
+
+    other = await client.get(LIST_URL, params={"status_lt": 3, "limit": 5})
+    assert other.headers["etag"] != etag, "不同分页参数的 ETag 不同"
+
+    async def changed(action) -> bool:
+        nonlocal etag
+        await action()
+        response = await client.get(LIST_URL, params=params, headers={"If-None-Match": etag})
+        modified = response.status_code == 200
+        etag = response.headers["etag"]
+        return modified
+
+    order = await WorkOrders.get(order_no="SYNC-00000")
+
+    async def update():
+        order.location = "四楼"
+        await order.save()
+
+    async def rename():
+        admin.full_name = "值班管理员"
+        await admin.save()
+
+    async def login():
+        # 与列表无关的用户字段变化不影响 ETag
+        await Users.filter(id=admin.id).update(is_active=True)
+
+    async def delete():
+        await (await WorkOrders.get(order_no="SYNC-00004")).delete()
+
+    assert await changed(update), "修改工单后 ETag 变化"
+    assert await changed(rename), "签收人改名后 ETag 变化"
+    assert not await changed(login), "其他用户字段变化不影响 ETag"
+    assert await changed(delete), "删除工单后 ETag 变化"
+    response = await client.get(LIST_URL, params=params)
+    assert [item["assigned_to"]["full_name"] for item in response.json()["items"]] == ["值班管理员"] * 4
+    logger.info("√ ETag 随列表内容变化，未变化时返回 304")
+
+async def check_delta(client: httpx.AsyncClient):
+    """增量同步返回变化的工单、离开筛选条件的工单和删除记录，下次从 sync_time 继续"""
+    since = (datetime.now() - timedelta(minutes=10)).isoformat(" ")
+    params = {"status_lt": 3, "modified_since": since}
+    response = await client.get(LIST_URL, params=params)
+    assert response.status_code == 200, response.text
+    delta = response.json()
+    # 上一步修改了 SYNC-00000、删除了 SYNC-00004，签收人改名后其签收的工单也需返回
+    assert [item["order_no"] for item in delta["items"]] == [f"SYNC-{i:05d}" for i in range(4)], delta
+    assert all(item["assigned_to"]["full_name"] == "值班管理员" for item in delta["items"])
+    assert delta["items"][0]["location"] == "四楼" and delta["removed"] == [] and not delta["reset"]
+    deleted_id = delta["deleted"][0]
+    assert len(delta["deleted"]) == 1 and not await WorkOrders.exists(id=deleted_id)
+
+    etag = response.headers["etag"]
+    assert (await client.get(LIST_URL, params=params, headers={"If-None-Match": etag})).status_code == 304
+
+    # 从 sync_time 开始只返回之后的变化（包含重叠时间内的重复）
+    sync_time = delta["sync_time"]
+    archived = await WorkOrders.get(order_no="SYNC-00001")
+    archived.status = 3
+    await archived.save()
+    created = await client.post(
+        LIST_URL, json={"reporter_name": "李四", "contact_phone": "13900000000", "location": "五楼", "problem_desc": "网络断开"},
+        headers={"Authorization": "Bearer kinglong"}
+    )
+    assert created.status_code == 200, created.text
+    delta = (await client.get(LIST_URL, params={"status_lt": 3, "modified_since": sync_time})).json()
+    assert set(item["order_no"] for item in delta["items"]) >= {created.json()["order_no"]}, delta
+    assert delta["removed"] == [archived.id], "已归档的工单不再满足 status_lt=3"
+
+    # 非快速路径返回相同的 JSON
+    fast_json = settings.FAST_JSON_RESPONSES
+    settings.FAST_JSON_RESPONSES = False
+    try:
+        slow = (await client.get(LIST_URL, params={"status_lt": 3, "modified_since": sync_time})).json()
+    finally:
+        settings.FAST_JSON_RESPONSES = fast_json
+    # 下次同步的起点取决于请求时间
+    del slow["sync_time"], delta["sync_time"]
+    assert slow == delta, (slow, delta)
+
+    response = await client.get(LIST_URL, params={"modified_since": "昨天"})
+    assert response.status_code == 400
+    logger.info("√ 增量同步返回修改、离开筛选条件和删除的工单")
+
+async def check_reset(client: httpx.AsyncClient):
+    """变化过多时不返回明细，提示重新加载"""
+    since = (datetime.now() - timedelta(seconds=1)).isoformat(" ")
+    earlier = datetime.now() - timedelta(hours=1)
+    extra = []
+    for i in range(SYNC_MAX_CHANGES + 1):
+        extra.append(build_model(
+            WorkOrders,
+            order_no=f"BULK-{i:05d}", reporter_name="王五", contact_phone="13700000000",
+            location="六楼", problem_desc="显示器闪烁", status=0,
+            created_at=earlier, modified_at=datetime.now()
+        ))
+    await WorkOrders.bulk_create(extra)
+    delta = (await client.get(LIST_URL, params={"modified_since": since})).json()
+    assert delta["reset"] and delta["items"] == [], delta
+    logger.info("√ 变化过多时提示重新加载")
+
+async def check_assignee_delta(client: httpx.AsyncClient):
+    """签收人改名后增量同步返回其签收的工单，签收人被删除后提示重新加载"""
+    engineer = await Users.create(username="engineer", password_hash="x", full_name="李工")
+    # 不经过 save()，工单的修改时间不变
+    await WorkOrders.filter(order_no="SYNC-00002").update(assigned_to_id=engineer.id)
+    since = datetime.now().isoformat(" ")
+    engineer.full_name = "李工程师"
+    await engineer.save()
+    default = settings.FAST_JSON_RESPONSES
+    for fast_json in (True, False):
+        settings.FAST_JSON_RESPONSES = fast_json
+        try:
+            delta = (await client.get(LIST_URL, params={"status_lt": 3, "modified_since": since})).json()
+        finally:
+            settings.FAST_JSON_RESPONSES = default
+        assert [(item["order_no"], item["assigned_to"]["full_name"]) for item in delta["items"]] == [
+            ("SYNC-00002", "李工程师")
+        ], delta
+        assert delta["removed"] == [] and not delta["reset"]
+    logger.info("√ 签收人改名后增量同步返回其签收的工单")
+
+    since = datetime.now().isoformat(" ")
+    await Users.filter(id=engineer.id).delete()
+    delta = (await client.get(LIST_URL, params={"status_lt": 3, "modified_since": since})).json()
+    assert delta["reset"], delta
+    logger.info("√ 签收人被删除后增量同步提示重新加载")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        admin = await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            token = create_access_token(data={"sub": "admin"})
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://test",
+                headers={"Authorization": f"Bearer {token}"}
+            ) as client:
+                await check_conditional(client, admin)
+                await check_delta(client)
+                await check_reset(client)
+                await check_assignee_delta(client)
+        finally:
+            await Tortoise.close_connections()
+
+def test_list_sync():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
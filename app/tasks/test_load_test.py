@@ -0,0 +1,137 @@
+"""
+测试性能测试工具：模拟数据的分布和一致性、生成结果可复现，以及混合负载压测和报告对比
+
+可直接运行: python -m app.tasks.test_load_test
+也可由 pytest 收集执行
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+import httpx
+from tortoise import Tortoise, connections
+from app.main import app
+from app.api.deps import user_cache, users_marker
+from app.core.database import READ_CONNECTION_PREFIX
+from app.services.statistics import reconcile_daily_stats
+from app.services.analytics import reconcile_duration_stats
+from app.services.reference_data import problem_type_cache, solution_type_cache
+from app.tasks.generate_dataset import generate_dataset, init_db, order_row, random_created_times
+from app.tasks.load_test import WORKLOADS, compare_reports, parse_args, build_report, run_load
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+ORDER_COUNT = 3000
+
+def check_reproducible():
+    """相同的随机种子生成相同的工单"""
+    now = datetime(2024, 6, 1, 12, 30)
+
+    def sample(seed: int) -> list:
+        rng = random.Random(seed)
+        times = random_created_times(rng, 200, 30, now)
+        return [
+            order_row(
+                rng, index, f"NO-{index}", created_at, now, timedelta(hours=72),
+                [1, 2], [1, 2], ["硬件故障", "其他"], [3, 4]
+            )
+            for index, created_at in enumerate(times)
+        ]
+    first = sample(1)
+    assert first == sample(1)
+    assert first != sample(2)
+    assert all(order[12] <= now for order, _ in first)
+    logger.info("√ 相同随机种子生成的工单相同")
+
+async def check_dataset(result: dict):
+    """各状态的时间字段、日志和统计与工单一致，分布有倾斜"""
+    db = Tortoise.get_connection("default")
+    assert sum(result["status"].values()) == ORDER_COUNT
+    assert result["status"][3] > ORDER_COUNT / 2 and all(result["status"].values()), result
+
+    _, rows = await db.execute_query('''
+        SELECT
+            SUM("status" >= 1 AND "assigned_time" IS NULL) + SUM("status" = 0 AND "assigned_to_id" IS NOT NULL) AS "bad_assign",
+            SUM(("status" >= 2) != ("completed_at" IS NOT NULL)) AS "bad_complete",
+            SUM(("status" = 3) != ("archived_at" IS NOT NULL)) AS "bad_archive",
+            SUM("status" >= 2 AND ("problem_type" IS NULL OR "solution_type" IS NULL)) AS "bad_type",
+            SUM("modified_at" < "created_at" OR "assigned_time" < "created_at" OR "completed_at" < "assigned_time") AS "bad_order"
+        FROM "work_orders"
+    ''')
+    assert all(value == 0 for value in tuple(rows[0])), dict(rows[0])
+
+    # 日志数与状态对应：每个工单一条创建日志，每前进一个状态一条日志
+    _, rows = await db.execute_query('SELECT COUNT(*) AS "count" FROM "work_order_logs"')
+    assert rows[0]["count"] == result["logs"] == sum(
+        (status + 1) * count for status, count in result["status"].items()
+    )
+
+    # 生成后统计已重建，再对账没有差异
+    assert (await reconcile_daily_stats())["drift"] == 0
+    assert (await reconcile_duration_stats())["drift"] == 0
+
+    _, rows = await db.execute_query(
+        'SELECT "problem_type", COUNT(*) AS "count" FROM "work_orders" '
+        'WHERE "problem_type" IS NOT NULL GROUP BY 1 ORDER BY 2 DESC'
+    )
+    assert rows[0]["problem_type"] == "硬件故障" and rows[0]["count"] > 5 * rows[-1]["count"]
+    _, rows = await db.execute_query(
+        'SELECT CAST(strftime(\'%H\', "created_at") AS INTEGER) AS "hour", COUNT(*) AS "count" '
+        'FROM "work_orders" GROUP BY 1'
+    )
+    by_hour = {row["hour"]: row["count"] for row in rows}
+    assert by_hour[10] > 5 * by_hour.get(3, 0)
+    logger.info(f"√ 生成 {ORDER_COUNT} 个工单（各状态 {result['status']}），时间、日志和统计一致")
+
+async def check_load():
+    """混合负载下各类请求都有执行且没有错误，报告可与自身对比"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=60) as client:
+        result = await run_load(client, concurrency=4, duration=3, users=3)
+    assert set(result["operations"]) == set(WORKLOADS), result["operations"].keys()
+    assert result["total"]["errors"] == 0, result["error_samples"]
+    for name, summary in result["operations"].items():
+        latency = summary["latency_ms"]
+        assert summary["requests"] > 0 and latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"], name
+
+    args = parse_args(["--db", "loadtest.sqlite3", "--concurrency", "4", "--duration", "3"])
+    report = json.loads(json.dumps(build_report(result, args, {"orders": ORDER_COUNT}), ensure_ascii=False))
+    assert report["meta"]["target"] == "in-process" and "FAST_JSON_RESPONSES" in report["meta"]["settings"]
+    lines = compare_reports(report, report)
+    assert len(lines) == len(WORKLOADS) + 2 and "(+0.0%)" in lines[1], lines
+    logger.info(
+        f"√ 混合负载 {result['total']['requests']} 次请求，{result['total']['throughput']} 次/秒，"
+        f"p95 {result['total']['latency_ms']['p95']} ms"
+    )
+
+async def run_test():
+    """运行测试"""
+    check_reproducible()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        # 其他测试可能已在本进程中缓存了用户和类型
+        user_cache.clear()
+        users_marker.clear()
+        problem_type_cache.bump()
+        solution_type_cache.bump()
+        try:
+            result = await generate_dataset(orders=ORDER_COUNT, users=3, days=30)
+            await check_dataset(result)
+            await check_load()
+        finally:
+            await Tortoise.close_connections()
+            # Tortoise 会合并历次初始化的连接配置，移除只读连接，以免同一进程中的其他测试连到已删除的临时库
+            for alias in [alias for alias in connections.db_config if alias.startswith(READ_CONNECTION_PREFIX)]:
+                del connections.db_config[alias]
+
+def test_load_test():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,214 @@
+"""
+测试运行指标：Prometheus 文本格式、按路由模板统计请求、业务计数、SQLite busy 计数，
+以及多 worker 的快照汇总、退出 worker 的归并和访问令牌
+
+可直接运行: python -m app.tasks.test_metrics
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.api.work_orders import API_TOKEN
+from app.core.config import settings
+from app.core.metrics import HTTP_IN_FLIGHT, Counter, Gauge, Histogram, Registry
+from app.core.security import create_access_token
+from app.models.models import Users, WorkOrders
+from app.services.metrics import METRICS_WORKERS, MetricsPublisher, fold_snapshots, metrics_publisher
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{.*\})? (\S+)$')
+
+def parse_metrics(text: str) -> dict:
+    """解析为 {(名称, 标签字符串): 值}"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        values[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return values
+
+def labels(**pairs: str) -> str:
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs.items()) + "}"
+
+async def init_db(db_path: str):
+    # busy_timeout 设小，便于测试锁等待超时
+    await init_test_db(db_path, busy_timeout=50, journal_mode="WAL")
+    await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+
+def check_registry():
+    """文本格式、分布的累计区间、快照的合并与扣减"""
+    registry = Registry()
+    counter = Counter("test_requests_total", "测试计数", ("route",), registry=registry)
+    gauge = Gauge("test_in_flight", "测试当前值", registry=registry)
+    histogram = Histogram("test_seconds", "测试耗时", ("route",), (0.1, 1), registry=registry)
+
+    counter.inc('/a"b\\')
+    counter.inc('/a"b\\', amount=2)
+    gauge.set(3)
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value, "/a")
+    values = parse_metrics(registry.render(registry.snapshot()))
+    assert values[("test_requests_total", '{route="/a\\"b\\\\"}')] == 3, values
+    assert values[("test_in_flight", "")] == 3
+    assert values[("test_seconds_bucket", '{route="/a",le="0.1"}')] == 2
+    assert values[("test_seconds_bucket", '{route="/a",le="1"}')] == 3
+    assert values[("test_seconds_bucket", '{route="/a",le="+Inf"}')] == values[("test_seconds_count", '{route="/a"}')] == 4
+    assert values[("test_seconds_sum", '{route="/a"}')] == 5.65
+
+    snapshot = registry.snapshot()
+    merged = registry.merge([(snapshot, True), (snapshot, False)])
+    assert merged["test_requests_total"][('/a"b\\',)] == 6 and merged["test_in_flight"][()] == 3
+    assert merged["test_seconds"][("/a",)] == [4, 2, 2, 11.3]
+    counter.inc('/a"b\\')
+    rest = registry.subtract(registry.snapshot(), snapshot)
+    assert rest["test_requests_total"][('/a"b\\',)] == 1 and rest["test_in_flight"][()] == 3
+    assert rest["test_seconds"][("/a",)] == [0, 0, 0, 0.0]
+    logger.info("√ 文本格式、累计区间和快照合并正确")
+
+async def check_requests(client: httpx.AsyncClient) -> dict:
+    """请求按路由模板计数，新建工单按来源计数，等待连接的时间有记录"""
+    before = parse_metrics((await client.get("/metrics")).text)
+
+    api_headers = {"Authorization": f"Bearer {API_TOKEN}"}
+    order = {"reporter_name": "张三", "contact_phone": "13800000000", "location": "三楼", "problem_desc": "打印机卡纸"}
+    response = await client.post("/api/v1/work-orders", json=order, headers=api_headers)
+    assert response.status_code == 200, response.text
+    order_id = response.json()["id"]
+    response = await client.post("/api/v1/work-orders/batch", json={"items": [order] * 3}, headers=api_headers)
+    assert response.json()["created"] == 3, response.text
+    for _ in range(2):
+        assert (await client.get(f"/api/v1/work-orders/{order_id}")).status_code == 200
+    assert (await client.get("/api/v1/no-such-page")).status_code == 404
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    after = parse_metrics(response.text)
+
+    def delta(name: str, label: str = "") -> float:
+        return after.get((name, label), 0) - before.get((name, label), 0)
+
+    route = "/api/v1/work-orders/{work_order_id}"
+    assert delta("helpdesk_http_requests_total", labels(method="GET", route=route, status="200")) == 2
+    assert delta("helpdesk_http_request_duration_seconds_count", labels(method="GET", route=route)) == 2
+    assert delta("helpdesk_http_requests_total", labels(method="GET", route="unmatched", status="404")) == 1
+    assert delta("helpdesk_work_orders_created_total", labels(source="api")) == 1
+    assert delta("helpdesk_work_orders_created_total", labels(source="batch")) == 3
+    assert delta("helpdesk_db_connection_wait_seconds_count", labels(connection="default", kind="transaction")) >= 2
+    assert after[("helpdesk_http_requests_in_flight", "")] == 1, "只有 /metrics 请求本身在处理中"
+    assert after[("helpdesk_metrics_workers", "")] == 1
+    assert ("helpdesk_cache_hit_ratio", labels(cache="users")) in after
+    logger.info("√ 请求按路由模板计数，新建工单和连接等待均有记录")
+    return after
+
+async def check_busy(client: httpx.AsyncClient, db_path: str):
+    """其他进程长时间持有写锁时，超过 busy_timeout 的语句计入 busy 错误"""
+    before = parse_metrics((await client.get("/metrics")).text)
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            await WorkOrders.filter(id=1).update(location="四楼")
+        except Exception as e:
+            assert "locked" in str(e), e
+        else:
+            raise AssertionError("写锁被占用时更新应失败")
+    finally:
+        blocker.rollback()
+        blocker.close()
+    after = parse_metrics((await client.get("/metrics")).text)
+    key = ("helpdesk_db_busy_errors_total", labels(connection="default"))
+    assert after[key] - before.get(key, 0) == 1, after.get(key)
+    logger.info("√ SQLite busy 错误已计数")
+
+async def check_workers(client: httpx.AsyncClient):
+    """其他 worker 的快照计入合计；过期 worker 不计当前值，归并后计数不变；本进程被归并后不重复计数"""
+    metrics_publisher.interval = 60
+    local = parse_metrics((await client.get("/metrics")).text)
+    other = MetricsPublisher()
+    # other 上报时有一个请求在处理中
+    HTTP_IN_FLIGHT.inc()
+    await other.flush()
+    HTTP_IN_FLIGHT.dec()
+    await metrics_publisher.flush()
+    key = ("helpdesk_work_orders_created_total", labels(source="batch"))
+
+    def totals(text: str):
+        values = parse_metrics(text)
+        return values[key], values[("helpdesk_metrics_workers", "")], values[("helpdesk_http_requests_in_flight", "")]
+
+    # other 与本进程共用同一组指标，快照相同，合计为两倍
+    created, workers, in_flight = totals((await client.get("/metrics")).text)
+    assert (created, workers, in_flight) == (2 * local[key], 2, 2), (created, workers, in_flight)
+
+    db = Tortoise.get_connection("default")
+    stale = (datetime.now() - timedelta(hours=1)).isoformat(" ")
+    await db.execute_query('UPDATE "metrics_snapshots" SET "updated_at" = ? WHERE "worker" = ?', [stale, other.worker])
+    created, workers, in_flight = totals((await client.get("/metrics")).text)
+    assert (created, workers, in_flight) == (2 * local[key], 1, 1), "过期 worker 只计计数"
+
+    assert await fold_snapshots() == 1
+    created, workers, in_flight = totals((await client.get("/metrics")).text)
+    assert (created, workers, in_flight) == (2 * local[key], 1, 1), "归并后计数不变"
+
+    # 本进程的行被当作退出 worker 归并后，下次上报只写入之后新增的部分
+    await fold_snapshots([metrics_publisher.worker])
+    await metrics_publisher.flush()
+    created, workers, _ = totals((await client.get("/metrics")).text)
+    assert (created, workers) == (2 * local[key], 1), created
+    _, rows = await db.execute_query('SELECT "worker" FROM "metrics_snapshots" ORDER BY "worker"')
+    assert sorted(row["worker"] for row in rows) == sorted(["retired", metrics_publisher.worker])
+    logger.info("√ 多 worker 的快照正确合计，退出 worker 归并后计数不回退")
+
+async def check_token(client: httpx.AsyncClient):
+    """配置了访问令牌时需要携带"""
+    token = settings.METRICS_TOKEN
+    settings.METRICS_TOKEN = "secret"
+    try:
+        assert (await client.get("/metrics")).status_code == 401
+        response = await client.get("/metrics", headers={"Authorization": "Bearer secret"})
+        assert response.status_code == 200 and METRICS_WORKERS.name in response.text
+    finally:
+        settings.METRICS_TOKEN = token
+    logger.info("√ 配置令牌后未授权的访问被拒绝")
+
+async def run_test():
+    """运行测试"""
+    check_registry()
+    interval = metrics_publisher.interval
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "db.sqlite3")
+        await init_db(db_path)
+        try:
+            token = create_access_token(data={"sub": "admin"})
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://test",
+                headers={"Authorization": f"Bearer {token}"}
+            ) as client:
+                await check_requests(client)
+                await check_busy(client, db_path)
+                await check_workers(client)
+                await check_token(client)
+        finally:
+            metrics_publisher.interval = interval
+            await Tortoise.close_connections()
+
+def test_metrics():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,66 @@
+"""
+测试工单编号分配：大量并发创建工单时编号唯一且连续
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime
+from tortoise import Tortoise
+from app.api.work_orders import create_work_order, API_TOKEN
+from app.models.models import OrderSequence, WorkOrders, _seeded_prefixes
+from app.schemas.work_order import WorkOrderCreate
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ORDER_COUNT = 2000
+
+async def check_concurrent_create():
+    """并发创建工单，检查编号唯一、连续且支持超过999个"""
+    work_order = WorkOrderCreate(
+        reporter_name="张三",
+        contact_phone="13800000000",
+        location="三楼机房",
+        problem_desc="打印机无法打印"
+    )
+    orders = await asyncio.gather(*[
+        create_work_order(work_order, token=f"Bearer {API_TOKEN}")
+        for _ in range(ORDER_COUNT)
+    ])
+
+    order_nos = [order.order_no for order in orders]
+    assert len(set(order_nos)) == ORDER_COUNT, "存在重复的工单编号"
+
+    numbers = sorted(int(no.rsplit("-", 1)[-1]) for no in order_nos)
+    assert numbers == list(range(1, ORDER_COUNT + 1)), "工单编号不连续"
+    logger.info(f"√ 并发创建 {ORDER_COUNT} 个工单，编号唯一且连续")
+
+async def check_resume_after_restart():
+    """序列行丢失（如升级前的数据库）时，从已有工单的最大编号继续"""
+    prefix = f"SZIT-{datetime.now().strftime('%Y%m%d')}-"
+    await OrderSequence.filter(prefix=prefix).delete()
+    _seeded_prefixes.clear()
+
+    numbers = await OrderSequence.allocate(prefix)
+    assert numbers[0] == ORDER_COUNT + 1, f"期望 {ORDER_COUNT + 1}，实际 {numbers[0]}"
+    assert await WorkOrders.all().count() == ORDER_COUNT
+    logger.info("√ 重启后编号从已有最大值继续")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_test_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            await check_concurrent_create()
+            await check_resume_after_restart()
+        finally:
+            await Tortoise.close_connections()
+
+def test_order_no():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
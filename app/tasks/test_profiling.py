@@ -0,0 +1,163 @@
+"""
+测试请求性能剖析：Server-Timing 中的查询次数和各部分耗时、慢查询只记录参数形状、
+调用栈采样输出折叠格式，以及关闭时不安装任何钩子
+
+可直接运行: python -m app.tasks.test_profiling
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime
+import httpx
+from tortoise import Tortoise
+from tortoise.backends.sqlite.client import SqliteClient, TransactionWrapper
+from app.main import app
+from app.core import profiling, security
+from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware, StackSampler, install_hooks, uninstall_hooks
+from app.core.security import create_access_token, get_password_hash
+from app.models.models import Users, WorkOrders, build_model
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.core.profiling").setLevel(logging.ERROR)
+
+PASSWORD = "profile123"
+
+async def init_db(db_path: str):
+    await init_test_db(db_path)
+    user = await Users.create(
+        username="admin", password_hash=get_password_hash(PASSWORD), full_name="管理员", is_admin=True
+    )
+    now = datetime.now()
+    for i in range(20):
+        order = build_model(
+            WorkOrders,
+            order_no=f"PROF-{i:05d}", reporter_name=f"张三{i}", contact_phone="13800000000",
+            location="三楼机房", problem_desc=f"打印机卡纸 {i}", status=1, assigned_to_id=user.id,
+            created_at=now, modified_at=now, assigned_time=now
+        )
+        await order.save()
+
+def server_timing(response: httpx.Response) -> dict:
+    """解析 Server-Timing 响应头为 {名称: (毫秒, 描述)}"""
+    metrics = {}
+    for item in response.headers["server-timing"].split(", "):
+        name, *params = item.split(";")
+        values = dict(param.split("=", 1) for param in params)
+        metrics[name] = (float(values["dur"]), values.get("desc", "").strip('"'))
+    return metrics
+
+async def check_disabled(headers: dict):
+    """未安装钩子时数据库方法是原函数，响应不带 Server-Timing"""
+    assert not profiling._patches
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/api/v1/work-orders/", headers=headers)
+    assert response.status_code == 200
+    assert "server-timing" not in response.headers
+    logger.info("√ 关闭时不安装钩子，响应不变")
+
+async def check_request_timing(client: httpx.AsyncClient, headers: dict):
+    """Server-Timing 列出查询次数、数据库、序列化和密码哈希耗时"""
+    response = await client.get("/api/v1/work-orders/", headers=headers)
+    assert response.status_code == 200 and len(response.json()["items"]) == 20
+    metrics = server_timing(response)
+    queries = int(metrics["db"][1].split()[0])
+    assert queries >= 2 and metrics["db"][0] > 0, metrics
+    assert metrics["serialize"][0] > 0 and metrics["hash"][0] == 0, metrics
+    assert metrics["total"][0] >= metrics["db"][0] + metrics["serialize"][0], metrics
+
+    response = await client.post("/api/v1/auth/login", data={"username": "admin", "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    metrics = server_timing(response)
+    assert metrics["hash"][0] > 0 and metrics["db"][1] == "1 queries", metrics
+    logger.info(f"√ Server-Timing：{response.headers['server-timing']}")
+
+async def check_slow_queries():
+    """慢查询记录 SQL、参数类型和长度及所在请求，不记录参数值；请求外的查询也会记录"""
+    login = [entry for entry in profiling.slow_queries if entry["path"] == "/api/v1/auth/login"]
+    assert login and '"username"=?' in login[0]["sql"], login
+    assert login[0]["literals"] == ["str(5)", "int"] and login[0]["params"] == [], login[0]
+    assert "'admin'" not in str(login[0])
+
+    db = Tortoise.get_connection("default")
+    async with db._in_transaction() as connection:
+        await connection.execute_many(
+            'INSERT INTO "problem_types" ("name") VALUES (?)',
+            [["硬件故障"], ["网络故障"]]
+        )
+    entry = profiling.slow_queries[-1]
+    assert entry["method"] == "execute_many" and entry["rows"] == 2 and entry["params"] == ["str(4)"], entry
+    assert entry["path"] is None
+    assert len([e for e in profiling.slow_queries if e["method"] == "execute_many"]) == 1, "事务内的批量执行只计一次"
+    logger.info(f"√ 记录 {len(profiling.slow_queries)} 条慢查询，只保留参数形状")
+
+async def check_sampling(client: httpx.AsyncClient, headers: dict, profile_dir: str):
+    """超过阈值的请求输出折叠格式的调用栈，密码哈希线程单独作为栈底"""
+    response = await client.post("/api/v1/auth/login", data={"username": "admin", "password": PASSWORD})
+    assert response.status_code == 200
+    entry = profiling.slow_requests[-1]
+    assert entry["path"] == "/api/v1/auth/login" and entry["hash_ms"] > 0, entry
+    stacks_file = entry["stacks_file"]
+    assert stacks_file and os.path.dirname(stacks_file) == profile_dir, entry
+
+    with open(stacks_file, encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    assert lines and all(re.fullmatch(r"[^;]+(;[^;]+)* \d+", line) for line in lines), lines[:3]
+    roots = {line.split(";", 1)[0] for line in lines}
+    assert "MainThread" in roots and any(root.startswith("password-hash") for root in roots), roots
+    assert any("bcrypt" in line for line in lines if line.startswith("password-hash"))
+
+    response = await client.get("/api/v1/settings/profiling", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["slow_requests"][0]["stacks_file"] == stacks_file and data["slow_queries"]
+    logger.info(f"√ 调用栈采样 {sum(int(line.rsplit(' ', 1)[1]) for line in lines)} 次，写入 {os.path.basename(stacks_file)}")
+
+async def run_test():
+    """运行测试"""
+    slow_query_ms = settings.SLOW_QUERY_MS
+    originals = (SqliteClient.execute_query, TransactionWrapper.execute_many, security._run_hash_job)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'admin'})}"}
+        try:
+            await check_disabled(headers)
+
+            install_hooks()
+            install_hooks()
+            assert SqliteClient.execute_query is not originals[0]
+            assert TransactionWrapper.execute_many is not originals[1]
+            settings.SLOW_QUERY_MS = 0
+            profiling.slow_queries.clear()
+            profiling.slow_requests.clear()
+            profile_dir = os.path.join(tmp_dir, "profiles")
+            # 测试中不修改全局 app 的中间件（应用启动后无法再添加），在外层包装
+            profiled_app = ProfilingMiddleware(
+                app, slow_request_ms=0, sampler=StackSampler(0.001),
+                profile_threshold_ms=0, profile_dir=profile_dir
+            )
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=profiled_app),
+                base_url="http://test"
+            ) as client:
+                await check_request_timing(client, headers)
+                await check_slow_queries()
+                await check_sampling(client, headers, profile_dir)
+        finally:
+            uninstall_hooks()
+            settings.SLOW_QUERY_MS = slow_query_ms
+            await Tortoise.close_connections()
+    assert (SqliteClient.execute_query, TransactionWrapper.execute_many, security._run_hash_job) == originals
+
+def test_profiling():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
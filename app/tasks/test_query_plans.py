@@ -0,0 +1,117 @@
+"""
+测试 WorkOrders 热点查询的执行计划，防止退化为全表扫描
+
+可直接运行: python -m app.tasks.test_query_plans
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import re
+from datetime import datetime
+from tortoise import Tortoise
+from tortoise.expressions import Q
+from tortoise.functions import Count, Sum
+from app.models.models import WorkOrders, WorkOrderLogs, WorkOrderDailyStats, WorkOrderDurationStats
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def hot_queries():
+    """与各接口/定时任务保持一致的热点查询"""
+    now = datetime.now()
+    page = ("-created_at", "-id")
+    return {
+        # 工单列表（List.vue 默认 status_lt=3）
+        "列表": WorkOrders.filter(status__lt=3).order_by(*page).limit(21),
+        "列表-翻页": WorkOrders.filter(status__lt=3).filter(
+            Q(created_at__lt=now) | Q(created_at=now, id__lt=100)
+        ).order_by(*page).limit(21),
+        "列表-总数": WorkOrders.filter(status__lt=3).count(),
+        "列表-按状态": WorkOrders.filter(status=0).order_by(*page).limit(21),
+        "列表-按问题类型": WorkOrders.filter(problem_type="硬件故障").order_by(*page).limit(21),
+        # 工作台"我的工单"
+        "我的工单": WorkOrders.filter(assigned_to_id=1, status=1).order_by(*page).limit(100),
+        # 统计
+        "统计": WorkOrders.all().annotate(
+            count=Count("id")
+        ).group_by("status", "problem_type").values("status", "problem_type", "count"),
+        "统计-时间范围": WorkOrders.filter(
+            created_at__gte=now, created_at__lte=now
+        ).annotate(
+            count=Count("id")
+        ).group_by("status", "problem_type").values("status", "problem_type", "count"),
+        "统计-每日汇总": WorkOrderDailyStats.filter(
+            date__gte=now.date(), date__lte=now.date()
+        ).annotate(
+            total=Sum("count")
+        ).group_by("status", "problem_type").values("status", "problem_type", "total"),
+        # 处理时效分析
+        "时效-分桶汇总": WorkOrderDurationStats.filter(
+            date__gte=now.date(), date__lte=now.date()
+        ).annotate(
+            count_sum=Sum("count")
+        ).group_by("metric", "bucket").values("metric", "bucket", "count_sum"),
+        "时效-超时": WorkOrders.filter(status__lt=2, created_at__lt=now).count(),
+        # 自动归档
+        "归档": WorkOrders.filter(status=2, modified_at__lt=now, archived_at__isnull=True),
+        # 工单日志时间线
+        "日志": WorkOrderLogs.filter(work_order_id=1).order_by("created_at", "id").limit(51),
+        "日志-翻页": WorkOrderLogs.filter(work_order_id=1).filter(
+            Q(created_at__gt=now) | Q(created_at=now, id__gt=100)
+        ).order_by("created_at", "id").limit(51),
+        "日志压缩": WorkOrderLogs.filter(
+            action="updated", work_order_id__gt=0
+        ).order_by("work_order_id").distinct().limit(1000).values_list("work_order_id", flat=True),
+    }
+
+# 允许按索引顺序扫描的查询：默认列表按创建时间倒序读取，取满一页即停止；
+# 不带条件的统计读取整个覆盖索引。其他带条件的查询都必须按索引查找（SEARCH）
+ORDERED_SCANS = {"列表", "统计"}
+
+def find_problems(name, plan):
+    """返回执行计划中的扫描、未使用索引的查找或额外排序"""
+    problems = []
+    for detail in plan:
+        if detail.startswith("SCAN"):
+            if name not in ORDERED_SCANS or not re.search(r" USING (COVERING )?INDEX ", detail):
+                problems.append(f"扫描: {detail}")
+        elif detail.startswith("SEARCH") and not re.search(r" USING (COVERING )?INDEX ", detail):
+            problems.append(f"未使用索引: {detail}")
+        if "TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append(f"额外排序: {detail}")
+    return problems
+
+async def check_query_plans():
+    """检查所有热点查询，返回不合格的查询"""
+    conn = Tortoise.get_connection("default")
+    failures = {}
+    for name, query in hot_queries().items():
+        sql = query.sql()
+        rows = await conn.execute_query_dict(f"EXPLAIN QUERY PLAN {sql}")
+        plan = [row["detail"] for row in rows]
+        problems = find_problems(name, plan)
+        if problems:
+            failures[name] = problems
+            logger.error(f"× {name}: {'; '.join(problems)}")
+        else:
+            logger.info(f"√ {name}: {'; '.join(plan)}")
+    return failures
+
+async def run_test():
+    """运行测试"""
+    # 使用内存数据库，按模型定义建表和索引
+    await init_test_db()
+    try:
+        return await check_query_plans()
+    finally:
+        await Tortoise.close_connections()
+
+def test_query_plans():
+    failures = asyncio.run(run_test())
+    assert not failures, failures
+
+if __name__ == "__main__":
+    failures = asyncio.run(run_test())
+    raise SystemExit(1 if failures else 0)
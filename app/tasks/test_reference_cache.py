@@ -0,0 +1,171 @@
+"""
+测试问题类型、解决方案类型缓存：ETag/304、新增删除后立即失效、
+工单更新时不查询数据库，以及多 worker 下其他进程修改后的行为
+
+可直接运行: python -m app.tasks.test_reference_cache
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.core.cache import etag_matches
+from app.core.security import create_access_token
+from app.models.models import Users, WorkOrders, ProblemType, SolutionType
+from app.services.reference_data import NameListCache, problem_type_cache, solution_type_cache
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+class QueryCounter(logging.Handler):
+    """统计 Tortoise 执行的涉及指定表的 SQL"""
+
+    def __init__(self, *tables: str):
+        super().__init__(logging.DEBUG)
+        self.tables = tables
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        message = record.getMessage()
+        if any(table in message for table in self.tables):
+            self.count += 1
+
+    def __enter__(self):
+        db_logger = logging.getLogger("tortoise.db_client")
+        self._level, self._propagate = db_logger.level, db_logger.propagate
+        db_logger.setLevel(logging.DEBUG)
+        db_logger.propagate = False
+        db_logger.addHandler(self)
+        return self
+
+    def __exit__(self, *exc):
+        db_logger = logging.getLogger("tortoise.db_client")
+        db_logger.removeHandler(self)
+        db_logger.setLevel(self._level)
+        db_logger.propagate = self._propagate
+
+async def init_db(db_path: str) -> Users:
+    await init_test_db(db_path)
+    for name in ("硬件故障", "软件故障"):
+        await ProblemType.create(name=name)
+    await SolutionType.create(name="更换")
+    # 其他测试可能已在本进程中加载过缓存
+    problem_type_cache.bump()
+    solution_type_cache.bump()
+    return await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+
+async def check_etag(client: httpx.AsyncClient):
+    """返回 ETag 和 Cache-Control，If-None-Match 命中时返回 304，新增和删除后 ETag 变化"""
+    response = await client.get("/api/v1/settings/problem-types")
+    assert response.status_code == 200
+    assert response.json() == [{"name": "硬件故障"}, {"name": "软件故障"}]
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    with QueryCounter("problem_types") as counter:
+        for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            cached = await client.get("/api/v1/settings/problem-types", headers={"If-None-Match": header})
+            assert cached.status_code == 304 and cached.content == b"", header
+            assert cached.headers["etag"] == etag
+    assert counter.count == 0, counter.count
+    stale = await client.get("/api/v1/settings/problem-types", headers={"If-None-Match": '"other"'})
+    assert stale.status_code == 200
+
+    response = await client.post("/api/v1/settings/problem-types", json={"name": "网络故障"})
+    assert response.status_code == 200
+    response = await client.get("/api/v1/settings/problem-types", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()] == ["硬件故障", "软件故障", "网络故障"]
+    assert response.headers["etag"] != etag
+
+    response = await client.delete("/api/v1/settings/problem-types/网络故障")
+    assert response.status_code == 200
+    response = await client.get("/api/v1/settings/problem-types", headers={"If-None-Match": etag})
+    assert response.status_code == 304, "恢复为原来的内容后 ETag 也恢复"
+
+    response = await client.get("/api/v1/settings/solution-types")
+    assert response.json() == [{"name": "更换"}]
+    cached = await client.get(
+        "/api/v1/settings/solution-types",
+        headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert cached.status_code == 304
+    assert response.headers["etag"] != etag
+    logger.info("√ 类型列表返回 ETag，未变化时返回 304，新增删除后立即变化")
+
+async def check_update_validation(client: httpx.AsyncClient, user: Users):
+    """工单更新时用缓存校验类型，不查询类型表"""
+    order = await WorkOrders.create(
+        order_no="REF-00001", reporter_name="张三", contact_phone="13800000000",
+        location="三楼机房", problem_desc="打印机无法打印", status=1, assigned_to=user
+    )
+    await problem_type_cache.get()
+    await solution_type_cache.get()
+    with QueryCounter("problem_types", "solution_types") as counter:
+        for name in ("软件故障", "硬件故障"):
+            response = await client.put(
+                f"/api/v1/work-orders/{order.id}",
+                json={"problem_type": name, "solution_type": "更换"}
+            )
+            assert response.status_code == 200, response.text
+    assert counter.count == 0, counter.count
+    assert (await WorkOrders.get(id=order.id)).problem_type == "硬件故障"
+
+    for field, value in (("problem_type", "不存在"), ("solution_type", "不存在")):
+        response = await client.put(f"/api/v1/work-orders/{order.id}", json={field: value})
+        # update_work_order 会把校验错误包装为 500
+        assert response.status_code >= 400, response.text
+        assert getattr(await WorkOrders.get(id=order.id), field) != value
+    logger.info("√ 更新工单时类型校验不查询数据库，不存在的类型仍被拒绝")
+    return order
+
+async def check_other_worker(client: httpx.AsyncClient, order: WorkOrders):
+    """其他 worker 新增的类型立即可用，删除的类型在缓存过期后生效；各 worker 的 ETag 一致"""
+    # 模拟其他进程直接写入，本进程的缓存未失效
+    await ProblemType.create(name="其他进程新增")
+    response = await client.put(f"/api/v1/work-orders/{order.id}", json={"problem_type": "其他进程新增"})
+    assert response.status_code == 200, response.text
+
+    other_worker = NameListCache(ProblemType, ttl=30)
+    assert (await other_worker.get()).etag == (await problem_type_cache.get()).etag
+
+    await ProblemType.filter(name="其他进程新增").delete()
+    ttl = problem_type_cache.ttl
+    problem_type_cache.ttl = 0
+    try:
+        names = (await problem_type_cache.get()).names
+    finally:
+        problem_type_cache.ttl = ttl
+    assert "其他进程新增" not in names
+    assert etag_matches('W/"a", "b"', '"b"') and not etag_matches(None, '"b"')
+    logger.info("√ 其他进程新增的类型立即可用，删除的类型在缓存过期后生效")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        user = await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            token = create_access_token(data={"sub": "admin"})
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport,
+                base_url="http://test",
+                headers={"Authorization": f"Bearer {token}"}
+            ) as client:
+                await check_etag(client)
+                order = await check_update_validation(client, user)
+                await check_other_worker(client, order)
+        finally:
+            await Tortoise.close_connections()
+
+def test_reference_cache():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,171 @@
+"""
+测试多 worker 下的定时任务选主：同一时刻只有一个主节点运行任务，
+主节点正常退出或异常退出后由其他 worker 接管，接管后按持久化的运行记录继续而不重复运行
+
+可直接运行: python -m app.tasks.test_scheduler_leader
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from tortoise import Tortoise
+from app.models.models import ScheduledJobState, SchedulerLease, storage_datetime
+from app.tasks.scheduler import Job, LeaderScheduler
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("apscheduler").setLevel(logging.WARNING)
+
+LEASE_SECONDS = 0.6
+INTERVAL = timedelta(seconds=0.3)
+WORKERS = 3
+
+class Recorder:
+    """记录每次任务运行时的主节点和时间"""
+
+    def __init__(self):
+        self.runs = []
+
+    def job(self, name: str, interval: timedelta = INTERVAL, fail: bool = False):
+        """返回按 worker 编号创建任务的工厂，便于区分是哪个 worker 运行的"""
+        def bind(worker_index: int) -> Job:
+            async def run():
+                self.runs.append((name, worker_index, time.monotonic()))
+                if fail:
+                    raise RuntimeError("模拟任务失败")
+            return Job(name, name, run, interval)
+        return bind
+
+def build_workers(job_factories) -> list:
+    return [
+        LeaderScheduler([factory(index) for factory in job_factories], lease_seconds=LEASE_SECONDS)
+        for index in range(WORKERS)
+    ]
+
+async def watch_leaders(workers: list, seconds: float) -> list:
+    """按固定间隔采样各 worker 是否认为自己是主节点，任一时刻最多一个"""
+    leaders = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        current = [index for index, worker in enumerate(workers) if worker.is_leader]
+        assert len(current) <= 1, current
+        leaders.append(current[0] if current else None)
+        await asyncio.sleep(0.02)
+    return leaders
+
+async def wait_for_leader(workers: list, timeout: float) -> int:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        current = [index for index, worker in enumerate(workers) if worker.scheduler]
+        if current:
+            return current[0]
+        await asyncio.sleep(0.02)
+    raise AssertionError("超时未选出主节点")
+
+async def check_single_leader_and_failover():
+    """只有主节点运行任务；正常退出后立即接管，异常退出后在租约过期后接管"""
+    recorder = Recorder()
+    workers = build_workers([recorder.job("tick")])
+    for worker in workers:
+        await worker.start()
+    try:
+        leader = await wait_for_leader(workers, LEASE_SECONDS)
+        await watch_leaders(workers, 1.5)
+        runs = [run for run in recorder.runs if run[0] == "tick"]
+        assert len(runs) >= 3, runs
+        assert {run[1] for run in runs} == {leader}, runs
+        logger.info(f"√ {WORKERS} 个 worker 中只有 worker {leader} 运行了任务（{len(runs)} 次）")
+
+        # 正常退出：释放租约，其他 worker 在一个续期周期内接管
+        stopped = time.monotonic()
+        await workers[leader].stop()
+        survivors = [worker for index, worker in enumerate(workers) if index != leader]
+        new_leader = workers.index(survivors[await wait_for_leader(survivors, LEASE_SECONDS)])
+        takeover = time.monotonic() - stopped
+        assert takeover < LEASE_SECONDS, takeover
+        logger.info(f"√ 主节点正常退出后 {takeover:.2f} 秒由 worker {new_leader} 接管")
+
+        # 异常退出：不释放租约，其他 worker 在租约过期后接管
+        stopped = time.monotonic()
+        await workers[new_leader].stop(release=False)
+        rest = [worker for worker in survivors if worker is not workers[new_leader]]
+        await wait_for_leader(rest, LEASE_SECONDS * 2)
+        takeover = time.monotonic() - stopped
+        assert takeover >= LEASE_SECONDS / 2, takeover
+        logger.info(f"√ 主节点异常退出后 {takeover:.2f} 秒（租约 {LEASE_SECONDS} 秒）由剩余 worker 接管")
+
+        # 任一时刻只有一个 worker 在运行任务：相邻两次运行至少相隔大半个周期
+        times = [run[2] for run in recorder.runs]
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        assert min(gaps) > INTERVAL.total_seconds() * 0.5, gaps
+    finally:
+        for worker in workers:
+            await worker.stop()
+    assert not await SchedulerLease.all().count()
+
+async def check_persisted_state():
+    """接管后按上次运行时间安排下一次运行；失败的任务记录错误"""
+    await ScheduledJobState.all().delete()
+    now = datetime.now()
+    # 刚运行过的任务在剩余时间后运行，超期未运行的任务立即补跑
+    recent = ScheduledJobState(name="recent", last_status="success")
+    recent.last_started_at = now - timedelta(seconds=1)
+    overdue = ScheduledJobState(name="overdue", last_status="success")
+    overdue.last_started_at = now - timedelta(hours=1)
+    await recent.save()
+    await overdue.save()
+
+    recorder = Recorder()
+    workers = build_workers([
+        recorder.job("recent", timedelta(seconds=2)),
+        recorder.job("overdue", timedelta(hours=1)),
+        recorder.job("fresh", timedelta(hours=1)),
+        recorder.job("broken", timedelta(seconds=0.3), fail=True),
+    ])
+    started = time.monotonic()
+    for worker in workers:
+        await worker.start()
+    try:
+        await wait_for_leader(workers, LEASE_SECONDS)
+        await asyncio.sleep(0.5)
+        names = [run[0] for run in recorder.runs]
+        assert "overdue" in names and "recent" not in names, names
+        await asyncio.sleep(1.3)
+        names = [run[0] for run in recorder.runs]
+        assert "fresh" not in names and names.count("broken") >= 2, names
+        recent_runs = [run[2] - started for run in recorder.runs if run[0] == "recent"]
+        assert len(recent_runs) == 1 and 0.7 < recent_runs[0] < 1.5, recent_runs
+    finally:
+        for worker in workers:
+            await worker.stop()
+
+    states = {state.name: state for state in await ScheduledJobState.all()}
+    assert states["overdue"].last_status == "success"
+    assert storage_datetime(states["overdue"].last_started_at) > now
+    assert states["broken"].last_status == "failed"
+    assert states["broken"].last_error == "模拟任务失败"
+    assert states["broken"].last_duration is not None
+    assert states["broken"].holder in {worker.holder for worker in workers}
+    assert "fresh" not in states
+    logger.info("√ 接管后按上次运行时间继续调度，失败原因已记录")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_test_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            await check_single_leader_and_failover()
+            await check_persisted_state()
+        finally:
+            await Tortoise.close_connections()
+
+def test_scheduler_leader():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,137 @@
+"""
+测试工单全文检索：中文切词和检索表达式、按相关度排序，以及与其他筛选条件组合时不截断结果
+（列表分页、总数、导出和增量同步）
+
+可直接运行: python -m app.tasks.test_search
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+import httpx
+from tortoise import Tortoise
+from app.main import app
+from app.core.security import create_access_token
+from app.models.models import Users, WorkOrders, build_model
+from app.services.search import build_match_query, rebuild_search_index, segment
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+LIST_URL = "/api/v1/work-orders"
+PROCESSING = 700  # 处理中且匹配检索词，超过一次检索曾经的上限 500
+NEW = 500  # 新建且匹配检索词
+OTHER = 50  # 不匹配检索词
+
+async def init_db(db_path: str) -> Users:
+    await init_test_db(db_path)
+    admin = await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+    earlier = datetime.now() - timedelta(hours=1)
+    orders = []
+    for i in range(PROCESSING + NEW + OTHER):
+        status = 1 if i < PROCESSING else 0
+        orders.append(build_model(
+            WorkOrders,
+            order_no=f"FTS-{i:05d}", reporter_name=f"张三{i}", contact_phone="13800000000",
+            location="三楼", problem_desc=f"打印机卡纸 {i}" if i < PROCESSING + NEW else f"网络断开 {i}",
+            status=status, assigned_to_id=admin.id if status else None,
+            created_at=earlier + timedelta(seconds=i), modified_at=earlier,
+            assigned_time=earlier if status else None
+        ))
+    await WorkOrders.bulk_create(orders)
+    await rebuild_search_index(Tortoise.get_connection("default"))
+    return admin
+
+def check_segment():
+    """汉字切成重叠的二字词并保留末字，英文数字按词保留"""
+    assert segment("打印机卡纸") == "打印 印机 机卡 卡纸 纸"
+    assert segment("HP打印机 A4纸") == "HP 打印 印机 机 A4 纸"
+    assert segment(None) == "" and segment("，。") == ""
+    assert build_match_query("打印机") == '"打印" "印机"'
+    assert build_match_query("纸 hp") == '"纸"* "hp"*'
+    assert build_match_query("？！") is None
+    logger.info("√ 切词与检索表达式")
+
+async def check_ranking(client: httpx.AsyncClient):
+    """匹配得更集中的工单排在前面"""
+    strong = await WorkOrders.create(
+        order_no="RANK-1", reporter_name="李四", contact_phone="13900000000",
+        location="硒鼓仓库", problem_desc="硒鼓漏粉", processing_desc="更换硒鼓", status=0
+    )
+    weak = await WorkOrders.create(
+        order_no="RANK-2", reporter_name="李四", contact_phone="13900000000",
+        location="五楼会议室", problem_desc="投影仪无信号，顺便检查打印机的硒鼓余量和网络连接情况", status=0
+    )
+    page = (await client.get(LIST_URL, params={"q": "硒鼓", "with_total": True})).json()
+    assert [item["id"] for item in page["items"]] == [strong.id, weak.id], page
+    assert page["total"] == 2
+    logger.info("√ 检索结果按相关度排序")
+
+async def read_all(client: httpx.AsyncClient, params: dict) -> list:
+    """按检索游标读取全部页"""
+    items, params = [], {**params, "limit": 100, "with_total": True}
+    while True:
+        page = (await client.get(LIST_URL, params=params)).json()
+        items.extend(page["items"])
+        if not page["next_cursor"]:
+            return items, page["total"]
+        params["cursor"] = page["next_cursor"]
+
+async def check_filtered(client: httpx.AsyncClient, admin: Users):
+    """筛选后的匹配数超过 500 时，分页、总数、导出和增量同步都返回全部结果"""
+    items, total = await read_all(client, {"q": "卡纸", "status": 1})
+    assert total == len(items) == PROCESSING, (total, len(items))
+    assert len({item["id"] for item in items}) == PROCESSING
+    assert all(item["status"] == 1 for item in items)
+
+    items, total = await read_all(client, {"q": "卡纸", "assigned_to": admin.id, "status_lt": 3})
+    assert total == len(items) == PROCESSING, (total, len(items))
+
+    page = (await client.get(LIST_URL, params={"q": "卡纸", "with_total": True})).json()
+    assert page["total"] == PROCESSING + NEW, page["total"]
+    logger.info(f"√ 带筛选条件的检索返回全部 {PROCESSING} 个匹配的工单")
+
+    export = await client.get(f"{LIST_URL}/export", params={"q": "卡纸"})
+    assert export.status_code == 200
+    assert export.text.count("FTS-") == PROCESSING + NEW, export.text.count("FTS-")
+    export = await client.get(f"{LIST_URL}/export", params={"q": "卡纸", "status": 0})
+    assert export.text.count("FTS-") == NEW
+    logger.info("√ 导出包含全部匹配的工单")
+
+    since = (datetime.now() - timedelta(seconds=1)).isoformat(" ")
+    changed = await WorkOrders.filter(order_no__in=["FTS-00000", f"FTS-{PROCESSING + NEW:05d}"])
+    for order in changed:
+        order.processing_desc = "已处理"
+        await order.save()
+    delta = (await client.get(LIST_URL, params={"q": "卡纸", "modified_since": since})).json()
+    assert [item["order_no"] for item in delta["items"]] == ["FTS-00000"], delta
+    assert len(delta["removed"]) == 1, delta
+    logger.info("√ 增量同步只在变化的工单中检索")
+
+async def run_test():
+    """运行测试"""
+    check_segment()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        admin = await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            token = create_access_token(data={"sub": "admin"})
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://test",
+                headers={"Authorization": f"Bearer {token}"}
+            ) as client:
+                await check_ranking(client)
+                await check_filtered(client, admin)
+        finally:
+            await Tortoise.close_connections()
+
+def test_search():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -1,23 +1,23 @@
 """
 测试解决方案类型功能
+
+在临时数据库中生成少量模拟数据后测试，不影响 data 目录下的数据库
+可直接运行: python -m app.tasks.test_solution_types
+也可由 pytest 收集执行
 """
 import asyncio
 import logging
+import os
+import tempfile
 from tortoise import Tortoise
 from app.models.models import SolutionType, WorkOrders
+from app.tasks.generate_dataset import generate_dataset, init_db
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def init_db():
-    # 初始化数据库连接
-    await Tortoise.init(
-        db_url="sqlite://data/itkefu.db",
-        modules={"models": ["app.models.models"]}
-    )
-
-async def test_solution_types():
+async def check_solution_types():
     """测试解决方案类型功能"""
     try:
         # 1. 创建一些测试解决方案类型
@@ -49,10 +49,8 @@ async def test_solution_types():
                     found = True
                     break
             
-            if found:
-                logger.info(f"√ 验证通过: 找到解决方案类型 '{created_type.name}'")
-            else:
-                logger.error(f"× 验证失败: 未找到解决方案类型 '{created_type.name}'")
+            assert found, f"× 验证失败: 未找到解决方案类型 '{created_type.name}'"
+            logger.info(f"√ 验证通过: 找到解决方案类型 '{created_type.name}'")
         
         # 3. 获取一个工单并设置解决方案类型
         work_order = await WorkOrders.first()
@@ -67,17 +65,15 @@ async def test_solution_types():
             
             # 重新获取并验证
             updated_order = await WorkOrders.get(id=work_order.id)
-            if updated_order.solution_type == test_types[0]:
-                logger.info(f"√ 验证通过: 工单解决方案类型已更新为 '{test_types[0]}'")
-            else:
-                logger.error(f"× 验证失败: 工单解决方案类型更新失败")
+            assert updated_order.solution_type == test_types[0], "× 验证失败: 工单解决方案类型更新失败"
+            logger.info(f"√ 验证通过: 工单解决方案类型已更新为 '{test_types[0]}'")
             
             # 恢复原状态
             work_order.solution_type = original_type
             await work_order.save(update_fields=["solution_type"])
             logger.info(f"恢复工单原解决方案类型: {original_type}")
         else:
-            logger.warning("没有找到工单进行测试")
+            raise AssertionError("没有找到工单进行测试")
         
         logger.info("测试完成")
     except Exception as e:
@@ -87,10 +83,17 @@ async def test_solution_types():
 async def run_test():
     """运行测试"""
     logger.info("开始测试...")
-    await init_db()
-    await test_solution_types()
-    await Tortoise.close_connections()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"), read_pool=False)
+        try:
+            await generate_dataset(orders=100, users=2, days=7)
+            await check_solution_types()
+        finally:
+            await Tortoise.close_connections()
     logger.info("测试结束")
 
+def test_solution_types():
+    asyncio.run(run_test())
+
 if __name__ == "__main__":
     asyncio.run(run_test()) 
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+测试已认证用户的缓存：命中时不查询数据库、每次返回新的 Users 对象，
+其他 worker 禁用用户或修改角色后在下次检查变更计数时失效
+
+可直接运行: python -m app.tasks.test_user_cache
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+from fastapi import HTTPException
+from tortoise import Tortoise
+from app.api.deps import get_current_active_user, get_current_admin_user, get_user_by_username, user_cache, users_marker
+from app.core.config import settings
+from app.models.models import Users
+from app.tasks.testing import capture_sql, init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def update_from_other_worker(db_path: str, sql: str):
+    """用独立的数据库连接修改用户，模拟其他 worker 的写入（不会调用本进程的 user_cache.invalidate）"""
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute(sql)
+        connection.commit()
+    finally:
+        connection.close()
+
+async def check_instances():
+    """命中缓存时返回新的对象，修改一个请求中的对象不影响其他请求"""
+    first = await get_user_by_username("admin")
+    hits = user_cache.stats()["hits"]
+    second = await get_user_by_username("admin")
+    assert user_cache.stats()["hits"] == hits + 1
+    assert second is not first and (second.id, second.username, second.created_at) == (first.id, first.username, first.created_at)
+    second.full_name = "临时修改"
+    third = await get_user_by_username("admin")
+    assert third.full_name == "管理员" and third._saved_in_db
+    logger.info("√ 缓存命中时每个请求得到独立的用户对象")
+
+async def check_hit_queries():
+    """检查间隔内命中缓存的请求不执行任何查询"""
+    await get_user_by_username("admin")
+    with capture_sql() as statements:
+        for _ in range(3):
+            await get_current_active_user(await get_user_by_username("admin"))
+    assert statements == [], statements
+    logger.info("√ 命中缓存时不查询数据库")
+
+async def check_other_worker(db_path: str):
+    """其他 worker 降级或禁用用户后，本进程在下次检查变更计数后即可看到"""
+    admin = await get_current_admin_user(await get_current_active_user(await get_user_by_username("admin")))
+    update_from_other_worker(db_path, f'UPDATE "users" SET "is_admin" = 0 WHERE "id" = {admin.id}')
+    await asyncio.sleep(users_marker.interval)
+    try:
+        await get_current_admin_user(await get_user_by_username("admin"))
+        raise AssertionError("降级后仍有管理员权限")
+    except HTTPException as e:
+        assert e.status_code == 403
+
+    user = await get_current_active_user(await get_user_by_username("admin"))
+    update_from_other_worker(db_path, f'UPDATE "users" SET "is_active" = 0 WHERE "id" = {user.id}')
+    await asyncio.sleep(users_marker.interval)
+    try:
+        await get_current_active_user(await get_user_by_username("admin"))
+        raise AssertionError("禁用后仍可访问")
+    except HTTPException as e:
+        assert e.status_code == 400
+    logger.info("√ 其他 worker 修改角色或禁用用户后，下次检查变更计数时缓存失效")
+
+async def run_test():
+    """运行测试"""
+    user_cache.clear()
+    users_marker.clear()
+    users_marker.interval = 0.2
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "db.sqlite3")
+        await init_test_db(db_path)
+        try:
+            await Users.create(username="admin", password_hash="x", full_name="管理员", is_admin=True)
+            await check_instances()
+            await check_hit_queries()
+            await check_other_worker(db_path)
+        finally:
+            user_cache.clear()
+            users_marker.clear()
+            users_marker.interval = settings.USER_CACHE_CHECK_INTERVAL
+            await Tortoise.close_connections()
+
+def test_user_cache():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,102 @@
+"""
+测试工单日志：各类操作写入日志、时间线分页读取以及归档工单的日志压缩
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from tortoise import Tortoise
+from app.api.work_orders import (
+    create_work_order,
+    assign_work_order,
+    update_work_order,
+    get_work_order_logs,
+    API_TOKEN
+)
+from app.models.models import Users, WorkOrders, WorkOrdersArchive, WorkOrderLogs, ProblemType, SolutionType
+from app.schemas.work_order import WorkOrderCreate, WorkOrderUpdate
+from app.tasks.archive import archive_completed_orders, compact_archived_logs
+from app.tasks.testing import init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+async def init_db(db_path: str):
+    await init_test_db(db_path)
+    await ProblemType.create(name="硬件故障")
+    await SolutionType.create(name="更换")
+
+async def read_timeline(order_id: int, user: Users, limit: int) -> list:
+    """按页读取完整的时间线"""
+    logs, cursor = [], None
+    while True:
+        page = await get_work_order_logs(order_id, limit=limit, cursor=cursor, current_user=user)
+        logs.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return logs
+
+async def check_lifecycle_logs(user: Users) -> int:
+    """创建、签收、编辑、完成、归档各写入一条日志，按时间顺序分页读取"""
+    order = await create_work_order(
+        WorkOrderCreate(reporter_name="张三", contact_phone="13800000000",
+                        location="三楼机房", problem_desc="打印机无法打印"),
+        token=f"Bearer {API_TOKEN}"
+    )
+    await assign_work_order(order.id, current_user=user)
+    await update_work_order(order.id, WorkOrderUpdate(processing_desc="已清理卡纸"), current_user=user)
+    await update_work_order(order.id, WorkOrderUpdate(processing_desc="更换硒鼓"), current_user=user)
+    # 没有实际变化的保存不写日志
+    await update_work_order(order.id, WorkOrderUpdate(processing_desc="更换硒鼓"), current_user=user)
+    await update_work_order(order.id, WorkOrderUpdate(
+        status=2, problem_type="硬件故障", solution_type="更换"
+    ), current_user=user)
+
+    await WorkOrders.filter(id=order.id).update(modified_at=datetime.now() - timedelta(days=30))
+    await archive_completed_orders()
+
+    logs = await read_timeline(order.id, user, limit=2)
+    actions = [log.action for log in logs]
+    assert actions == ["created", "assigned", "updated", "updated", "status", "archived"], actions
+    assert logs[0].operator_id is None and logs[1].operator_id == user.id
+    assert logs[2].remark == "处理说明"
+    assert (logs[4].status_from, logs[4].status_to) == (1, 2)
+    assert logs[4].remark == "问题类型、解决方案类型"
+    logger.info("√ 工单各类操作均写入日志，时间线分页读取顺序正确")
+    return order.id
+
+async def check_compaction(order_id: int, user: Users):
+    """归档超过保留期的工单，编辑日志合并为一条，节点日志保留"""
+    result = await compact_archived_logs(days=1)
+    assert result["orders"] == 0, "未超过保留期的工单不应被压缩"
+
+    await WorkOrdersArchive.filter(id=order_id).update(archived_at=datetime.now() - timedelta(days=2))
+    result = await compact_archived_logs(days=1)
+    assert result == {**result, "orders": 1, "logs": 2}, result
+
+    actions = [log.action for log in await read_timeline(order_id, user, limit=50)]
+    assert actions == ["created", "assigned", "compacted", "status", "archived"], actions
+
+    result = await compact_archived_logs(days=1)
+    assert result["orders"] == 0, "重复压缩"
+    logger.info("√ 归档工单的编辑日志已合并")
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            user = await Users.create(username="u1", password_hash="x", full_name="用户1")
+            order_id = await check_lifecycle_logs(user)
+            await check_compaction(order_id, user)
+            assert await WorkOrderLogs.filter(work_order_id=order_id).count() == 5
+        finally:
+            await Tortoise.close_connections()
+
+def test_work_order_logs():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
@@ -0,0 +1,72 @@
+"""
+测试 WorkOrders.save()：从加载时的快照判断变化，只更新变化的列，不再额外读取工单
+
+可直接运行: python -m app.tasks.test_work_order_save
+也可由 pytest 收集执行
+"""
+import asyncio
+import logging
+import os
+import re
+import tempfile
+from tortoise import Tortoise
+from app.models.models import Users, WorkOrders
+from app.tasks.testing import capture_sql, init_test_db
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def work_order_updates(statements: list) -> list:
+    """工单表的 UPDATE 语句中 SET 的列，每条语句一个集合"""
+    return [
+        set(re.findall(r'"(\w+)"=\?', match.group(1)))
+        for match in (re.match(r'UPDATE "work_orders" SET (.+) WHERE ', sql) for sql in statements)
+        if match
+    ]
+
+def work_order_reads(statements: list) -> list:
+    return [sql for sql in statements if sql.startswith("SELECT") and 'FROM "work_orders"' in sql]
+
+async def check_save(user: Users):
+    order = await WorkOrders.create(
+        order_no="SAVE-00001", reporter_name="张三", contact_phone="13800000000",
+        location="三楼机房", problem_desc="打印机无法打印", status=0
+    )
+    order = await WorkOrders.get(id=order.id)
+    cases = [
+        ("编辑", {"processing_desc": "已清理卡纸"}, {"processing_desc", "modified_at"}),
+        # 签收时由 save() 补充签收时间
+        ("签收", {"status": 1, "assigned_to_id": user.id}, {"status", "assigned_to_id", "assigned_time", "modified_at"}),
+        ("完成", {"status": 2, "solution_type": "更换"}, {"status", "solution_type", "completed_at", "modified_at"}),
+        ("无变化", {}, {"modified_at"}),
+    ]
+    for name, changes, expected in cases:
+        for field, value in changes.items():
+            setattr(order, field, value)
+        with capture_sql() as statements:
+            await order.save(operator=user)
+        updates = work_order_updates(statements)
+        assert updates == [expected], (name, statements)
+        assert not work_order_reads(statements), (name, statements)
+        logger.info(f"√ {name}: 一条 UPDATE，只更新 {', '.join(sorted(expected))}")
+
+    saved = await WorkOrders.get(id=order.id)
+    assert (saved.status, saved.assigned_to_id, saved.processing_desc) == (2, user.id, "已清理卡纸")
+    assert saved.assigned_time and saved.completed_at
+
+async def run_test():
+    """运行测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_test_db(os.path.join(tmp_dir, "db.sqlite3"))
+        try:
+            user = await Users.create(username="u1", password_hash="x", full_name="用户1")
+            await check_save(user)
+        finally:
+            await Tortoise.close_connections()
+
+def test_work_order_save():
+    asyncio.run(run_test())
+
+if __name__ == "__main__":
+    asyncio.run(run_test())
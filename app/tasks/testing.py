@@ -0,0 +1,56 @@
+"""
+测试脚本共用的数据库初始化和 SQL 记录
+
+数据库初始化与服务启动时一致：按模型建表，创建全文索引和工单变更计数
+"""
+from contextlib import contextmanager
+from tortoise import Tortoise
+from app.api.deps import user_cache, users_marker
+from app.services.search import ensure_search_index
+from app.services.sync import ensure_change_tracking
+
+async def init_test_db(db_path: str = ":memory:", **credentials) -> None:
+    """
+    初始化测试数据库（通常为临时目录中的文件），调用方负责关闭连接
+
+    credentials 为额外的 SQLite 连接参数，如 busy_timeout、journal_mode
+    """
+    if credentials:
+        connection = {
+            "engine": "tortoise.backends.sqlite",
+            "credentials": {"file_path": db_path, **credentials}
+        }
+    else:
+        connection = f"sqlite://{db_path}"
+    await Tortoise.init(config={
+        "connections": {"default": connection},
+        "apps": {"models": {"models": ["app.models.models"], "default_connection": "default"}},
+    })
+    await Tortoise.generate_schemas()
+    await ensure_search_index()
+    await ensure_change_tracking()
+    # 同一进程中先后运行的测试使用不同的数据库，不沿用之前缓存的用户和变更计数
+    user_cache.clear()
+    users_marker.clear()
+
+EXECUTE_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+@contextmanager
+def capture_sql():
+    """记录默认连接上执行的全部 SQL"""
+    db = Tortoise.get_connection("default")
+    statements = []
+
+    def wrap(method):
+        async def execute(query, *args, **kwargs):
+            statements.append(" ".join(query.split()))
+            return await method(query, *args, **kwargs)
+        return execute
+
+    for name in EXECUTE_METHODS:
+        setattr(db, name, wrap(getattr(db, name)))
+    try:
+        yield statements
+    finally:
+        for name in EXECUTE_METHODS:
+            delattr(db, name)
@@ -0,0 +1,18 @@
+/**
+ * 订阅工单变更事件（Server-Sent Events）
+ * 断线后浏览器会自动重连，并携带 Last-Event-ID 补齐错过的事件
+ * @param {string} token JWT，EventSource 无法设置请求头，通过查询参数传递
+ * @param {Function} onEvent 事件回调，参数为 { type, order?, id?, ids? }
+ * @returns {Function} 取消订阅
+ */
+export const subscribeWorkOrderEvents = (token, onEvent) => {
+  const source = new EventSource(`/api/v1/work-orders/events?token=${encodeURIComponent(token)}`)
+  source.onmessage = (event) => {
+    try {
+      onEvent(JSON.parse(event.data))
+    } catch (error) {
+      console.error('处理工单事件失败:', error)
+    }
+  }
+  return () => source.close()
+}